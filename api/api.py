@@ -9,6 +9,7 @@ from datetime import datetime
 from pydantic import BaseModel, Field
 import google.generativeai as genai
 import asyncio
+from contextlib import asynccontextmanager
 
 # Configure logging
 from api.logging_config import setup_logging
@@ -17,10 +18,28 @@ setup_logging()
 logger = logging.getLogger(__name__)
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    from api.stream_registry import get_stream_registry
+
+    # Streams otherwise expire only when another one is created or resumed
+    sweep_seconds = configs.get("streaming", {}).get("resume_sweep_seconds", 60)
+    eviction = asyncio.create_task(get_stream_registry().evict_periodically(sweep_seconds))
+    try:
+        yield
+    finally:
+        eviction.cancel()
+    # Close the keep-alive connections of the shared provider clients
+    from api.generation import close_provider_clients
+
+    await close_provider_clients()
+
+
 # Initialize FastAPI app
 app = FastAPI(
     title="Streaming API",
-    description="API for streaming chat completions"
+    description="API for streaming chat completions",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -117,6 +136,14 @@ class WikiExportRequest(BaseModel):
     pages: List[WikiPage] = Field(..., description="List of wiki pages to export")
     format: Literal["markdown", "json"] = Field(..., description="Export format (markdown or json)")
 
+class RepoRefreshRequest(BaseModel):
+    """
+    Model for requesting a repository index refresh.
+    """
+    repo_url: str = Field(..., description="URL or local path of the repository")
+    type: str = Field("github", description="Type of repository (e.g., 'github', 'gitlab', 'bitbucket')")
+    token: Optional[str] = Field(None, description="Personal access token for private repositories")
+
 # --- Model Configuration Models ---
 class Model(BaseModel):
     """
@@ -537,6 +564,29 @@ async def delete_wiki_cache(
         logger.warning(f"Wiki cache not found, cannot delete: {cache_path}")
         raise HTTPException(status_code=404, detail="Wiki cache not found")
 
+@app.post("/api/refresh_repo")
+async def refresh_repo_index(request: RepoRefreshRequest):
+    """
+    Updates a repository to its latest commit and re-embeds only the chunks that changed.
+    """
+    from api.chunk_store import load_index_meta
+    from api.data_pipeline import DatabaseManager
+    from api.storage import get_storage
+
+    db_manager = DatabaseManager(storage=get_storage())
+    try:
+        documents = await asyncio.to_thread(db_manager.refresh_database, request.repo_url, request.type, request.token)
+    except ValueError as e:
+        logger.error(f"Error refreshing {request.repo_url}: {e}")
+        raise HTTPException(status_code=400, detail=str(e))
+    meta = load_index_meta(db_manager.repo_paths["save_db_file"])
+    return {
+        "repo_url": request.repo_url,
+        "revision": meta.get("revision"),
+        "snapshots": [snapshot["revision"] for snapshot in meta.get("snapshots", [])],
+        "documents": len(documents),
+    }
+
 @app.get("/health")
 async def health_check():
     """Health check endpoint for Docker and monitoring"""
@@ -546,6 +596,13 @@ async def health_check():
         "service": "deepwiki-api"
     }
 
+@app.get("/metrics")
+async def get_metrics():
+    """Stream and disconnect counters in the Prometheus text format"""
+    from api import metrics
+
+    return Response(content=metrics.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 async def root():
     """Root endpoint to check if the API is running and list available endpoints dynamically."""
@@ -260,6 +260,8 @@ class AzureAIClient(ModelClient):
             )
 
     def init_async_client(self):
+        from api.http_pool import async_httpx_client
+
         api_key = self._api_key or os.getenv("AZURE_OPENAI_API_KEY")
         azure_endpoint = self._azure_endpoint or os.getenv("AZURE_OPENAI_ENDPOINT")
         api_version = self._apiversion or os.getenv("AZURE_OPENAI_VERSION")
@@ -271,7 +273,8 @@ class AzureAIClient(ModelClient):
 
         if api_key:
             return AsyncAzureOpenAI(
-                api_key=api_key, azure_endpoint=azure_endpoint, api_version=api_version
+                api_key=api_key, azure_endpoint=azure_endpoint, api_version=api_version,
+                http_client=async_httpx_client(),
             )
         elif self._credential:
             # credential = DefaultAzureCredential()
@@ -282,6 +285,7 @@ class AzureAIClient(ModelClient):
                 azure_ad_token_provider=token_provider,
                 azure_endpoint=azure_endpoint,
                 api_version=api_version,
+                http_client=async_httpx_client(),
             )
         else:
             raise ValueError(
@@ -1,5 +1,6 @@
 """AWS Bedrock ModelClient integration."""
 
+import asyncio
 import os
 import json
 import logging
@@ -218,6 +219,48 @@ class BedrockClient(ModelClient):
                         return response[key]
             return str(response)
 
+    def _build_request(self, api_kwargs: Dict) -> tuple:
+        """Build the model ID and JSON request body for an LLM call.
+
+        Args:
+            api_kwargs: API kwargs from convert_inputs_to_api_kwargs
+
+        Returns:
+            A (model_id, body) tuple
+        """
+        model_id = api_kwargs.get("model", "anthropic.claude-3-sonnet-20240229-v1:0")
+        provider = self._get_model_provider(model_id)
+        
+        # Get the prompt from api_kwargs
+        prompt = api_kwargs.get("input", "")
+        messages = api_kwargs.get("messages")
+        
+        # Format the prompt according to the provider
+        request_body = self._format_prompt_for_provider(provider, prompt, messages)
+        
+        # Add model parameters if provided
+        if "temperature" in api_kwargs:
+            if provider == "anthropic":
+                request_body["temperature"] = api_kwargs["temperature"]
+            elif provider == "amazon":
+                request_body["textGenerationConfig"]["temperature"] = api_kwargs["temperature"]
+            elif provider == "cohere":
+                request_body["temperature"] = api_kwargs["temperature"]
+            elif provider == "ai21":
+                request_body["temperature"] = api_kwargs["temperature"]
+        
+        if "top_p" in api_kwargs:
+            if provider == "anthropic":
+                request_body["top_p"] = api_kwargs["top_p"]
+            elif provider == "amazon":
+                request_body["textGenerationConfig"]["topP"] = api_kwargs["top_p"]
+            elif provider == "cohere":
+                request_body["p"] = api_kwargs["top_p"]
+            elif provider == "ai21":
+                request_body["topP"] = api_kwargs["top_p"]
+
+        return model_id, json.dumps(request_body)
+
     @backoff.on_exception(
         backoff.expo,
         (botocore.exceptions.ClientError, botocore.exceptions.BotoCoreError),
@@ -234,40 +277,9 @@ class BedrockClient(ModelClient):
             return error_msg
         
         if model_type == ModelType.LLM:
-            model_id = api_kwargs.get("model", "anthropic.claude-3-sonnet-20240229-v1:0")
+            model_id, body = self._build_request(api_kwargs)
             provider = self._get_model_provider(model_id)
-            
-            # Get the prompt from api_kwargs
-            prompt = api_kwargs.get("input", "")
-            messages = api_kwargs.get("messages")
-            
-            # Format the prompt according to the provider
-            request_body = self._format_prompt_for_provider(provider, prompt, messages)
-            
-            # Add model parameters if provided
-            if "temperature" in api_kwargs:
-                if provider == "anthropic":
-                    request_body["temperature"] = api_kwargs["temperature"]
-                elif provider == "amazon":
-                    request_body["textGenerationConfig"]["temperature"] = api_kwargs["temperature"]
-                elif provider == "cohere":
-                    request_body["temperature"] = api_kwargs["temperature"]
-                elif provider == "ai21":
-                    request_body["temperature"] = api_kwargs["temperature"]
-            
-            if "top_p" in api_kwargs:
-                if provider == "anthropic":
-                    request_body["top_p"] = api_kwargs["top_p"]
-                elif provider == "amazon":
-                    request_body["textGenerationConfig"]["topP"] = api_kwargs["top_p"]
-                elif provider == "cohere":
-                    request_body["p"] = api_kwargs["top_p"]
-                elif provider == "ai21":
-                    request_body["topP"] = api_kwargs["top_p"]
-            
-            # Convert request body to JSON
-            body = json.dumps(request_body)
-            
+
             try:
                 # Make the API call
                 response = self.sync_client.invoke_model(
@@ -290,10 +302,46 @@ class BedrockClient(ModelClient):
             raise ValueError(f"Model type {model_type} is not supported by AWS Bedrock client")
 
     async def acall(self, api_kwargs: Dict = None, model_type: ModelType = None) -> Any:
-        """Make an asynchronous call to the AWS Bedrock API."""
-        # For now, just call the sync method
-        # In a real implementation, you would use an async library or run the sync method in a thread pool
-        return self.call(api_kwargs, model_type)
+        """Make an asynchronous call to the AWS Bedrock API.
+
+        With "stream" set in api_kwargs, returns an async generator of the decoded
+        response stream events instead of the generated text.
+        """
+        api_kwargs = api_kwargs or {}
+        if model_type == ModelType.LLM and api_kwargs.get("stream"):
+            return self._stream_events(api_kwargs)
+        # boto3 is blocking, keep it off the event loop
+        return await asyncio.to_thread(self.call, api_kwargs, model_type)
+
+    async def _stream_events(self, api_kwargs: Dict) -> AsyncGenerator[Dict[str, Any], None]:
+        """Stream a response with invoke_model_with_response_stream.
+
+        Args:
+            api_kwargs: API kwargs from convert_inputs_to_api_kwargs
+
+        Yields:
+            The JSON payload of each response chunk, in the model provider's format
+        """
+        if not self.sync_client:
+            raise ValueError("AWS Bedrock client not initialized. Check your AWS credentials and region.")
+
+        model_id, body = self._build_request(api_kwargs)
+        response = await asyncio.to_thread(
+            self.sync_client.invoke_model_with_response_stream, modelId=model_id, body=body
+        )
+        events = iter(response["body"])
+        try:
+            while True:
+                # The event stream reads from a blocking socket
+                event = await asyncio.to_thread(next, events, None)
+                if event is None:
+                    return
+                if "chunk" not in event:
+                    raise ValueError(f"AWS Bedrock stream error: {event}")
+                yield json.loads(event["chunk"]["bytes"])
+        finally:
+            # Release the HTTP connection now rather than when the stream is garbage collected
+            await asyncio.to_thread(response["body"].close)
 
     def convert_inputs_to_api_kwargs(
         self, input: Any = None, model_kwargs: Dict = None, model_type: ModelType = None
@@ -311,6 +359,8 @@ class BedrockClient(ModelClient):
                 api_kwargs["temperature"] = model_kwargs["temperature"]
             if "top_p" in model_kwargs:
                 api_kwargs["top_p"] = model_kwargs["top_p"]
+            if model_kwargs.get("stream"):
+                api_kwargs["stream"] = True
             
             return api_kwargs
         else:
@@ -0,0 +1,361 @@
+"""Content-addressed chunk vectors shared by commit-keyed index snapshots."""
+
+import glob
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import numpy as np
+from adalflow.core.types import Document
+
+from api.config import configs, get_embedder_type
+
+logger = logging.getLogger(__name__)
+
+CHUNK_STORE_FILE = "chunks.sqlite"
+# Snapshot name of repositories that are not git checkouts
+WORKTREE_REVISION = "worktree"
+# Keys looked up per SQL statement, below SQLite's variable limit
+LOOKUP_BATCH = 500
+# Chunks embedded between two writes to the store
+STORE_BATCH = 512
+# Age below which unreferenced chunks are kept, as a build may not have snapshotted them yet
+GC_GRACE_SECONDS = 86400
+# Format of the databases recorded in the index metadata; databases without it may
+# have been built with custom file filters and are not a full repository index
+INDEX_FORMAT = 1
+
+
+def embedder_fingerprint(embedder_type: str = None) -> str:
+    """
+    Identify the embedding model, so vectors of different models never mix.
+
+    Args:
+        embedder_type: Embedder type ('openai', 'google', 'ollama'), defaults to the configured one
+
+    Returns:
+        str: Short hash of the embedder client and model settings
+    """
+    embedder_type = embedder_type or get_embedder_type()
+    config_key = {"ollama": "embedder_ollama", "google": "embedder_google"}.get(embedder_type, "embedder")
+    embedder_config = configs.get(config_key, {})
+    client = embedder_config.get("model_client")
+    payload = json.dumps({
+        "client": getattr(client, "__name__", str(client)),
+        "model_kwargs": embedder_config.get("model_kwargs", {}),
+    }, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:16]
+
+
+def chunk_key(text: str, fingerprint: str) -> str:
+    """Content address of a chunk embedded with a given model."""
+    return hashlib.sha256(f"{fingerprint}\0{text}".encode("utf-8")).hexdigest()
+
+
+class ChunkStore:
+    """
+    SQLite table of chunk texts and vectors keyed by content address.
+
+    Identical chunks of different commits, or of different repositories, are
+    stored and embedded once. Every chunk records when a build last stored or
+    reused it, so garbage collection can spare chunks of builds in progress.
+    """
+
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks (key TEXT PRIMARY KEY, text TEXT NOT NULL, vector BLOB NOT NULL, "
+            "used_at REAL NOT NULL DEFAULT 0)"
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(chunks)")]
+        if "used_at" not in columns:
+            # Stores created before the column count as long unused
+            self._conn.execute("ALTER TABLE chunks ADD COLUMN used_at REAL NOT NULL DEFAULT 0")
+        self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def get(self, keys: Sequence[str]) -> Dict[str, Tuple[str, np.ndarray]]:
+        """
+        Look up stored chunks.
+
+        Args:
+            keys: Content addresses
+
+        Returns:
+            Dict mapping each found key to (text, float32 vector)
+        """
+        found = {}
+        keys = list(dict.fromkeys(keys))
+        with self._lock:
+            for start in range(0, len(keys), LOOKUP_BATCH):
+                batch = keys[start:start + LOOKUP_BATCH]
+                rows = self._conn.execute(
+                    f"SELECT key, text, vector FROM chunks WHERE key IN ({','.join('?' * len(batch))})", batch
+                )
+                for key, text, vector in rows:
+                    found[key] = (text, np.frombuffer(vector, dtype=np.float32))
+        return found
+
+    def put(self, items: Iterable[Tuple[str, str, Any]]) -> None:
+        """Store (key, text, vector) triples, keeping chunks that already exist but marking them used."""
+        now = time.time()
+        rows = [(key, text, np.asarray(vector, dtype=np.float32).tobytes(), now) for key, text, vector in items]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT INTO chunks (key, text, vector, used_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET used_at = excluded.used_at", rows
+            )
+            self._conn.commit()
+
+    def touch(self, keys: Sequence[str]) -> None:
+        """Mark stored chunks as used now, e.g. when a build reuses them."""
+        keys = list(dict.fromkeys(keys))
+        now = time.time()
+        with self._lock:
+            for start in range(0, len(keys), LOOKUP_BATCH):
+                batch = keys[start:start + LOOKUP_BATCH]
+                self._conn.execute(
+                    f"UPDATE chunks SET used_at = ? WHERE key IN ({','.join('?' * len(batch))})", [now, *batch]
+                )
+            self._conn.commit()
+
+    def delete_except(self, keep: Set[str], unused_since: Optional[float] = None) -> int:
+        """
+        Delete every chunk whose key is not in keep.
+
+        Args:
+            keep: Keys of the chunks to keep
+            unused_since: Only delete chunks last used before this time, None for all
+
+        Returns:
+            int: Number of deleted chunks
+        """
+        with self._lock:
+            rows = self._conn.execute("SELECT key, used_at FROM chunks")
+            stale = [(key,) for key, used_at in rows
+                     if key not in keep and (unused_since is None or used_at < unused_since)]
+            self._conn.executemany("DELETE FROM chunks WHERE key = ?", stale)
+            self._conn.commit()
+        return len(stale)
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+def embed_with_store(chunks: List[Document], store: ChunkStore, fingerprint: str, embedder_transformer,
+                     batch_size: int = STORE_BATCH, stats: Optional[Dict[str, int]] = None) -> List[Document]:
+    """
+    Give chunks their vectors, embedding only those the store does not hold yet.
+
+    New vectors are stored after every batch, so an interrupted build resumes
+    where it stopped. Reused vectors are marked used, so garbage collection
+    does not delete them before the build records its snapshot.
+
+    Args:
+        chunks: Split documents without vectors
+        store: Chunk store to reuse and record vectors in
+        fingerprint: Embedder fingerprint, part of every content address
+        embedder_transformer: Component that embeds a list of documents
+        batch_size: Chunks embedded between two writes to the store
+        stats: Optional dict that receives the "reused", "embedded" and "failed" counts
+
+    Returns:
+        List[Document]: The chunks that have a vector, in their original order
+    """
+    keys = [chunk_key(chunk.text, fingerprint) for chunk in chunks]
+    # Marked before the lookup, so a collection running meanwhile either spares them or they are embedded again
+    store.touch(keys)
+    stored = store.get(keys)
+    missing = [chunk for chunk, key in zip(chunks, keys) if key not in stored]
+
+    embedded: Dict[str, Any] = {}
+    for start in range(0, len(missing), batch_size):
+        batch_embedded = {}
+        for doc in embedder_transformer(missing[start:start + batch_size]):
+            if doc.vector is not None and len(doc.vector) > 0:
+                batch_embedded[chunk_key(doc.text, fingerprint)] = (doc.text, doc.vector)
+        store.put((key, text, vector) for key, (text, vector) in batch_embedded.items())
+        embedded.update({key: vector for key, (_, vector) in batch_embedded.items()})
+
+    result = []
+    for chunk, key in zip(chunks, keys):
+        if key in stored:
+            chunk.vector = stored[key][1].tolist()
+        elif key in embedded:
+            chunk.vector = list(embedded[key])
+        else:
+            continue
+        result.append(chunk)
+
+    logger.info(f"Chunk vectors: {len(chunks) - len(missing)} reused, {len(embedded)} embedded, "
+                f"{len(chunks) - len(result)} failed")
+    if stats is not None:
+        stats.update(reused=len(chunks) - len(missing), embedded=len(embedded), failed=len(chunks) - len(result))
+    return result
+
+
+def index_meta_path(db_file: str) -> str:
+    """Path of the sidecar recording which commit each snapshot of a database is for."""
+    return os.path.splitext(db_file)[0] + ".meta.json"
+
+
+def snapshot_path(db_file: str, revision: str) -> str:
+    """Path of the snapshot of a database at one revision."""
+    return f"{os.path.splitext(db_file)[0]}@{revision[:12]}.snapshot.json"
+
+
+def load_index_meta(db_file: str) -> Dict[str, Any]:
+    """Read the snapshot sidecar of a database, empty if there is none."""
+    path = index_meta_path(db_file)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read index metadata {path}: {e}")
+        return {}
+
+
+def _write_json(path: str, data: Any) -> None:
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def save_snapshot(db_file: str, revision: str, fingerprint: str, documents: Sequence[Document],
+                  max_snapshots: int = 5) -> List[str]:
+    """
+    Record the chunks of a database at one revision and make it the current one.
+
+    A snapshot lists content addresses and metadata only; texts and vectors
+    live in the chunk store, so unchanged chunks cost nothing per snapshot.
+
+    Args:
+        db_file: Database file of the repository
+        revision: Commit the documents were built from
+        fingerprint: Embedder fingerprint of the vectors
+        documents: Embedded chunk documents
+        max_snapshots: Number of most recent snapshots to keep
+
+    Returns:
+        List[str]: Revisions of the snapshots that were dropped
+    """
+    _write_json(snapshot_path(db_file, revision), {
+        "revision": revision,
+        "embedder": fingerprint,
+        "chunks": [
+            {
+                "key": chunk_key(doc.text, fingerprint),
+                "meta_data": doc.meta_data,
+                "order": doc.order,
+                "parent_doc_id": doc.parent_doc_id,
+            }
+            for doc in documents
+        ],
+    })
+
+    meta = load_index_meta(db_file)
+    snapshots = [s for s in meta.get("snapshots", []) if s["revision"] != revision]
+    snapshots.append({"revision": revision, "created": int(time.time()), "chunks": len(documents)})
+    dropped = snapshots[:-max_snapshots] if max_snapshots > 0 else []
+    for snapshot in dropped:
+        try:
+            os.remove(snapshot_path(db_file, snapshot["revision"]))
+        except OSError:
+            pass
+    _write_json(index_meta_path(db_file), {
+        "format": INDEX_FORMAT,
+        "revision": revision,
+        "embedder": fingerprint,
+        "snapshots": snapshots[len(dropped):],
+    })
+    return [snapshot["revision"] for snapshot in dropped]
+
+
+def load_snapshot(db_file: str, revision: str, store: ChunkStore,
+                  fingerprint: Optional[str] = None) -> Optional[List[Document]]:
+    """
+    Rebuild the embedded chunks of a database at a recorded revision.
+
+    Args:
+        db_file: Database file of the repository
+        revision: Commit of the snapshot
+        store: Chunk store holding the texts and vectors
+        fingerprint: Embedder fingerprint the snapshot must have been built with, None for any
+
+    Returns:
+        The chunk documents, or None if the snapshot or some of its chunks are missing
+    """
+    path = snapshot_path(db_file, revision)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            snapshot = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read snapshot {path}: {e}")
+        return None
+    if snapshot.get("revision") != revision or (fingerprint and snapshot.get("embedder") != fingerprint):
+        return None
+    entries = snapshot.get("chunks", [])
+    chunks = store.get([entry["key"] for entry in entries])
+    if len(chunks) < len({entry["key"] for entry in entries}):
+        logger.warning(f"Snapshot {path} references chunks missing from the store")
+        return None
+    documents = []
+    for entry in entries:
+        text, vector = chunks[entry["key"]]
+        doc = Document(text=text, meta_data=entry["meta_data"], order=entry["order"],
+                       parent_doc_id=entry["parent_doc_id"])
+        doc.vector = vector.tolist()
+        documents.append(doc)
+    return documents
+
+
+def collect_garbage(store: ChunkStore, databases_dir: str, grace_seconds: Optional[float] = None) -> int:
+    """
+    Delete chunks no snapshot in a databases directory refers to.
+
+    Chunks stored or reused within the grace period are kept: builds running
+    at the same time, in this process or another one sharing the store, may
+    not have recorded their snapshot yet.
+
+    Args:
+        store: Chunk store shared by the databases
+        databases_dir: Directory holding the databases and their snapshots
+        grace_seconds: Minimum age of deleted chunks, defaults to ``repository.chunk_gc_grace_seconds``
+
+    Returns:
+        int: Number of deleted chunks
+    """
+    if grace_seconds is None:
+        grace_seconds = configs.get("repository", {}).get("chunk_gc_grace_seconds", GC_GRACE_SECONDS)
+    unused_since = time.time() - grace_seconds
+    keep: Set[str] = set()
+    for path in glob.glob(os.path.join(databases_dir, "*.snapshot.json")):
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                keep.update(entry["key"] for entry in json.load(f).get("chunks", []))
+        except (OSError, ValueError) as e:
+            # Keep everything rather than deleting chunks of an unreadable snapshot
+            logger.warning(f"Skipping garbage collection, could not read {path}: {e}")
+            return 0
+    deleted = store.delete_except(keep, unused_since)
+    if deleted:
+        logger.info(f"Deleted {deleted} unreferenced chunks from {store.path}")
+    return deleted
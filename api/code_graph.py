@@ -0,0 +1,259 @@
+"""Import/reference graph of a repository, used to expand retrieved chunks with related files."""
+
+import json
+import logging
+import os
+import posixpath
+import re
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Set
+
+import numpy as np
+from adalflow.core.types import Document
+
+logger = logging.getLogger(__name__)
+
+PY_IMPORT = re.compile(r"^\s*import\s+([\w.]+(?:\s*,\s*[\w.]+)*)", re.MULTILINE)
+PY_FROM_IMPORT = re.compile(r"^\s*from\s+(\.*[\w.]*)\s+import\s+(?:\(([^)]*)\)|([^\n]+))", re.MULTILINE)
+JS_IMPORT = re.compile(r"""(?:import|export)[^'"]*?from\s*['"]([^'"]+)['"]|(?:require|import)\s*\(\s*['"]([^'"]+)['"]\s*\)|^\s*import\s+['"]([^'"]+)['"]""",
+                       re.MULTILINE)
+GO_IMPORT_BLOCK = re.compile(r"^import\s*\(([^)]*)\)", re.MULTILINE)
+GO_IMPORT = re.compile(r"""^import\s+(?:\w+\s+)?"([^"]+)\"""", re.MULTILINE)
+GO_IMPORT_PATH = re.compile(r'"([^"]+)"')
+JAVA_IMPORT = re.compile(r"^\s*import\s+(?:static\s+)?([\w.]+)(?:\.\*)?\s*;", re.MULTILINE)
+C_INCLUDE = re.compile(r'^\s*#\s*include\s*"([^"]+)"', re.MULTILINE)
+
+JS_EXTENSIONS = [".ts", ".tsx", ".js", ".jsx", ".mjs", ".cjs"]
+C_EXTENSIONS = {"c", "cpp", "h", "hpp"}
+
+
+class CodeGraph:
+    """
+    Directed file-level graph of imports and includes.
+
+    Edges point from the importing file to the imported one; ``neighbours``
+    looks both ways so a hit can be expanded with its dependencies and its
+    callers.
+    """
+
+    def __init__(self, edges: Dict[str, Iterable[str]] = None):
+        self.edges: Dict[str, Set[str]] = {path: set(targets) for path, targets in (edges or {}).items()}
+        self.reverse_edges: Dict[str, Set[str]] = {}
+        for source, targets in self.edges.items():
+            for target in targets:
+                self.reverse_edges.setdefault(target, set()).add(source)
+
+    def __len__(self) -> int:
+        return sum(len(targets) for targets in self.edges.values())
+
+    def neighbours(self, path: str) -> List[str]:
+        """Files imported by path, followed by the files importing it."""
+        imported = sorted(self.edges.get(path, ()))
+        importers = sorted(self.reverse_edges.get(path, set()) - set(imported))
+        return imported + importers
+
+    def save(self, path: str) -> None:
+        """Write the graph to a JSON sidecar."""
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"edges": {source: sorted(targets) for source, targets in self.edges.items()}}, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> Optional["CodeGraph"]:
+        """Read a graph sidecar, None if it is missing or unreadable."""
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return cls(json.load(f).get("edges", {}))
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read code graph {path}: {e}")
+            return None
+
+
+def code_graph_path(db_file: str) -> str:
+    """Path of the code graph sidecar stored next to a repository database."""
+    return os.path.splitext(db_file)[0] + ".graph.json"
+
+
+class RepoPaths:
+    """File paths of a repository, indexed by file name for suffix lookups."""
+
+    def __init__(self, paths: Iterable[str]):
+        self.paths: Set[str] = set(paths)
+        self.by_name: Dict[str, List[str]] = {}
+        self.go_dirs: Dict[str, List[str]] = {}
+        for path in sorted(self.paths):
+            self.by_name.setdefault(posixpath.basename(path), []).append(path)
+            if path.endswith(".go") and not path.endswith("_test.go"):
+                self.go_dirs.setdefault(posixpath.dirname(path), []).append(path)
+        self.go_dirs_by_name: Dict[str, List[str]] = {}
+        for directory in self.go_dirs:
+            self.go_dirs_by_name.setdefault(posixpath.basename(directory), []).append(directory)
+
+    def __contains__(self, path: str) -> bool:
+        return path in self.paths
+
+    def ending_with(self, relative: str, limit: int = 1) -> List[str]:
+        """Files whose path is or ends with the given relative path."""
+        if relative in self.paths:
+            return [relative]
+        suffix = "/" + relative
+        return [p for p in self.by_name.get(posixpath.basename(relative), []) if p.endswith(suffix)][:limit]
+
+
+def _resolve_python(module: str, file_path: str, paths: RepoPaths) -> List[str]:
+    """Resolve a (possibly relative) Python module to repository files."""
+    if module.startswith("."):
+        level = len(module) - len(module.lstrip("."))
+        base = posixpath.dirname(file_path)
+        for _ in range(level - 1):
+            base = posixpath.dirname(base)
+        module_path = posixpath.join(base, module.lstrip(".").replace(".", "/")) if module.strip(".") else base
+        candidates = [module_path + ".py", posixpath.join(module_path, "__init__.py")]
+    else:
+        module_path = module.replace(".", "/")
+        # Modules are often imported relative to a source root such as src/
+        return paths.ending_with(module_path + ".py") or paths.ending_with(posixpath.join(module_path, "__init__.py"))
+    return [c for c in candidates if c in paths]
+
+
+def _resolve_js(specifier: str, file_path: str, paths: RepoPaths) -> List[str]:
+    """Resolve a relative JS/TS import specifier to repository files."""
+    if not specifier.startswith("."):
+        return []
+    target = posixpath.normpath(posixpath.join(posixpath.dirname(file_path), specifier))
+    candidates = [target] + [target + ext for ext in JS_EXTENSIONS] + [posixpath.join(target, "index" + ext) for ext in JS_EXTENSIONS]
+    for candidate in candidates:
+        if candidate in paths:
+            return [candidate]
+    return []
+
+
+def extract_imports(file_path: str, text: str, paths: RepoPaths) -> Set[str]:
+    """
+    Repository files imported by one file.
+
+    Args:
+        file_path: Path of the file, relative to the repository root
+        text: Content of the file
+        paths: All file paths of the repository
+
+    Returns:
+        Set of imported file paths, excluding the file itself
+    """
+    ext = posixpath.splitext(file_path)[1][1:]
+    targets: Set[str] = set()
+
+    if ext == "py":
+        for match in PY_IMPORT.finditer(text):
+            for module in match.group(1).split(","):
+                targets.update(_resolve_python(module.strip(), file_path, paths))
+        for match in PY_FROM_IMPORT.finditer(text):
+            module = match.group(1)
+            resolved = _resolve_python(module, file_path, paths)
+            # "from pkg import module" imports sub-modules rather than names
+            if not resolved or resolved[0].endswith("__init__.py"):
+                for name in (match.group(2) or match.group(3)).split(","):
+                    name = name.split()[0] if name.split() else ""
+                    if name.isidentifier():
+                        sub_module = f"{module}.{name}" if not module.endswith(".") else f"{module}{name}"
+                        resolved.extend(_resolve_python(sub_module, file_path, paths))
+            targets.update(resolved)
+    elif ext in ("js", "jsx", "ts", "tsx", "mjs", "cjs"):
+        for match in JS_IMPORT.finditer(text):
+            specifier = next(group for group in match.groups() if group)
+            targets.update(_resolve_js(specifier, file_path, paths))
+    elif ext == "go":
+        import_paths = GO_IMPORT.findall(text)
+        for block in GO_IMPORT_BLOCK.findall(text):
+            import_paths.extend(GO_IMPORT_PATH.findall(block))
+        for import_path in import_paths:
+            # Go imports name a package directory; match it by its trailing path segments
+            for directory in paths.go_dirs_by_name.get(posixpath.basename(import_path), []):
+                if import_path == directory or import_path.endswith("/" + directory):
+                    targets.update(paths.go_dirs[directory])
+    elif ext == "java":
+        for match in JAVA_IMPORT.finditer(text):
+            targets.update(paths.ending_with(match.group(1).replace(".", "/") + ".java"))
+    elif ext in C_EXTENSIONS:
+        for match in C_INCLUDE.finditer(text):
+            local = posixpath.normpath(posixpath.join(posixpath.dirname(file_path), match.group(1)))
+            targets.update([local] if local in paths else paths.ending_with(match.group(1)))
+
+    targets.discard(file_path)
+    return targets
+
+
+def build_code_graph(documents: Sequence[Document]) -> CodeGraph:
+    """
+    Build the import graph from whole-file documents or from their chunks.
+
+    Chunks of the same file are concatenated in order, which is enough for
+    the import statements the graph is built from.
+
+    Args:
+        documents: Documents with a ``file_path`` in their metadata
+
+    Returns:
+        CodeGraph: The repository import graph
+    """
+    texts: Dict[str, List[Document]] = {}
+    for doc in documents:
+        path = (doc.meta_data or {}).get("file_path")
+        if path and (doc.meta_data or {}).get("type") != "directory_summary":
+            texts.setdefault(path.replace("\\", "/"), []).append(doc)
+
+    paths = RepoPaths(texts)
+    edges = {}
+    for path, docs in texts.items():
+        text = "".join(doc.text for doc in sorted(docs, key=lambda doc: doc.order or 0))
+        targets = extract_imports(path, text, paths)
+        if targets:
+            edges[path] = targets
+
+    graph = CodeGraph(edges)
+    logger.info(f"Code graph built with {len(graph)} edges across {len(texts)} files")
+    return graph
+
+
+def expand_with_neighbours(hit_ids: Sequence[int], graph: CodeGraph, file_ids: Dict[str, np.ndarray],
+                           vectors: np.ndarray, documents: Sequence[Document], expand_top_hits: int = 5,
+                           max_neighbours_per_hit: int = 2,
+                           is_visible: Optional[Callable[[int], bool]] = None) -> List[int]:
+    """
+    Chunk ids of graph neighbours of the top hits, best related chunk per neighbour file.
+
+    For every neighbour file the chunk closest to the hit chunk is chosen, so
+    expansion needs no extra embedding call or search.
+
+    Args:
+        hit_ids: Ids of retrieved chunks, best first
+        graph: Import graph of the repository
+        file_ids: File path to the ids of its chunks
+        vectors: Embedding matrix, row-aligned with the chunk ids
+        documents: Chunk documents, aligned with the chunk ids
+        expand_top_hits: Number of leading hits to expand
+        max_neighbours_per_hit: Neighbour files added per hit
+        is_visible: Optional check that a chunk id passes the active file filter
+
+    Returns:
+        List of additional chunk ids, in expansion order
+    """
+    seen_files = {documents[i].meta_data.get("file_path") for i in hit_ids}
+    extra: List[int] = []
+    for hit_id in hit_ids[:expand_top_hits]:
+        added = 0
+        for neighbour in graph.neighbours(documents[hit_id].meta_data.get("file_path")):
+            if added >= max_neighbours_per_hit:
+                break
+            if neighbour in seen_files or neighbour not in file_ids:
+                continue
+            candidates = file_ids[neighbour]
+            if is_visible is not None and not is_visible(int(candidates[0])):
+                continue
+            best = candidates[int(np.argmax(vectors[candidates] @ vectors[hit_id]))]
+            extra.append(int(best))
+            seen_files.add(neighbour)
+            added += 1
+    return extra
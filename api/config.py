@@ -313,16 +313,23 @@ lang_config = load_lang_config()
 if generator_config:
     configs["default_provider"] = generator_config.get("default_provider", "google")
     configs["providers"] = generator_config.get("providers", {})
+    configs["context_packing"] = generator_config.get("context_packing", {})
+    configs["summary_index"] = generator_config.get("summary_index", {})
+    configs["http_pool"] = generator_config.get("http_pool", {})
+    configs["streaming"] = generator_config.get("streaming", {})
+    configs["conversation_memory"] = generator_config.get("conversation_memory", {})
+    configs["deep_research"] = generator_config.get("deep_research", {})
+    configs["stride_mapreduce"] = generator_config.get("stride_mapreduce", {})
 
 # Update embedder configuration
 if embedder_config:
-    for key in ["embedder", "embedder_ollama", "embedder_google", "retriever", "text_splitter"]:
+    for key in ["embedder", "embedder_ollama", "embedder_google", "retriever", "text_splitter", "federated_search"]:
         if key in embedder_config:
             configs[key] = embedder_config[key]
 
 # Update repository configuration
 if repo_config:
-    for key in ["file_filters", "repository"]:
+    for key in ["file_filters", "repository", "storage", "code_graph"]:
         if key in repo_config:
             configs[key] = repo_config[key]
 
@@ -331,6 +338,35 @@ if lang_config:
     configs["lang_config"] = lang_config
 
 
+def get_context_window(provider="google", model=None):
+    """
+    Get the context window size, in tokens, of the specified provider and model
+
+    Parameters:
+        provider (str): Model provider ('google', 'openai', 'openrouter', 'ollama', 'bedrock')
+        model (str): Model name, or None to use default model
+
+    Returns:
+        int: Maximum number of prompt plus completion tokens the model accepts
+    """
+    default_window = configs.get("context_packing", {}).get("default_context_window", 8192)
+    provider_config = configs.get("providers", {}).get(provider)
+    if not provider_config:
+        return default_window
+
+    model = model or provider_config.get("default_model")
+
+    # Ollama models declare their context size through num_ctx
+    options = provider_config.get("models", {}).get(model, {}).get("options", {})
+    if "num_ctx" in options:
+        return options["num_ctx"]
+
+    model_windows = provider_config.get("model_context_windows", {})
+    if model in model_windows:
+        return model_windows[model]
+    return provider_config.get("context_window", default_window)
+
+
 def get_model_config(provider="google", model=None):
     """
     Get configuration for the specified provider and model
@@ -0,0 +1,256 @@
+"""Pack retrieved chunks into a token-budgeted context block for the prompt."""
+
+import hashlib
+import logging
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Sequence
+
+import tiktoken
+from adalflow.core.types import Document
+
+from api.config import configs, get_context_window
+
+logger = logging.getLogger(__name__)
+
+# Prefix of a chunk used to locate its overlap with the previous chunk
+OVERLAP_PROBE_CHARS = 32
+# Separator between non-adjacent sections of the same file
+GAP_MARKER = "\n...\n"
+
+
+@dataclass
+class PackedContext:
+    """Context text ready for the prompt, with packing statistics."""
+    text: str
+    tokens: int
+    chunks: int
+    files: int
+    dropped: int
+
+
+@lru_cache(maxsize=None)
+def get_tokenizer(provider: str = None, model: str = None) -> Optional[tiktoken.Encoding]:
+    """
+    Get the tokenizer closest to the one used by the target model.
+
+    OpenAI-family models use their own tiktoken encoding, everything else is
+    approximated with cl100k_base.
+
+    Args:
+        provider: Model provider
+        model: Model name, possibly prefixed with a vendor (e.g. "openai/gpt-4o")
+
+    Returns:
+        The tiktoken encoding, or None if none could be loaded
+    """
+    if provider in ("openai", "azure", "openrouter") and model:
+        try:
+            return tiktoken.encoding_for_model(model.split("/")[-1])
+        except Exception:
+            pass
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        logger.warning(f"Could not load a tokenizer, falling back to character estimates: {e}")
+        return None
+
+
+def count_model_tokens(text: str, provider: str = None, model: str = None) -> int:
+    """
+    Count tokens of a text with the target model's tokenizer.
+
+    Args:
+        text: The text to count tokens for
+        provider: Model provider
+        model: Model name
+
+    Returns:
+        int: The number of tokens in the text
+    """
+    encoding = get_tokenizer(provider, model)
+    if encoding is None:
+        # Rough approximation: 4 characters per token
+        return len(text) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text: str, max_tokens: int, provider: str = None, model: str = None) -> str:
+    """Cut a text down to at most max_tokens tokens."""
+    encoding = get_tokenizer(provider, model)
+    if encoding is None:
+        return text[:max_tokens * 4]
+    return encoding.decode(encoding.encode(text, disallowed_special=())[:max_tokens])
+
+
+def fit_to_token_budget(texts: Sequence[str], token_budget: int, provider: str = None, model: str = None,
+                        keep_first: bool = True) -> int:
+    """
+    Number of leading texts whose combined token count fits the budget.
+
+    Args:
+        texts: Texts in priority order
+        token_budget: Maximum number of tokens
+        provider: Model provider, used to pick the tokenizer
+        model: Model name, used to pick the tokenizer
+        keep_first: Count the first text even if it alone exceeds the budget
+
+    Returns:
+        int: How many texts fit
+    """
+    used = 0
+    for i, text in enumerate(texts):
+        used += count_model_tokens(text, provider, model)
+        if used > token_budget:
+            return max(i, 1) if keep_first else i
+    return len(texts)
+
+
+def get_context_budget(provider: str = None, model: str = None, prompt_tokens: int = 0) -> int:
+    """
+    Number of tokens available for retrieved context in a prompt.
+
+    The room kept for the answer is capped at a share of the context window,
+    and context keeps at least ``min_context_share`` of the window as long as
+    the rest of the prompt leaves that much, so models with small windows
+    still get retrieved context.
+
+    Args:
+        provider: Model provider
+        model: Model name
+        prompt_tokens: Tokens already used by the rest of the prompt (query, history, ...)
+
+    Returns:
+        int: Token budget for the context block, never negative
+    """
+    packing_config = configs.get("context_packing", {})
+    window = get_context_window(provider, model)
+    reserved = min(packing_config.get("reserved_output_tokens", 8192),
+                   int(window * packing_config.get("max_output_share", 0.25)))
+    available = window - reserved - prompt_tokens
+    # Below the minimum share the answer's room shrinks instead of the context
+    minimum = min(int(window * packing_config.get("min_context_share", 0.25)), window - prompt_tokens)
+    return max(0, min(max(available, minimum), packing_config.get("max_context_tokens", 32000)))
+
+
+def overlap_length(previous: str, following: str) -> int:
+    """
+    Length of the longest suffix of previous that is also a prefix of following.
+
+    Args:
+        previous: Text of the earlier chunk
+        following: Text of the next chunk
+
+    Returns:
+        int: Number of characters of following already contained in previous
+    """
+    probe = following[:OVERLAP_PROBE_CHARS]
+    start = previous.find(probe) if probe else -1
+    while start != -1:
+        tail = previous[start:]
+        if following.startswith(tail):
+            return len(tail)
+        start = previous.find(probe, start + 1)
+    # Overlaps shorter than the probe
+    for length in range(min(len(probe) - 1, len(previous)), 0, -1):
+        if previous.endswith(following[:length]):
+            return length
+    return 0
+
+
+def merge_file_chunks(chunks: List[Any]) -> str:
+    """Join the chunks of one file in document order, removing the overlap between neighbours."""
+    chunks = sorted(chunks, key=lambda doc: getattr(doc, "order", None) or 0)
+    parts = [chunks[0].text]
+    for previous, doc in zip(chunks, chunks[1:]):
+        prev_order = getattr(previous, "order", None)
+        order = getattr(doc, "order", None)
+        if prev_order is not None and order is not None and order == prev_order + 1:
+            parts.append(doc.text[overlap_length(previous.text, doc.text):])
+        else:
+            parts.append(GAP_MARKER + doc.text)
+    return "".join(parts).strip()
+
+
+def format_file_context(file_path: str, content: str) -> str:
+    """Format the context section of one file."""
+    return f"## File Path: {file_path}\n\n{content}"
+
+
+def pack_context(documents: Sequence[Any], token_budget: int, provider: str = None, model: str = None) -> PackedContext:
+    """
+    Build the context block from retrieved chunks within a token budget.
+
+    Chunks are taken in retrieval order until the budget is spent. Duplicate
+    texts are skipped, chunks of the same file are grouped and adjacent chunks
+    are merged so their shared overlap appears only once.
+
+    Args:
+        documents: Retrieved chunks, best match first
+        token_budget: Maximum number of tokens for the returned text
+        provider: Model provider, used to pick the tokenizer
+        model: Model name, used to pick the tokenizer
+
+    Returns:
+        PackedContext: The packed context text and statistics
+    """
+    min_chunk_tokens = configs.get("context_packing", {}).get("min_chunk_tokens", 64)
+    separator_tokens = count_model_tokens("\n\n" + "-" * 10, provider, model)
+
+    seen_texts = set()
+    selected: Dict[str, List[Any]] = {}
+    used = 0
+    dropped = 0
+
+    for doc in documents:
+        text = doc.text or ""
+        digest = hashlib.sha1(text.strip().encode("utf-8")).hexdigest()
+        if not text.strip() or digest in seen_texts:
+            dropped += 1
+            continue
+
+        file_path = (getattr(doc, "meta_data", None) or {}).get("file_path", "unknown")
+        order = getattr(doc, "order", None)
+
+        # Only count what this chunk adds beyond its already selected neighbours
+        new_text = text
+        for neighbour in selected.get(file_path, []):
+            neighbour_order = getattr(neighbour, "order", None)
+            if order is None or neighbour_order is None:
+                continue
+            if neighbour_order == order - 1:
+                new_text = new_text[overlap_length(neighbour.text, new_text):]
+            elif neighbour_order == order + 1:
+                new_text = new_text[:len(new_text) - overlap_length(new_text, neighbour.text)]
+        header_cost = 0
+        if file_path not in selected:
+            header_cost = count_model_tokens(format_file_context(file_path, ""), provider, model) + separator_tokens
+        cost = header_cost + count_model_tokens(new_text, provider, model)
+
+        if used + cost > token_budget:
+            remaining = token_budget - used - header_cost
+            if file_path in selected or remaining < min_chunk_tokens:
+                dropped += 1
+                continue
+            # Keep the head of a large chunk from a new file rather than nothing at all
+            doc = Document(text=truncate_to_tokens(text, remaining, provider, model),
+                           meta_data=doc.meta_data, order=order)
+            cost = token_budget - used
+
+        seen_texts.add(digest)
+        selected.setdefault(file_path, []).append(doc)
+        used += cost
+
+    context_parts = [format_file_context(file_path, merge_file_chunks(chunks)) for file_path, chunks in selected.items()]
+    text = "\n\n" + "-" * 10 + "\n\n".join(context_parts) if context_parts else ""
+
+    # Token counts of concatenated pieces can differ slightly from their sum
+    tokens = count_model_tokens(text, provider, model)
+    if tokens > token_budget:
+        text = truncate_to_tokens(text, token_budget, provider, model)
+        tokens = count_model_tokens(text, provider, model)
+
+    chunk_count = sum(len(chunks) for chunks in selected.values())
+    logger.info(f"Packed {chunk_count} chunks from {len(selected)} files into {tokens}/{token_budget} context tokens "
+                f"({dropped} chunks dropped)")
+    return PackedContext(text=text, tokens=tokens, chunks=chunk_count, files=len(selected), dropped=dropped)
@@ -186,7 +186,9 @@ class DashscopeClient(ModelClient):
     def init_async_client(self):
         api_key, workspace_id, base_url = self._prepare_client_config()
         
-        client = AsyncOpenAI(api_key=api_key, base_url=base_url)
+        from api.http_pool import async_httpx_client
+
+        client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=async_httpx_client())
         
         # Store workspace_id for later use in requests
         if workspace_id:
@@ -512,7 +514,8 @@ class DashscopeClient(ModelClient):
             completion = await self.async_client.chat.completions.create(**api_kwargs)
 
             if api_kwargs.get("stream", False):
-                return handle_streaming_response(completion)
+                # The async stream yields the raw chunks, like the OpenAI client
+                return completion
             else:
                 return self.parse_chat_completion(completion)
         elif model_type == ModelType.EMBEDDER:
@@ -1,5 +1,6 @@
 import adalflow as adal
 from adalflow.core.types import Document, List
+from typing import Optional
 from adalflow.components.data_process import TextSplitter, ToEmbeddings
 import os
 import subprocess
@@ -8,10 +9,17 @@ import tiktoken
 import logging
 import base64
 import glob
+import threading
+import time
+from collections import OrderedDict
+from contextlib import nullcontext
 from adalflow.utils import get_adalflow_default_root_path
 from adalflow.core.db import LocalDB
+from api.chunk_store import (CHUNK_STORE_FILE, INDEX_FORMAT, WORKTREE_REVISION, ChunkStore, collect_garbage,
+                             embed_with_store, embedder_fingerprint, load_index_meta, load_snapshot, save_snapshot)
 from api.config import configs, DEFAULT_EXCLUDED_DIRS, DEFAULT_EXCLUDED_FILES
 from api.ollama_patch import OllamaDocumentProcessor
+from api.storage import LocalStorage
 from urllib.parse import urlparse, urlunparse, quote
 import requests
 from requests.exceptions import RequestException
@@ -24,6 +32,11 @@ logger = logging.getLogger(__name__)
 # Maximum token limit for OpenAI embedding models
 MAX_EMBEDDING_TOKENS = 8192
 
+# File extensions to index, prioritizing code files
+CODE_EXTENSIONS = [".py", ".js", ".ts", ".java", ".cpp", ".c", ".h", ".hpp", ".go", ".rs",
+                   ".jsx", ".tsx", ".html", ".css", ".php", ".swift", ".cs"]
+DOC_EXTENSIONS = [".md", ".txt", ".rst", ".json", ".yaml", ".yml"]
+
 def count_tokens(text: str, embedder_type: str = None, is_ollama_embedder: bool = None) -> int:
     """
     Count the number of tokens in a text string using tiktoken.
@@ -66,15 +79,68 @@ def count_tokens(text: str, embedder_type: str = None, is_ollama_embedder: bool
         # Rough approximation: 4 characters per token
         return len(text) // 4
 
-def download_repo(repo_url: str, local_path: str, repo_type: str = None, access_token: str = None) -> str:
+def sparse_checkout_patterns(excluded_dirs: List[str] = None, excluded_files: List[str] = None,
+                             included_dirs: List[str] = None, included_files: List[str] = None) -> List[str]:
+    """
+    Non-cone sparse-checkout patterns covering every file read_all_documents would index.
+
+    Only rules with the exact meaning they have in should_process_file are turned
+    into patterns, so the checkout is never narrower than the index.
+
+    Args:
+        excluded_dirs (List[str], optional): Additional directories to exclude.
+        excluded_files (List[str], optional): Additional file patterns to exclude.
+        included_dirs (List[str], optional): Directories to include exclusively.
+        included_files (List[str], optional): File patterns to include exclusively.
+
+    Returns:
+        List[str]: gitignore-style patterns for `git sparse-checkout set --no-cone`
+    """
+    use_inclusion, included_dirs, included_files, excluded_dirs, excluded_files = resolve_file_filters(
+        excluded_dirs, excluded_files, included_dirs, included_files
+    )
+
+    if use_inclusion:
+        patterns = []
+        for included in sorted(included_dirs):
+            clean_included = included.strip("./").rstrip("/")
+            if clean_included:
+                prefix = f"**/{clean_included}" if "/" not in clean_included else f"/{clean_included}"
+                patterns.extend(f"{prefix}/**/*{ext}" for ext in CODE_EXTENSIONS + DOC_EXTENSIONS)
+        patterns.extend(f"*{included_file}" for included_file in sorted(included_files))
+        return patterns or ["/*"]
+
+    patterns = [f"*{ext}" for ext in CODE_EXTENSIONS + DOC_EXTENSIONS]
+    for excluded in sorted(excluded_dirs):
+        clean_excluded = excluded.strip("./").rstrip("/")
+        # Multi-level paths never match a single path component in should_process_file
+        if clean_excluded and "/" not in clean_excluded:
+            patterns.append(f"!**/{clean_excluded}/**")
+    for excluded_file in sorted(excluded_files):
+        # should_process_file compares file names literally, wildcards included
+        if not any(char in excluded_file for char in "*?[!\\"):
+            patterns.append(f"!{excluded_file}")
+    return patterns
+
+def download_repo(repo_url: str, local_path: str, repo_type: str = None, access_token: str = None,
+                  excluded_dirs: List[str] = None, excluded_files: List[str] = None,
+                  included_dirs: List[str] = None, included_files: List[str] = None) -> str:
     """
     Downloads a Git repository (GitHub, GitLab, or Bitbucket) to a specified local path.
 
+    With ``repository.sparse_checkout`` enabled the clone is partial
+    (``--filter=blob:none``) and only files matching the indexing filters are
+    checked out, so only their blobs are downloaded.
+
     Args:
         repo_type(str): Type of repository
         repo_url (str): The URL of the Git repository to clone.
         local_path (str): The local directory where the repository will be cloned.
         access_token (str, optional): Access token for private repositories.
+        excluded_dirs (List[str], optional): Additional directories to leave out of the checkout.
+        excluded_files (List[str], optional): Additional file patterns to leave out of the checkout.
+        included_dirs (List[str], optional): Directories to check out exclusively.
+        included_files (List[str], optional): File patterns to check out exclusively.
 
     Returns:
         str: The output message from the `git` command.
@@ -121,14 +187,44 @@ def download_repo(repo_url: str, local_path: str, repo_type: str = None, access_
         # Clone the repository
         logger.info(f"Cloning repository from {repo_url} to {local_path}")
         # We use repo_url in the log to avoid exposing the token in logs
+        if not configs.get("repository", {}).get("sparse_checkout", False):
+            result = subprocess.run(
+                ["git", "clone", "--depth=1", "--single-branch", clone_url, local_path],
+                check=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+            logger.info("Repository cloned successfully")
+            return result.stdout.decode("utf-8")
+
+        # Partial clone: blobs are fetched lazily by the sparse checkout below
         result = subprocess.run(
-            ["git", "clone", "--depth=1", "--single-branch", clone_url, local_path],
+            ["git", "clone", "--depth=1", "--single-branch", "--filter=blob:none", "--no-checkout",
+             clone_url, local_path],
+            check=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        patterns = sparse_checkout_patterns(excluded_dirs, excluded_files, included_dirs, included_files)
+        try:
+            subprocess.run(
+                ["git", "-C", local_path, "sparse-checkout", "set", "--no-cone", "--stdin"],
+                input="\n".join(patterns).encode("utf-8"),
+                check=True,
+                stdout=subprocess.PIPE,
+                stderr=subprocess.PIPE,
+            )
+        except subprocess.CalledProcessError as e:
+            # Older git without sparse-checkout: check out the whole tree
+            logger.warning(f"Sparse checkout unavailable, checking out all files: {e.stderr.decode('utf-8').strip()}")
+        subprocess.run(
+            ["git", "-C", local_path, "checkout"],
             check=True,
             stdout=subprocess.PIPE,
             stderr=subprocess.PIPE,
         )
 
-        logger.info("Repository cloned successfully")
+        logger.info(f"Repository cloned successfully with {len(patterns)} sparse-checkout patterns")
         return result.stdout.decode("utf-8")
 
     except subprocess.CalledProcessError as e:
@@ -147,6 +243,162 @@ def download_repo(repo_url: str, local_path: str, repo_type: str = None, access_
 # Alias for backward compatibility
 download_github_repo = download_repo
 
+def refresh_repo(local_path: str, access_token: str = None) -> str:
+    """
+    Update a cloned repository to the latest commit of its remote branch.
+
+    The clone stays shallow, partial and sparse: only the new commit and the
+    blobs of checked-out files are downloaded.
+
+    Args:
+        local_path (str): The local clone created by download_repo.
+        access_token (str, optional): Access token, only used to sanitize error messages.
+
+    Returns:
+        str: The commit the clone now points to.
+    """
+    try:
+        logger.info(f"Fetching the latest commit for {local_path}")
+        subprocess.run(
+            ["git", "-C", local_path, "fetch", "--depth=1", "origin", "HEAD"],
+            check=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        subprocess.run(
+            ["git", "-C", local_path, "reset", "--hard", "FETCH_HEAD"],
+            check=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        result = subprocess.run(
+            ["git", "-C", local_path, "rev-parse", "HEAD"],
+            check=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        return result.stdout.decode("utf-8").strip()
+    except subprocess.CalledProcessError as e:
+        error_msg = e.stderr.decode('utf-8')
+        if access_token:
+            error_msg = error_msg.replace(access_token, "***TOKEN***")
+            error_msg = error_msg.replace(quote(access_token, safe=''), "***TOKEN***")
+        raise ValueError(f"Error during refresh: {error_msg}")
+
+def resolve_file_filters(excluded_dirs: List[str] = None, excluded_files: List[str] = None,
+                         included_dirs: List[str] = None, included_files: List[str] = None):
+    """
+    Resolve the effective inclusion/exclusion rules for a set of file filters.
+
+    Args:
+        excluded_dirs (List[str], optional): Additional directories to exclude.
+        excluded_files (List[str], optional): Additional file patterns to exclude.
+        included_dirs (List[str], optional): Directories to include exclusively.
+        included_files (List[str], optional): File patterns to include exclusively.
+
+    Returns:
+        tuple: (use_inclusion_mode, included_dirs, included_files, excluded_dirs, excluded_files)
+    """
+    # Determine filtering mode: inclusion or exclusion
+    use_inclusion_mode = (included_dirs is not None and len(included_dirs) > 0) or (included_files is not None and len(included_files) > 0)
+
+    if use_inclusion_mode:
+        # Inclusion mode: only process specified directories and files
+        final_included_dirs = set(included_dirs) if included_dirs else set()
+        final_included_files = set(included_files) if included_files else set()
+        return True, list(final_included_dirs), list(final_included_files), [], []
+
+    # Exclusion mode: use default exclusions plus any additional ones
+    final_excluded_dirs = set(DEFAULT_EXCLUDED_DIRS)
+    final_excluded_files = set(DEFAULT_EXCLUDED_FILES)
+
+    # Add any additional excluded directories from config
+    if "file_filters" in configs and "excluded_dirs" in configs["file_filters"]:
+        final_excluded_dirs.update(configs["file_filters"]["excluded_dirs"])
+
+    # Add any additional excluded files from config
+    if "file_filters" in configs and "excluded_files" in configs["file_filters"]:
+        final_excluded_files.update(configs["file_filters"]["excluded_files"])
+
+    # Add any explicitly provided excluded directories and files
+    if excluded_dirs is not None:
+        final_excluded_dirs.update(excluded_dirs)
+
+    if excluded_files is not None:
+        final_excluded_files.update(excluded_files)
+
+    return False, [], [], list(final_excluded_dirs), list(final_excluded_files)
+
+def has_custom_file_filters(excluded_dirs: List[str] = None, excluded_files: List[str] = None,
+                            included_dirs: List[str] = None, included_files: List[str] = None) -> bool:
+    """
+    Check whether a request carries any file filters beyond the configured defaults.
+    """
+    return any(bool(rules) for rules in (excluded_dirs, excluded_files, included_dirs, included_files))
+
+def should_process_file(file_path: str, use_inclusion: bool, included_dirs: List[str], included_files: List[str],
+                        excluded_dirs: List[str], excluded_files: List[str]) -> bool:
+    """
+    Determine if a file should be processed based on inclusion/exclusion rules.
+
+    Args:
+        file_path (str): The file path to check
+        use_inclusion (bool): Whether to use inclusion mode
+        included_dirs (List[str]): List of directories to include
+        included_files (List[str]): List of files to include
+        excluded_dirs (List[str]): List of directories to exclude
+        excluded_files (List[str]): List of files to exclude
+
+    Returns:
+        bool: True if the file should be processed, False otherwise
+    """
+    file_path_parts = os.path.normpath(file_path).split(os.sep)
+    file_name = os.path.basename(file_path)
+
+    if use_inclusion:
+        # Inclusion mode: file must be in included directories or match included files
+        is_included = False
+
+        # Check if file is in an included directory
+        if included_dirs:
+            for included in included_dirs:
+                clean_included = included.strip("./").rstrip("/")
+                if clean_included in file_path_parts:
+                    is_included = True
+                    break
+
+        # Check if file matches included file patterns
+        if not is_included and included_files:
+            for included_file in included_files:
+                if file_name == included_file or file_name.endswith(included_file):
+                    is_included = True
+                    break
+
+        # If no inclusion rules are specified for a category, allow all files from that category
+        if not included_dirs and not included_files:
+            is_included = True
+
+        return is_included
+    else:
+        # Exclusion mode: file must not be in excluded directories or match excluded files
+        is_excluded = False
+
+        # Check if file is in an excluded directory
+        for excluded in excluded_dirs:
+            clean_excluded = excluded.strip("./").rstrip("/")
+            if clean_excluded in file_path_parts:
+                is_excluded = True
+                break
+
+        # Check if file matches excluded file patterns
+        if not is_excluded:
+            for excluded_file in excluded_files:
+                if file_name == excluded_file:
+                    is_excluded = True
+                    break
+
+        return not is_excluded
+
 def read_all_documents(path: str, embedder_type: str = None, is_ollama_embedder: bool = None, 
                       excluded_dirs: List[str] = None, excluded_files: List[str] = None,
                       included_dirs: List[str] = None, included_files: List[str] = None):
@@ -176,128 +428,24 @@ def read_all_documents(path: str, embedder_type: str = None, is_ollama_embedder:
         embedder_type = 'ollama' if is_ollama_embedder else None
     documents = []
     # File extensions to look for, prioritizing code files
-    code_extensions = [".py", ".js", ".ts", ".java", ".cpp", ".c", ".h", ".hpp", ".go", ".rs",
-                       ".jsx", ".tsx", ".html", ".css", ".php", ".swift", ".cs"]
-    doc_extensions = [".md", ".txt", ".rst", ".json", ".yaml", ".yml"]
+    code_extensions = CODE_EXTENSIONS
+    doc_extensions = DOC_EXTENSIONS
 
-    # Determine filtering mode: inclusion or exclusion
-    use_inclusion_mode = (included_dirs is not None and len(included_dirs) > 0) or (included_files is not None and len(included_files) > 0)
+    use_inclusion_mode, included_dirs, included_files, excluded_dirs, excluded_files = resolve_file_filters(
+        excluded_dirs, excluded_files, included_dirs, included_files
+    )
 
     if use_inclusion_mode:
-        # Inclusion mode: only process specified directories and files
-        final_included_dirs = set(included_dirs) if included_dirs else set()
-        final_included_files = set(included_files) if included_files else set()
-
         logger.info(f"Using inclusion mode")
-        logger.info(f"Included directories: {list(final_included_dirs)}")
-        logger.info(f"Included files: {list(final_included_files)}")
-
-        # Convert to lists for processing
-        included_dirs = list(final_included_dirs)
-        included_files = list(final_included_files)
-        excluded_dirs = []
-        excluded_files = []
+        logger.info(f"Included directories: {included_dirs}")
+        logger.info(f"Included files: {included_files}")
     else:
-        # Exclusion mode: use default exclusions plus any additional ones
-        final_excluded_dirs = set(DEFAULT_EXCLUDED_DIRS)
-        final_excluded_files = set(DEFAULT_EXCLUDED_FILES)
-
-        # Add any additional excluded directories from config
-        if "file_filters" in configs and "excluded_dirs" in configs["file_filters"]:
-            final_excluded_dirs.update(configs["file_filters"]["excluded_dirs"])
-
-        # Add any additional excluded files from config
-        if "file_filters" in configs and "excluded_files" in configs["file_filters"]:
-            final_excluded_files.update(configs["file_filters"]["excluded_files"])
-
-        # Add any explicitly provided excluded directories and files
-        if excluded_dirs is not None:
-            final_excluded_dirs.update(excluded_dirs)
-
-        if excluded_files is not None:
-            final_excluded_files.update(excluded_files)
-
-        # Convert back to lists for compatibility
-        excluded_dirs = list(final_excluded_dirs)
-        excluded_files = list(final_excluded_files)
-        included_dirs = []
-        included_files = []
-
         logger.info(f"Using exclusion mode")
         logger.info(f"Excluded directories: {excluded_dirs}")
         logger.info(f"Excluded files: {excluded_files}")
 
     logger.info(f"Reading documents from {path}")
 
-    def should_process_file(file_path: str, use_inclusion: bool, included_dirs: List[str], included_files: List[str],
-                           excluded_dirs: List[str], excluded_files: List[str]) -> bool:
-        """
-        Determine if a file should be processed based on inclusion/exclusion rules.
-
-        Args:
-            file_path (str): The file path to check
-            use_inclusion (bool): Whether to use inclusion mode
-            included_dirs (List[str]): List of directories to include
-            included_files (List[str]): List of files to include
-            excluded_dirs (List[str]): List of directories to exclude
-            excluded_files (List[str]): List of files to exclude
-
-        Returns:
-            bool: True if the file should be processed, False otherwise
-        """
-        file_path_parts = os.path.normpath(file_path).split(os.sep)
-        file_name = os.path.basename(file_path)
-
-        if use_inclusion:
-            # Inclusion mode: file must be in included directories or match included files
-            is_included = False
-
-            # Check if file is in an included directory
-            if included_dirs:
-                for included in included_dirs:
-                    clean_included = included.strip("./").rstrip("/")
-                    if clean_included in file_path_parts:
-                        is_included = True
-                        break
-
-            # Check if file matches included file patterns
-            if not is_included and included_files:
-                for included_file in included_files:
-                    if file_name == included_file or file_name.endswith(included_file):
-                        is_included = True
-                        break
-
-            # If no inclusion rules are specified for a category, allow all files from that category
-            if not included_dirs and not included_files:
-                is_included = True
-            elif not included_dirs and included_files:
-                # Only file patterns specified, allow all directories
-                pass  # is_included is already set based on file patterns
-            elif included_dirs and not included_files:
-                # Only directory patterns specified, allow all files in included directories
-                pass  # is_included is already set based on directory patterns
-
-            return is_included
-        else:
-            # Exclusion mode: file must not be in excluded directories or match excluded files
-            is_excluded = False
-
-            # Check if file is in an excluded directory
-            for excluded in excluded_dirs:
-                clean_excluded = excluded.strip("./").rstrip("/")
-                if clean_excluded in file_path_parts:
-                    is_excluded = True
-                    break
-
-            # Check if file matches excluded file patterns
-            if not is_excluded:
-                for excluded_file in excluded_files:
-                    if file_name == excluded_file:
-                        is_excluded = True
-                        break
-
-            return not is_excluded
-
     # Process code files first
     for ext in code_extensions:
         files = glob.glob(f"{path}/**/*{ext}", recursive=True)
@@ -376,6 +524,29 @@ def read_all_documents(path: str, embedder_type: str = None, is_ollama_embedder:
     logger.info(f"Found {len(documents)} documents")
     return documents
 
+def get_embedding_transformer(embedder_type: str):
+    """
+    Creates the component that embeds documents in place.
+
+    Args:
+        embedder_type (str): The embedder type ('openai', 'google', 'ollama').
+
+    Returns:
+        The document embedding transformer
+    """
+    from api.config import get_embedder_config
+
+    embedder = get_embedder(embedder_type=embedder_type)
+
+    # Choose appropriate processor based on embedder type
+    if embedder_type == 'ollama':
+        # Use Ollama document processor for single-document processing
+        return OllamaDocumentProcessor(embedder=embedder)
+
+    # Use batch processing for OpenAI and Google embedders
+    batch_size = get_embedder_config().get("batch_size", 500)
+    return ToEmbeddings(embedder=embedder, batch_size=batch_size)
+
 def prepare_data_pipeline(embedder_type: str = None, is_ollama_embedder: bool = None):
     """
     Creates and returns the data transformation pipeline.
@@ -389,7 +560,7 @@ def prepare_data_pipeline(embedder_type: str = None, is_ollama_embedder: bool =
     Returns:
         adal.Sequential: The data transformation pipeline
     """
-    from api.config import get_embedder_config, get_embedder_type
+    from api.config import get_embedder_type
 
     # Handle backward compatibility
     if embedder_type is None and is_ollama_embedder is not None:
@@ -400,20 +571,7 @@ def prepare_data_pipeline(embedder_type: str = None, is_ollama_embedder: bool =
         embedder_type = get_embedder_type()
 
     splitter = TextSplitter(**configs["text_splitter"])
-    embedder_config = get_embedder_config()
-
-    embedder = get_embedder(embedder_type=embedder_type)
-
-    # Choose appropriate processor based on embedder type
-    if embedder_type == 'ollama':
-        # Use Ollama document processor for single-document processing
-        embedder_transformer = OllamaDocumentProcessor(embedder=embedder)
-    else:
-        # Use batch processing for OpenAI and Google embedders
-        batch_size = embedder_config.get("batch_size", 500)
-        embedder_transformer = ToEmbeddings(
-            embedder=embedder, batch_size=batch_size
-        )
+    embedder_transformer = get_embedding_transformer(embedder_type)
 
     data_transformer = adal.Sequential(
         splitter, embedder_transformer
@@ -421,7 +579,8 @@ def prepare_data_pipeline(embedder_type: str = None, is_ollama_embedder: bool =
     return data_transformer
 
 def transform_documents_and_save_to_db(
-    documents: List[Document], db_path: str, embedder_type: str = None, is_ollama_embedder: bool = None
+    documents: List[Document], db_path: str, embedder_type: str = None, is_ollama_embedder: bool = None,
+    chunk_store: ChunkStore = None, embedding_slots=None, stats: dict = None
 ) -> LocalDB:
     """
     Transforms a list of documents and saves them to a local database.
@@ -433,19 +592,107 @@ def transform_documents_and_save_to_db(
                                      If None, will be determined from configuration.
         is_ollama_embedder (bool, optional): DEPRECATED. Use embedder_type instead.
                                            If None, will be determined from configuration.
+        chunk_store (ChunkStore, optional): Store of chunk vectors; only chunks missing
+                                            from it are sent to the embedder.
+        embedding_slots (optional): Semaphore held while embedding, to bound concurrent embedding
+        stats (dict, optional): Receives the reused/embedded/failed chunk counts
     """
-    # Get the data transformer
-    data_transformer = prepare_data_pipeline(embedder_type, is_ollama_embedder)
-
     # Save the documents to a local database
     db = LocalDB()
-    db.register_transformer(transformer=data_transformer, key="split_and_embed")
     db.load(documents)
-    db.transform(key="split_and_embed")
+    if chunk_store is None:
+        # Get the data transformer
+        data_transformer = prepare_data_pipeline(embedder_type, is_ollama_embedder)
+        db.register_transformer(transformer=data_transformer, key="split_and_embed")
+        db.transform(key="split_and_embed")
+    else:
+        from api.config import get_embedder_type
+
+        if embedder_type is None and is_ollama_embedder is not None:
+            embedder_type = 'ollama' if is_ollama_embedder else None
+        embedder_type = embedder_type or get_embedder_type()
+        chunks = TextSplitter(**configs["text_splitter"])(db.items)
+        with embedding_slots if embedding_slots is not None else nullcontext():
+            db.transformed_items["split_and_embed"] = embed_with_store(
+                chunks, chunk_store, embedder_fingerprint(embedder_type), get_embedding_transformer(embedder_type),
+                stats=stats
+            )
     os.makedirs(os.path.dirname(db_path), exist_ok=True)
     db.save_state(filepath=db_path)
     return db
 
+# Pooled connections for Git host API calls, with ETag-validated responses
+_http_session = requests.Session()
+_etag_cache: "OrderedDict[tuple, requests.Response]" = OrderedDict()
+_etag_cache_lock = threading.Lock()
+MAX_CACHED_RESPONSES = 256
+# Default branch per repository API URL, it rarely changes
+_default_branches = {}
+
+
+def _cached_get(url: str, headers: dict = None) -> requests.Response:
+    """
+    GET a Git host API URL, revalidating earlier responses with their ETag.
+
+    A 304 Not Modified answer returns the cached response, which does not
+    count against the host's rate limit.
+
+    Args:
+        url: The URL to fetch
+        headers: Request headers, including any authorization
+
+    Returns:
+        requests.Response: The fresh or cached response
+    """
+    headers = dict(headers or {})
+    key = (url, tuple(sorted(headers.items())))
+    with _etag_cache_lock:
+        cached = _etag_cache.get(key)
+    if cached is not None:
+        headers["If-None-Match"] = cached.headers["ETag"]
+
+    response = _http_session.get(url, headers=headers, timeout=30)
+    if response.status_code == 304 and cached is not None:
+        with _etag_cache_lock:
+            _etag_cache.move_to_end(key)
+        return cached
+
+    if response.status_code == 200 and response.headers.get("ETag"):
+        with _etag_cache_lock:
+            _etag_cache[key] = response
+            _etag_cache.move_to_end(key)
+            while len(_etag_cache) > MAX_CACHED_RESPONSES:
+                _etag_cache.popitem(last=False)
+    return response
+
+
+def read_local_file(repo_dir: str, file_path: str) -> str:
+    """
+    Read a file from a local checkout of a repository.
+
+    Args:
+        repo_dir (str): Root of the local checkout
+        file_path (str): Path of the file relative to the repository root
+
+    Returns:
+        str: The content of the file
+
+    Raises:
+        ValueError: If the path points outside the repository or the file cannot be read
+    """
+    root = os.path.realpath(repo_dir)
+    full_path = os.path.realpath(os.path.join(root, file_path.replace("\\", "/").lstrip("/")))
+    if os.path.commonpath([root, full_path]) != root:
+        raise ValueError(f"File path {file_path} is outside the repository")
+    if not os.path.isfile(full_path):
+        raise ValueError(f"File {file_path} not found in {repo_dir}")
+    try:
+        with open(full_path, "r", encoding="utf-8") as f:
+            return f.read()
+    except (OSError, UnicodeDecodeError) as e:
+        raise ValueError(f"Error reading {file_path}: {e}")
+
+
 def get_github_file_content(repo_url: str, file_path: str, access_token: str = None) -> str:
     """
     Retrieves the content of a file from a GitHub repository using the GitHub API.
@@ -495,7 +742,7 @@ def get_github_file_content(repo_url: str, file_path: str, access_token: str = N
             headers["Authorization"] = f"token {access_token}"
         logger.info(f"Fetching file content from GitHub API: {api_url}")
         try:
-            response = requests.get(api_url, headers=headers)
+            response = _cached_get(api_url, headers=headers)
             response.raise_for_status()
         except RequestException as e:
             raise ValueError(f"Error fetching file content: {e}")
@@ -559,24 +806,26 @@ def get_gitlab_file_content(repo_url: str, file_path: str, access_token: str = N
         encoded_file_path = quote(file_path, safe='')
 
         # Try to get the default branch from the project info
-        default_branch = None
-        try:
-            project_info_url = f"{gitlab_domain}/api/v4/projects/{encoded_project_path}"
-            project_headers = {}
-            if access_token:
-                project_headers["PRIVATE-TOKEN"] = access_token
-            
-            project_response = requests.get(project_info_url, headers=project_headers)
-            if project_response.status_code == 200:
-                project_data = project_response.json()
-                default_branch = project_data.get('default_branch', 'main')
-                logger.info(f"Found default branch: {default_branch}")
-            else:
-                logger.warning(f"Could not fetch project info, using 'main' as default branch")
+        project_info_url = f"{gitlab_domain}/api/v4/projects/{encoded_project_path}"
+        default_branch = _default_branches.get(project_info_url)
+        if default_branch is None:
+            try:
+                project_headers = {}
+                if access_token:
+                    project_headers["PRIVATE-TOKEN"] = access_token
+
+                project_response = _cached_get(project_info_url, headers=project_headers)
+                if project_response.status_code == 200:
+                    project_data = project_response.json()
+                    default_branch = project_data.get('default_branch', 'main')
+                    _default_branches[project_info_url] = default_branch
+                    logger.info(f"Found default branch: {default_branch}")
+                else:
+                    logger.warning(f"Could not fetch project info, using 'main' as default branch")
+                    default_branch = 'main'
+            except Exception as e:
+                logger.warning(f"Error fetching project info: {e}, using 'main' as default branch")
                 default_branch = 'main'
-        except Exception as e:
-            logger.warning(f"Error fetching project info: {e}, using 'main' as default branch")
-            default_branch = 'main'
 
         api_url = f"{gitlab_domain}/api/v4/projects/{encoded_project_path}/repository/files/{encoded_file_path}/raw?ref={default_branch}"
         # Fetch file content from GitLab API
@@ -585,7 +834,7 @@ def get_gitlab_file_content(repo_url: str, file_path: str, access_token: str = N
             headers["PRIVATE-TOKEN"] = access_token
         logger.info(f"Fetching file content from GitLab API: {api_url}")
         try:
-            response = requests.get(api_url, headers=headers)
+            response = _cached_get(api_url, headers=headers)
             response.raise_for_status()
             content = response.text
         except RequestException as e:
@@ -630,24 +879,26 @@ def get_bitbucket_file_content(repo_url: str, file_path: str, access_token: str
         repo = parts[-1].replace(".git", "")
 
         # Try to get the default branch from the repository info
-        default_branch = None
-        try:
-            repo_info_url = f"https://api.bitbucket.org/2.0/repositories/{owner}/{repo}"
-            repo_headers = {}
-            if access_token:
-                repo_headers["Authorization"] = f"Bearer {access_token}"
-            
-            repo_response = requests.get(repo_info_url, headers=repo_headers)
-            if repo_response.status_code == 200:
-                repo_data = repo_response.json()
-                default_branch = repo_data.get('mainbranch', {}).get('name', 'main')
-                logger.info(f"Found default branch: {default_branch}")
-            else:
-                logger.warning(f"Could not fetch repository info, using 'main' as default branch")
+        repo_info_url = f"https://api.bitbucket.org/2.0/repositories/{owner}/{repo}"
+        default_branch = _default_branches.get(repo_info_url)
+        if default_branch is None:
+            try:
+                repo_headers = {}
+                if access_token:
+                    repo_headers["Authorization"] = f"Bearer {access_token}"
+
+                repo_response = _cached_get(repo_info_url, headers=repo_headers)
+                if repo_response.status_code == 200:
+                    repo_data = repo_response.json()
+                    default_branch = repo_data.get('mainbranch', {}).get('name', 'main')
+                    _default_branches[repo_info_url] = default_branch
+                    logger.info(f"Found default branch: {default_branch}")
+                else:
+                    logger.warning(f"Could not fetch repository info, using 'main' as default branch")
+                    default_branch = 'main'
+            except Exception as e:
+                logger.warning(f"Error fetching repository info: {e}, using 'main' as default branch")
                 default_branch = 'main'
-        except Exception as e:
-            logger.warning(f"Error fetching repository info: {e}, using 'main' as default branch")
-            default_branch = 'main'
 
         # Use Bitbucket API to get file content
         # The API endpoint for getting file content is: /2.0/repositories/{owner}/{repo}/src/{branch}/{path}
@@ -659,7 +910,7 @@ def get_bitbucket_file_content(repo_url: str, file_path: str, access_token: str
             headers["Authorization"] = f"Bearer {access_token}"
         logger.info(f"Fetching file content from Bitbucket API: {api_url}")
         try:
-            response = requests.get(api_url, headers=headers)
+            response = _cached_get(api_url, headers=headers)
             if response.status_code == 200:
                 content = response.text
             elif response.status_code == 404:
@@ -681,15 +932,20 @@ def get_bitbucket_file_content(repo_url: str, file_path: str, access_token: str
         raise ValueError(f"Failed to get file content: {str(e)}")
 
 
-def get_file_content(repo_url: str, file_path: str, repo_type: str = None, access_token: str = None) -> str:
+def get_file_content(repo_url: str, file_path: str, repo_type: str = None, access_token: str = None,
+                     repo_dir: str = None) -> str:
     """
     Retrieves the content of a file from a Git repository (GitHub or GitLab).
 
+    The local clone is read first when there is one; the Git host API is only
+    called for files it does not contain.
+
     Args:
         repo_type (str): Type of repository
         repo_url (str): The URL of the repository
         file_path (str): The path to the file within the repository
         access_token (str, optional): Access token for private repositories
+        repo_dir (str, optional): Local checkout of the repository
 
     Returns:
         str: The content of the file as a string
@@ -697,6 +953,14 @@ def get_file_content(repo_url: str, file_path: str, repo_type: str = None, acces
     Raises:
         ValueError: If the file cannot be fetched or if the URL is not valid
     """
+    if repo_dir and os.path.isdir(repo_dir):
+        try:
+            return read_local_file(repo_dir, file_path)
+        except ValueError as e:
+            if "outside the repository" in str(e):
+                raise
+            logger.info(f"{e}, falling back to the {repo_type} API")
+
     if repo_type == "github":
         return get_github_file_content(repo_url, file_path, access_token)
     elif repo_type == "gitlab":
@@ -711,10 +975,23 @@ class DatabaseManager:
     Manages the creation, loading, transformation, and persistence of LocalDB instances.
     """
 
-    def __init__(self):
+    def __init__(self, embedding_slots=None, storage: LocalStorage = None):
+        """
+        Args:
+            embedding_slots (optional): Semaphore shared by parallel indexing processes,
+                                        held while a repository is being embedded
+            storage (LocalStorage, optional): Where indexes are shared between nodes,
+                                              defaults to the local disk only
+        """
         self.db = None
+        self.code_graph = None
         self.repo_url_or_path = None
         self.repo_paths = None
+        self.embedding_slots = embedding_slots
+        self.storage = storage or LocalStorage()
+        # Seconds spent per indexing step and chunk counts of the last build
+        self.timings = {}
+        self.build_stats = {}
 
     def prepare_database(self, repo_url_or_path: str, repo_type: str = None, access_token: str = None,
                          embedder_type: str = None, is_ollama_embedder: bool = None,
@@ -755,6 +1032,8 @@ class DatabaseManager:
         self.db = None
         self.repo_url_or_path = None
         self.repo_paths = None
+        self.timings = {}
+        self.build_stats = {}
 
     def _extract_repo_name_from_url(self, repo_url_or_path: str, repo_type: str) -> str:
         # Extract owner and repo name to create unique identifier
@@ -803,7 +1082,9 @@ class DatabaseManager:
                 # Check if the repository directory already exists and is not empty
                 if not (os.path.exists(save_repo_dir) and os.listdir(save_repo_dir)):
                     # Only download if the repository doesn't exist or is empty
+                    start = time.perf_counter()
                     download_repo(repo_url_or_path, save_repo_dir, repo_type, access_token)
+                    self.timings["clone"] = time.perf_counter() - start
                 else:
                     logger.info(f"Repository already exists at {save_repo_dir}. Using existing repository.")
             else:  # local path
@@ -831,15 +1112,22 @@ class DatabaseManager:
         """
         Prepare the indexed database for the repository.
 
+        The database always holds one full index per repository (default and configured
+        exclusions only). Custom file filters are not applied at ingest time; they are
+        evaluated against the per-chunk ``file_path`` metadata at query time instead, so
+        a filter change never requires re-embedding the repository. Databases without
+        the current index format in their metadata, which older versions may have built
+        with filters applied, are rebuilt.
+
         Args:
             embedder_type (str, optional): Embedder type to use ('openai', 'google', 'ollama').
                                          If None, will be determined from configuration.
             is_ollama_embedder (bool, optional): DEPRECATED. Use embedder_type instead.
                                                If None, will be determined from configuration.
-            excluded_dirs (List[str], optional): List of directories to exclude from processing
-            excluded_files (List[str], optional): List of file patterns to exclude from processing
-            included_dirs (List[str], optional): List of directories to include exclusively
-            included_files (List[str], optional): List of file patterns to include exclusively
+            excluded_dirs (List[str], optional): Accepted for compatibility, applied at query time
+            excluded_files (List[str], optional): Accepted for compatibility, applied at query time
+            included_dirs (List[str], optional): Accepted for compatibility, applied at query time
+            included_files (List[str], optional): Accepted for compatibility, applied at query time
 
         Returns:
             List[Document]: List of Document objects
@@ -847,36 +1135,211 @@ class DatabaseManager:
         # Handle backward compatibility
         if embedder_type is None and is_ollama_embedder is not None:
             embedder_type = 'ollama' if is_ollama_embedder else None
-        # check the database
-        if self.repo_paths and os.path.exists(self.repo_paths["save_db_file"]):
+        if has_custom_file_filters(excluded_dirs, excluded_files, included_dirs, included_files):
+            logger.info("Custom file filters will be applied at query time against the full repository index")
+        # check the database, fetching it from the shared storage when another node built it
+        if self.repo_paths and self.storage.fetch(self.repo_paths["save_db_file"], embedder_type):
+            if load_index_meta(self.repo_paths["save_db_file"]).get("format") != INDEX_FORMAT:
+                logger.info("Existing database predates the full repository index, rebuilding it")
+                return self._create_db_index(embedder_type)
             logger.info("Loading existing database...")
             try:
                 self.db = LocalDB.load_state(self.repo_paths["save_db_file"])
                 documents = self.db.get_transformed_data(key="split_and_embed")
                 if documents:
                     logger.info(f"Loaded {len(documents)} documents from existing database")
-                    return documents
+                    self._prepare_code_graph(documents)
+                    return self._with_summary_index(documents, embedder_type)
             except Exception as e:
                 logger.error(f"Error loading existing database: {e}")
                 # Continue to create a new database
 
         # prepare the database
         logger.info("Creating new database...")
-        documents = read_all_documents(
-            self.repo_paths["save_repo_dir"],
-            embedder_type=embedder_type,
-            excluded_dirs=excluded_dirs,
-            excluded_files=excluded_files,
-            included_dirs=included_dirs,
-            included_files=included_files
-        )
-        self.db = transform_documents_and_save_to_db(
-            documents, self.repo_paths["save_db_file"], embedder_type=embedder_type
-        )
-        logger.info(f"Total documents: {len(documents)}")
-        transformed_docs = self.db.get_transformed_data(key="split_and_embed")
-        logger.info(f"Total transformed documents: {len(transformed_docs)}")
-        return transformed_docs
+        return self._create_db_index(embedder_type)
+
+    def _create_db_index(self, embedder_type: str = None) -> List[Document]:
+        """
+        Read, split and embed the repository, reusing stored vectors of unchanged chunks.
+
+        A commit that still has a snapshot, e.g. after switching back to an
+        earlier revision, is restored from it without reading or embedding
+        anything. The result is saved as the current database and as a
+        snapshot of the checked-out commit.
+
+        Args:
+            embedder_type (str, optional): Embedder type to use
+
+        Returns:
+            List[Document]: The embedded chunk documents
+        """
+        from api.config import get_embedder_type
+        from api.summary_index import get_repo_revision
+
+        embedder_type = embedder_type or get_embedder_type()
+        save_db_file = self.repo_paths["save_db_file"]
+        revision = get_repo_revision(self.repo_paths["save_repo_dir"]) or WORKTREE_REVISION
+        fingerprint = embedder_fingerprint(embedder_type)
+        store = ChunkStore(os.path.join(os.path.dirname(save_db_file), CHUNK_STORE_FILE))
+        try:
+            transformed_docs = self._restore_snapshot(store, revision, fingerprint)
+            if transformed_docs is None:
+                start = time.perf_counter()
+                documents = read_all_documents(
+                    self.repo_paths["save_repo_dir"],
+                    embedder_type=embedder_type,
+                )
+                self.timings["read"] = time.perf_counter() - start
+                self.build_stats = {
+                    "files": len(documents),
+                    "tokens": sum(doc.meta_data.get("token_count", 0) for doc in documents),
+                }
+                start = time.perf_counter()
+                self.db = transform_documents_and_save_to_db(
+                    documents, save_db_file, embedder_type=embedder_type, chunk_store=store,
+                    embedding_slots=self.embedding_slots, stats=self.build_stats
+                )
+                self.timings["embed"] = time.perf_counter() - start
+                logger.info(f"Total documents: {len(documents)}")
+                self._prepare_code_graph(documents, rebuild=True)
+                transformed_docs = self.db.get_transformed_data(key="split_and_embed")
+                logger.info(f"Total transformed documents: {len(transformed_docs)} at revision {revision}")
+
+            max_snapshots = configs.get("repository", {}).get("max_snapshots", 5)
+            if save_snapshot(save_db_file, revision, fingerprint, transformed_docs, max_snapshots):
+                collect_garbage(store, os.path.dirname(save_db_file))
+        finally:
+            store.close()
+        self.storage.publish(save_db_file)
+        return self._with_summary_index(transformed_docs, embedder_type)
+
+    def _restore_snapshot(self, store: ChunkStore, revision: str, fingerprint: str) -> Optional[List[Document]]:
+        """
+        Make the snapshot of an earlier indexed commit the current database again.
+
+        Args:
+            store (ChunkStore): Chunk store holding the snapshot's vectors
+            revision (str): Commit to restore
+            fingerprint (str): Fingerprint of the embedder the snapshot must have been built with
+
+        Returns:
+            Optional[List[Document]]: The restored chunk documents, or None if the commit has no usable snapshot
+        """
+        save_db_file = self.repo_paths["save_db_file"]
+        recorded = [snapshot["revision"] for snapshot in load_index_meta(save_db_file).get("snapshots", [])]
+        # The work tree of a directory that is not a git checkout may have changed since
+        if revision == WORKTREE_REVISION or revision not in recorded:
+            return None
+        start = time.perf_counter()
+        documents = load_snapshot(save_db_file, revision, store, fingerprint)
+        if documents is None:
+            return None
+        self.db = LocalDB()
+        self.db.transformed_items["split_and_embed"] = documents
+        self.db.save_state(filepath=save_db_file)
+        self.timings["restore"] = time.perf_counter() - start
+        file_tokens = {doc.meta_data.get("file_path"): doc.meta_data.get("token_count", 0) for doc in documents}
+        self.build_stats = {"files": len(file_tokens), "tokens": sum(file_tokens.values()),
+                            "reused": len(documents), "embedded": 0, "failed": 0}
+        self._prepare_code_graph(documents, rebuild=True)
+        logger.info(f"Restored {len(documents)} chunks of revision {revision} from its snapshot")
+        return documents
+
+    def refresh_database(self, repo_url_or_path: str, repo_type: str = None, access_token: str = None,
+                         embedder_type: str = None) -> List[Document]:
+        """
+        Update the repository to its latest commit and re-index what changed.
+
+        Cloned repositories are fetched from their remote; local paths are
+        re-read as they are. Only chunks whose text changed are embedded again,
+        and the previous index stays available as a snapshot of its commit.
+
+        Args:
+            repo_url_or_path (str): The URL or local path of the repository
+            repo_type (str, optional): Type of repository
+            access_token (str, optional): Access token for private repositories
+            embedder_type (str, optional): Embedder type to use
+
+        Returns:
+            List[Document]: The embedded chunk documents of the latest commit
+        """
+        from api.config import get_embedder_type
+        from api.summary_index import get_repo_revision
+
+        embedder_type = embedder_type or get_embedder_type()
+        self.reset_database()
+        self._create_repo(repo_url_or_path, repo_type, access_token)
+        save_repo_dir = self.repo_paths["save_repo_dir"]
+        if repo_url_or_path.strip().startswith(("https://", "http://")) and "clone" not in self.timings:
+            start = time.perf_counter()
+            refresh_repo(save_repo_dir, access_token)
+            self.timings["fetch"] = time.perf_counter() - start
+
+        revision = get_repo_revision(save_repo_dir) or WORKTREE_REVISION
+        self.storage.fetch(self.repo_paths["save_db_file"], embedder_type)
+        meta = load_index_meta(self.repo_paths["save_db_file"])
+        if (revision != WORKTREE_REVISION and meta.get("revision") == revision
+                and meta.get("embedder") == embedder_fingerprint(embedder_type)
+                and os.path.exists(self.repo_paths["save_db_file"])):
+            logger.info(f"Index of {repo_url_or_path} is already at {revision}")
+            return self.prepare_db_index(embedder_type=embedder_type)
+
+        logger.info(f"Refreshing index of {repo_url_or_path} from {meta.get('revision')} to {revision}")
+        return self._create_db_index(embedder_type)
+
+    def _prepare_code_graph(self, documents: List[Document], rebuild: bool = False) -> None:
+        """
+        Load the import graph stored with the database, building it when needed.
+
+        Args:
+            documents (List[Document]): Whole-file documents at ingest, or the stored chunks
+            rebuild (bool): Ignore a stored graph, e.g. when the database was just recreated
+        """
+        self.code_graph = None
+        if not configs.get("code_graph", {}).get("enabled"):
+            return
+
+        from api.code_graph import CodeGraph, build_code_graph, code_graph_path
+
+        graph_path = code_graph_path(self.repo_paths["save_db_file"])
+        if not rebuild:
+            self.code_graph = CodeGraph.load(graph_path)
+        if self.code_graph is None:
+            self.code_graph = build_code_graph(documents)
+            try:
+                self.code_graph.save(graph_path)
+            except OSError as e:
+                logger.warning(f"Could not save code graph: {e}")
+
+    def _with_summary_index(self, documents: List[Document], embedder_type: str = None) -> List[Document]:
+        """
+        Append the directory summary nodes of the current revision, if enabled.
+
+        Missing or stale summaries are rebuilt in the background and picked up
+        by the next request once ready.
+
+        Args:
+            documents (List[Document]): Chunk documents of the repository
+            embedder_type (str, optional): Embedder used for the chunks
+
+        Returns:
+            List[Document]: The chunk documents, followed by the summary nodes when available
+        """
+        if not configs.get("summary_index", {}).get("enabled"):
+            return documents
+
+        from api.summary_index import get_repo_revision, load_summary_nodes, schedule_summary_index, summary_index_path
+
+        summary_path = summary_index_path(self.repo_paths["save_db_file"])
+        revision = get_repo_revision(self.repo_paths["save_repo_dir"], self.repo_paths["save_db_file"])
+        nodes = load_summary_nodes(summary_path, revision)
+        if nodes is None:
+            repo_name = os.path.basename(self.repo_paths["save_repo_dir"].rstrip(os.sep))
+            schedule_summary_index(documents, repo_name, summary_path, revision, embedder_type)
+            return documents
+
+        logger.info(f"Loaded {len(nodes)} directory summaries")
+        return documents + nodes
 
     def prepare_retriever(self, repo_url_or_path: str, repo_type: str = None, access_token: str = None):
         """
@@ -0,0 +1,178 @@
+"""Server-orchestrated Deep Research: plan sub-questions, retrieve for all of them at once, analyse them concurrently and conclude."""
+
+import asyncio
+import logging
+import re
+import time
+from contextlib import aclosing
+from typing import AsyncIterator, Dict, List, Optional, Sequence, Tuple
+
+from api.config import configs
+from api.context_packer import count_model_tokens, get_context_budget, pack_context
+from api.federated_search import federated_retrieve
+from api.generation import generate_text
+from api.prompts import DEEP_RESEARCH_ANALYSIS_PROMPT, DEEP_RESEARCH_PLAN_PROMPT, DEEP_RESEARCH_SYNTHESIS_PROMPT
+from api.streaming import stream_answer
+
+logger = logging.getLogger(__name__)
+
+# Bullets and numbering the planner may put in front of its sub-questions
+_LIST_MARKER = re.compile(r"^\s*(?:[-*•]|\d+[.)])\s*")
+
+
+def parse_subquestions(text: str, max_questions: int) -> List[str]:
+    """
+    Sub-questions from the planner's answer, one per line.
+
+    Args:
+        text: The planner's answer
+        max_questions: Maximum number of sub-questions kept
+
+    Returns:
+        List of sub-questions without list markers, headings, lead-ins or duplicates
+    """
+    questions = []
+    for line in text.splitlines():
+        question = _LIST_MARKER.sub("", line).strip().strip('"')
+        # Headings, tags and lead-ins such as "Sub-questions:" are not questions
+        if not question or question.startswith(("#", "<")) or question.endswith(":"):
+            continue
+        if question not in questions:
+            questions.append(question)
+    return questions[:max_questions]
+
+
+def _finish_prompt(prompt: str, query: str, provider: str) -> str:
+    prompt += f"<query>\n{query}\n</query>\n\nAssistant: "
+    if provider == "ollama":
+        prompt += " /no_think"
+    return prompt
+
+
+async def plan_subquestions(topic: str, prompt_vars: Dict[str, str], provider: str, client, model_kwargs: dict,
+                            max_questions: int) -> List[str]:
+    """
+    Split a research topic into sub-questions with one LLM call.
+
+    Returns:
+        The sub-questions, or the topic itself if planning failed
+    """
+    prompt = DEEP_RESEARCH_PLAN_PROMPT.format(max_questions=max_questions, **prompt_vars) + "\n\n"
+    try:
+        plan = await generate_text(provider, client, model_kwargs, _finish_prompt(prompt, topic, provider))
+    except Exception as e:
+        logger.error(f"Error planning Deep Research sub-questions: {str(e)}")
+        plan = ""
+    return parse_subquestions(plan, max_questions) or [topic]
+
+
+def retrieve_contexts(questions: Sequence[str], request_rag, federated_sources: Optional[List[Tuple[str, object]]],
+                      token_budget: int, provider: str = None, model: str = None) -> List[str]:
+    """
+    Retrieve and pack the context of every sub-question.
+
+    With a single repository all sub-questions are embedded in one call and
+    searched in one batch. Federated searches run one query at a time, each
+    searching the repositories in parallel.
+
+    Args:
+        questions: The sub-questions
+        request_rag: RAG with the prepared retriever
+        federated_sources: (label, prepared RAG) pairs to search together, or None
+        token_budget: Tokens available for each sub-question's context
+        provider: Model provider, used to count tokens
+        model: Model name, used to count tokens
+
+    Returns:
+        Packed context text of each sub-question, in order
+    """
+    if federated_sources:
+        results = [federated_retrieve(federated_sources, question, token_budget, provider, model)[0]
+                   for question in questions]
+    else:
+        results = request_rag.retrieve_many(list(questions), token_budget, provider, model)
+    return [pack_context(result.documents or [], token_budget, provider, model).text for result in results]
+
+
+async def run_deep_research(topic: str, request_rag, federated_sources, prompt_vars: Dict[str, str], provider: str,
+                            model: Optional[str], client, model_kwargs: dict) -> AsyncIterator[str]:
+    """
+    Research a topic in one answer, instead of one client round trip per iteration.
+
+    The topic is split into sub-questions, their contexts are retrieved
+    together, and the sub-questions are analysed concurrently, at most
+    ``deep_research.max_concurrency`` LLM calls at a time. Progress streams as
+    the answer itself: the plan first, each finding as soon as its analysis
+    completes, then the conclusion drawn from all findings.
+
+    Args:
+        topic: The research topic
+        request_rag: RAG with the prepared retriever
+        federated_sources: (label, prepared RAG) pairs to search together, or None
+        prompt_vars: repo_type, repo_url, repo_name and language_name for the prompts
+        provider: Model provider
+        model: Model name, used to count tokens
+        client: Model client from get_model_client
+        model_kwargs: Model parameters from get_model_client
+
+    Yields:
+        Text of the answer
+    """
+    research_config = configs.get("deep_research", {})
+    max_questions = research_config.get("max_subquestions", 5)
+    semaphore = asyncio.Semaphore(research_config.get("max_concurrency", 3))
+    started = time.perf_counter()
+
+    questions = await plan_subquestions(topic, prompt_vars, provider, client, model_kwargs, max_questions)
+    logger.info(f"Deep Research plan with {len(questions)} sub-questions")
+    yield "## Research Plan\n\n" + "".join(f"{i}. {question}\n" for i, question in enumerate(questions, 1)) + "\n"
+
+    analysis_prompt = DEEP_RESEARCH_ANALYSIS_PROMPT.format(topic=topic, **prompt_vars) + "\n\n"
+    prompt_tokens = count_model_tokens(analysis_prompt + max(questions, key=len), provider, model)
+    token_budget = get_context_budget(provider, model, prompt_tokens)
+    try:
+        contexts = await asyncio.to_thread(retrieve_contexts, questions, request_rag, federated_sources,
+                                           token_budget, provider, model)
+    except Exception as e:
+        logger.error(f"Error in Deep Research retrieval: {str(e)}")
+        contexts = [""] * len(questions)
+
+    async def analyse(index: int) -> Tuple[int, str]:
+        prompt = analysis_prompt
+        if contexts[index].strip():
+            prompt += f"<START_OF_CONTEXT>\n{contexts[index]}\n<END_OF_CONTEXT>\n\n"
+        else:
+            prompt += "<note>No relevant context was found in the repository.</note>\n\n"
+        async with semaphore:
+            try:
+                finding = await generate_text(provider, client, model_kwargs,
+                                              _finish_prompt(prompt, questions[index], provider))
+            except Exception as e:
+                logger.error(f"Error analysing Deep Research sub-question {index + 1}: {str(e)}")
+                finding = f"_This sub-question could not be analysed: {str(e)}_"
+        return index, finding.strip()
+
+    yield "## Findings\n\n"
+    findings = [""] * len(questions)
+    tasks = [asyncio.create_task(analyse(index)) for index in range(len(questions))]
+    try:
+        for next_finding in asyncio.as_completed(tasks):
+            index, finding = await next_finding
+            findings[index] = finding
+            yield f"### {questions[index]}\n\n{finding}\n\n"
+    finally:
+        # The client may be gone, stop the analyses still running
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    logger.info(f"Deep Research findings ready after {time.perf_counter() - started:.1f}s")
+
+    synthesis_prompt = DEEP_RESEARCH_SYNTHESIS_PROMPT.format(**prompt_vars) + "\n\n<research_findings>\n"
+    for question, finding in zip(questions, findings):
+        synthesis_prompt += f"<finding>\n<question>{question}</question>\n{finding}\n</finding>\n"
+    synthesis_prompt += "</research_findings>\n\n"
+    conclusion = stream_answer(provider, client, model_kwargs, _finish_prompt(synthesis_prompt, topic, provider))
+    async with aclosing(conclusion):
+        async for text in conclusion:
+            yield text
+    logger.info(f"Deep Research on {len(questions)} sub-questions took {time.perf_counter() - started:.1f}s")
@@ -0,0 +1,140 @@
+"""Search several indexed repositories with one query and merge the results."""
+
+import logging
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Sequence, Tuple
+
+from adalflow.core.types import Document, RetrieverOutput
+
+from api.config import configs, get_embedder_type
+from api.context_packer import fit_to_token_budget
+from api.rag import RAG
+from api.retriever import choose_top_k
+
+logger = logging.getLogger(__name__)
+
+# Prepared RAG instances of secondary repositories, most recently used last
+_rag_cache: "OrderedDict[Tuple[str, str, str], RAG]" = OrderedDict()
+_rag_cache_lock = threading.Lock()
+
+
+def repo_label(repo_url_or_path: str) -> str:
+    """
+    Short name used to tell repositories apart in merged results.
+
+    Args:
+        repo_url_or_path: Repository URL or local path
+
+    Returns:
+        str: "owner/repo" for URLs, the directory name for local paths
+    """
+    path = repo_url_or_path.rstrip("/")
+    if path.endswith(".git"):
+        path = path[:-4]
+    parts = path.split("/")
+    if repo_url_or_path.startswith(("http://", "https://")):
+        return "/".join(parts[-2:])
+    return parts[-1]
+
+
+def get_cached_rag(repo_url_or_path: str, repo_type: str = "github", access_token: str = None,
+                   provider: str = "google", model: str = None) -> RAG:
+    """
+    Get a prepared RAG for a repository, keeping recently used ones warm in memory.
+
+    Args:
+        repo_url_or_path: Repository URL or local path
+        repo_type: Type of repository
+        access_token: Optional access token for private repositories
+        provider: Model provider of the request
+        model: Model name of the request
+
+    Returns:
+        RAG: Instance with its retriever prepared over the full repository index
+    """
+    key = (repo_url_or_path, repo_type, get_embedder_type())
+    with _rag_cache_lock:
+        if key in _rag_cache:
+            _rag_cache.move_to_end(key)
+            return _rag_cache[key]
+
+    rag = RAG(provider=provider, model=model)
+    rag.prepare_retriever(repo_url_or_path, repo_type, access_token)
+
+    max_cached = configs.get("federated_search", {}).get("max_cached_repos", 8)
+    with _rag_cache_lock:
+        _rag_cache[key] = rag
+        _rag_cache.move_to_end(key)
+        while len(_rag_cache) > max_cached:
+            evicted, _ = _rag_cache.popitem(last=False)
+            logger.info(f"Evicted {evicted[0]} from the federated search cache")
+    return rag
+
+
+def clear_rag_cache() -> None:
+    """Drop all cached repositories."""
+    with _rag_cache_lock:
+        _rag_cache.clear()
+
+
+def federated_retrieve(sources: Sequence[Tuple[str, RAG]], query: str, token_budget: Optional[int] = None,
+                       provider: str = None, model: str = None) -> List[RetrieverOutput]:
+    """
+    Search the indexes of several repositories and merge the hits by score.
+
+    The query is embedded once and every index is searched in parallel. Each
+    repository contributes the hits that pass its score drop-off, capped at
+    ``federated_search.max_per_repo``; the merged list is cut to the first
+    retriever's ``max_top_k`` and to the token budget.
+
+    Args:
+        sources: (label, prepared RAG) pairs; the first one embeds the query
+        query: The user's query
+        token_budget: Optional number of tokens available for retrieved context
+        provider: Model provider, used to count tokens against token_budget
+        model: Model name, used to count tokens against token_budget
+
+    Returns:
+        List with one RetrieverOutput whose documents carry a "repo" metadata field
+        and a file_path prefixed with the repository label
+    """
+    max_per_repo = configs.get("federated_search", {}).get("max_per_repo", 15)
+    primary = sources[0][1].retriever
+    xq = primary.embed_queries([query])
+
+    def search(source: Tuple[str, RAG]) -> List[Tuple[float, str, Document]]:
+        label, rag = source
+        retriever = rag.retriever
+        result = retriever.retrieve_embedding_queries(xq, top_k=retriever.max_top_k)[0]
+        scores = list(result.doc_scores or [])
+        k = min(choose_top_k(scores, retriever.min_top_k, retriever.max_score_drop), max_per_repo)
+        return [(scores[i], label, rag.transformed_docs[result.doc_indices[i]]) for i in range(k)]
+
+    with ThreadPoolExecutor(max_workers=len(sources)) as executor:
+        per_repo = list(executor.map(search, sources))
+
+    hits = sorted((hit for hits in per_repo for hit in hits), key=lambda hit: hit[0], reverse=True)
+    hits = hits[:primary.max_top_k]
+    if token_budget is not None:
+        hits = hits[:fit_to_token_budget([doc.text for _, _, doc in hits], token_budget, provider, model)]
+
+    documents = []
+    for _, label, doc in hits:
+        meta_data = dict(doc.meta_data or {})
+        meta_data["repo"] = label
+        meta_data["file_path"] = f"{label}/{meta_data.get('file_path', 'unknown')}"
+        documents.append(Document(text=doc.text, meta_data=meta_data, order=doc.order,
+                                  parent_doc_id=doc.parent_doc_id))
+
+    logger.debug("Federated search: " + ", ".join(
+        f"{label}={len(repo_hits)}" for (label, _), repo_hits in zip(sources, per_repo)
+    ) + f", kept {len(documents)} merged hits, scores={[round(hit[0], 3) for hit in hits]}")
+
+    return [RetrieverOutput(
+        doc_indices=[],
+        doc_scores=[hit[0] for hit in hits],
+        query=query,
+        documents=documents,
+    )]
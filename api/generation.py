@@ -0,0 +1,169 @@
+"""Model client construction and whole-response text generation shared by the chat handlers."""
+
+import asyncio
+import logging
+import threading
+import weakref
+from typing import Any, Dict
+
+import google.generativeai as genai
+from adalflow.components.model_client.ollama_client import OllamaClient
+
+from api.config import OPENROUTER_API_KEY, OPENAI_API_KEY, AWS_ACCESS_KEY_ID, AWS_SECRET_ACCESS_KEY
+from api.openai_client import OpenAIClient
+from api.openrouter_client import OpenRouterClient
+from api.azureai_client import AzureAIClient
+from api.bedrock_client import BedrockClient
+from api.dashscope_client import DashscopeClient
+from api.streaming import stream_text
+
+logger = logging.getLogger(__name__)
+
+PROVIDER_CLIENTS = {
+    "ollama": OllamaClient,
+    "openrouter": OpenRouterClient,
+    "openai": OpenAIClient,
+    "azure": AzureAIClient,
+    "dashscope": DashscopeClient,
+    "bedrock": BedrockClient,
+}
+
+# Provider clients per event loop: their pooled async connections cannot be shared across loops
+_loop_clients: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Dict[str, Any]]" = weakref.WeakKeyDictionary()
+_clients_lock = threading.Lock()
+
+
+def get_provider_client(provider: str):
+    """
+    Shared client of a provider, reused across requests so connections are kept alive.
+
+    Args:
+        provider: Provider name, one of PROVIDER_CLIENTS
+
+    Returns:
+        The provider's model client for the running event loop
+    """
+    loop = asyncio.get_running_loop()
+    with _clients_lock:
+        clients = _loop_clients.setdefault(loop, {})
+        if provider not in clients:
+            clients[provider] = PROVIDER_CLIENTS[provider]()
+        return clients[provider]
+
+
+async def close_provider_clients() -> None:
+    """Close the pooled connections of the clients created on the running event loop."""
+    with _clients_lock:
+        clients = _loop_clients.pop(asyncio.get_running_loop(), {})
+    for provider, client in clients.items():
+        try:
+            if hasattr(client, "aclose"):
+                await client.aclose()
+            elif asyncio.iscoroutinefunction(getattr(getattr(client, "async_client", None), "close", None)):
+                await client.async_client.close()
+        except Exception as e:
+            logger.warning(f"Error closing {provider} client: {e}")
+
+
+def get_model_client(provider: str, model_name: str, model_config: Dict[str, Any]):
+    """
+    Return the shared client of a provider and the model kwargs for a request.
+
+    Must be called from a coroutine, clients are shared per event loop.
+    """
+    if provider == "ollama":
+        model = get_provider_client("ollama")
+        model_kwargs = {
+            "model": model_config["model"],
+            "stream": True,
+            "options": {
+                "temperature": model_config["temperature"],
+                "top_p": model_config["top_p"],
+                "num_ctx": model_config["num_ctx"]
+            }
+        }
+        return model, model_kwargs
+    elif provider == "openrouter":
+        if not OPENROUTER_API_KEY:
+            logger.warning("OPENROUTER_API_KEY not configured")
+        
+        model = get_provider_client("openrouter")
+        model_kwargs = {
+            "model": model_name,
+            "stream": True,
+            "temperature": model_config["temperature"]
+        }
+        if "top_p" in model_config:
+            model_kwargs["top_p"] = model_config["top_p"]
+        return model, model_kwargs
+    elif provider == "openai":
+        if not OPENAI_API_KEY:
+            logger.warning("OPENAI_API_KEY not configured")
+            
+        model = get_provider_client("openai")
+        model_kwargs = {
+            "model": model_name,
+            "stream": True,
+            "temperature": model_config["temperature"]
+        }
+        if "top_p" in model_config:
+            model_kwargs["top_p"] = model_config["top_p"]
+        return model, model_kwargs
+    elif provider == "azure":
+        model = get_provider_client("azure")
+        model_kwargs = {
+            "model": model_name,
+            "stream": True,
+            "temperature": model_config["temperature"],
+            "top_p": model_config.get("top_p")
+        }
+        return model, model_kwargs
+    elif provider == "dashscope":
+        model = get_provider_client("dashscope")
+        model_kwargs = {
+            "model": model_name,
+            "stream": True,
+            "temperature": model_config["temperature"],
+            "top_p": model_config.get("top_p")
+        }
+        return model, model_kwargs
+    elif provider == "bedrock":
+        if not AWS_ACCESS_KEY_ID or not AWS_SECRET_ACCESS_KEY:
+            logger.warning("AWS_ACCESS_KEY_ID or AWS_SECRET_ACCESS_KEY not configured")
+
+        model = get_provider_client("bedrock")
+        model_kwargs = {
+            "model": model_name,
+            "stream": True,
+            "temperature": model_config["temperature"]
+        }
+        if "top_p" in model_config:
+            model_kwargs["top_p"] = model_config["top_p"]
+        return model, model_kwargs
+    else:
+        # Google Generative AI
+        model = genai.GenerativeModel(
+            model_name=model_config["model"],
+            generation_config={
+                "temperature": model_config["temperature"],
+                "top_p": model_config["top_p"],
+                "top_k": model_config.get("top_k")
+            }
+        )
+        return model, {}
+
+
+async def generate_text(provider: str, model: Any, model_kwargs: Dict[str, Any], prompt: str) -> str:
+    """
+    Run a prompt to completion and return the whole response text.
+
+    Args:
+        provider: Model provider the client was created for
+        model: Client returned by get_model_client
+        model_kwargs: Model kwargs returned by get_model_client
+        prompt: The full prompt
+
+    Returns:
+        str: The generated text
+    """
+    return "".join([text async for text in stream_text(provider, model, model_kwargs, prompt)])
@@ -0,0 +1,38 @@
+"""Keep-alive HTTP connection pools for the provider clients, sized by the "http_pool" config."""
+
+import aiohttp
+import httpx
+from openai import DefaultAsyncHttpxClient
+
+from api.config import configs
+
+
+def _pool_config() -> dict:
+    return configs.get("http_pool", {})
+
+
+def async_httpx_client() -> httpx.AsyncClient:
+    """HTTP client for the OpenAI SDK based clients, keeping connections alive between requests."""
+    pool_config = _pool_config()
+    return DefaultAsyncHttpxClient(limits=httpx.Limits(
+        max_connections=pool_config.get("max_connections", 100),
+        max_keepalive_connections=pool_config.get("max_keepalive_connections", 20),
+        keepalive_expiry=pool_config.get("keepalive_seconds", 30),
+    ))
+
+
+def aiohttp_connector() -> aiohttp.TCPConnector:
+    """
+    Connector for aiohttp sessions, keeping connections alive between requests.
+
+    aiohttp has no separate keep-alive pool size, its per-host limit caps
+    concurrent connections, so it comes from ``max_connections_per_host``
+    (0 for no limit below ``max_connections``) rather than from
+    ``max_keepalive_connections``.
+    """
+    pool_config = _pool_config()
+    return aiohttp.TCPConnector(
+        limit=pool_config.get("max_connections", 100),
+        limit_per_host=pool_config.get("max_connections_per_host", 0),
+        keepalive_timeout=pool_config.get("keepalive_seconds", 30),
+    )
@@ -0,0 +1,225 @@
+"""
+Index many repositories offline, ahead of the chat requests that need them.
+
+Repositories are cloned, read and embedded in a process pool; a semaphore
+shared by all workers bounds how many of them embed at the same time.
+Finished repositories are recorded in a state file so an interrupted run
+resumes where it stopped, and chunks embedded before the interruption are
+reused from the chunk store.
+
+Usage: python -m api.index https://github.com/org/repo /path/to/repo --workers 4 --embed-concurrency 2
+       python -m api.index --repos-file repos.txt --state-file nightly.json
+"""
+
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from adalflow.utils import get_adalflow_default_root_path
+
+from api.chunk_store import load_index_meta
+from api.config import get_embedder_type
+from api.data_pipeline import DatabaseManager
+from api.storage import get_storage
+
+logger = logging.getLogger(__name__)
+
+# Semaphore bounding concurrent embedding, set in every worker process
+_embedding_slots = None
+
+
+def guess_repo_type(repo_url_or_path: str) -> str:
+    """
+    Repository type from the host of a URL.
+
+    Args:
+        repo_url_or_path: Repository URL or local path
+
+    Returns:
+        str: "github", "gitlab", "bitbucket", or "local" for paths
+    """
+    if not repo_url_or_path.startswith(("https://", "http://")):
+        return "local"
+    host = urlparse(repo_url_or_path).netloc.lower()
+    for repo_type in ("gitlab", "bitbucket"):
+        if repo_type in host:
+            return repo_type
+    return "github"
+
+
+def read_repo_list(path: str) -> List[Tuple[str, str]]:
+    """
+    Read repositories from a file with one "url-or-path [type]" per line.
+
+    Blank lines and lines starting with # are skipped.
+
+    Args:
+        path: The repository list file
+
+    Returns:
+        List of (repository, type) pairs
+    """
+    repos = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            parts = line.split()
+            if not parts or parts[0].startswith("#"):
+                continue
+            repos.append((parts[0], parts[1] if len(parts) > 1 else guess_repo_type(parts[0])))
+    return repos
+
+
+def load_state(path: str) -> Dict[str, Dict[str, Any]]:
+    """Read the per-repository results of earlier runs, empty if there are none."""
+    if not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read indexing state {path}, starting over: {e}")
+        return {}
+
+
+def save_state(path: str, state: Dict[str, Dict[str, Any]]) -> None:
+    """Write the per-repository results atomically."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def pending_repositories(repos: List[Tuple[str, str]], state: Dict[str, Dict[str, Any]]) -> List[Tuple[str, str]]:
+    """Repositories without a successful result in the state, in their original order."""
+    return [(repo, repo_type) for repo, repo_type in repos if state.get(repo, {}).get("status") != "done"]
+
+
+def _init_worker(embedding_slots) -> None:
+    global _embedding_slots
+    _embedding_slots = embedding_slots
+
+
+def index_repository(repo: str, repo_type: str, access_token: Optional[str] = None,
+                     embedder_type: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Clone or update one repository and bring its index to the latest commit.
+
+    Args:
+        repo: Repository URL or local path
+        repo_type: Type of repository
+        access_token: Optional access token for private repositories
+        embedder_type: Embedder type to use
+
+    Returns:
+        Dict with the status, revision, step timings and chunk/token counts
+    """
+    start = time.perf_counter()
+    db_manager = DatabaseManager(embedding_slots=_embedding_slots, storage=get_storage())
+    try:
+        if repo_type == "local" and not os.path.isdir(repo):
+            raise ValueError(f"Local repository {repo} is not a directory")
+        documents = db_manager.refresh_database(repo, repo_type, access_token, embedder_type=embedder_type)
+    except Exception as e:
+        logger.error(f"Error indexing {repo}: {e}")
+        return {"status": "failed", "error": str(e), "seconds": time.perf_counter() - start,
+                "timings": db_manager.timings}
+    meta = load_index_meta(db_manager.repo_paths["save_db_file"])
+    return {
+        "status": "done",
+        "revision": meta.get("revision"),
+        "seconds": time.perf_counter() - start,
+        "timings": db_manager.timings,
+        "chunks": len(documents),
+        **db_manager.build_stats,
+    }
+
+
+def format_result(repo: str, result: Dict[str, Any]) -> str:
+    """One line summary of an indexing result."""
+    timings = " ".join(f"{step}={seconds:.1f}s" for step, seconds in result.get("timings", {}).items())
+    line = f"{result['status']:6} {repo}  total={result['seconds']:.1f}s {timings}"
+    if result["status"] != "done":
+        return f"{line}  error={result.get('error')}"
+    if "embedded" not in result:
+        return f"{line}  chunks={result['chunks']} (up to date at {(result.get('revision') or '')[:12]})"
+    return (f"{line}  files={result['files']} tokens={result['tokens']} chunks={result['chunks']} "
+            f"embedded={result['embedded']} reused={result['reused']}")
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m api.index", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("repos", nargs="*", help="Repository URLs or local paths")
+    parser.add_argument("--repos-file", help="File with one 'url-or-path [type]' per line")
+    parser.add_argument("--type", help="Repository type for all positional repositories (default: from the URL)")
+    parser.add_argument("--token", default=os.environ.get("DEEPWIKI_INDEX_TOKEN"),
+                        help="Access token for private repositories (default: $DEEPWIKI_INDEX_TOKEN)")
+    parser.add_argument("--embedder", default=None, help="Embedder type (default: the configured one)")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="Repositories indexed in parallel, 0 to index in this process")
+    parser.add_argument("--embed-concurrency", type=int, default=2,
+                        help="Repositories embedding at the same time across all workers")
+    parser.add_argument("--state-file", default=os.path.join(get_adalflow_default_root_path(), "index_state.json"),
+                        help="Progress file used to resume an interrupted run")
+    parser.add_argument("--fresh", action="store_true", help="Ignore the progress of earlier runs")
+    args = parser.parse_args(argv)
+
+    repos = [(repo, args.type or guess_repo_type(repo)) for repo in args.repos]
+    if args.repos_file:
+        repos.extend(read_repo_list(args.repos_file))
+    if not repos:
+        parser.error("no repositories given")
+
+    state = {} if args.fresh else load_state(args.state_file)
+    pending = pending_repositories(repos, state)
+    print(f"Indexing {len(pending)} of {len(repos)} repositories "
+          f"({len(repos) - len(pending)} already done according to {args.state_file})")
+    embedder_type = args.embedder or get_embedder_type()
+    start = time.perf_counter()
+
+    def record(repo: str, result: Dict[str, Any]) -> None:
+        state[repo] = result
+        save_state(args.state_file, state)
+        print(format_result(repo, result), flush=True)
+
+    if args.workers <= 0:
+        for repo, repo_type in pending:
+            record(repo, index_repository(repo, repo_type, args.token, embedder_type))
+    else:
+        with multiprocessing.Manager() as manager:
+            embedding_slots = manager.Semaphore(max(1, args.embed_concurrency))
+            with ProcessPoolExecutor(max_workers=args.workers, initializer=_init_worker,
+                                     initargs=(embedding_slots,)) as executor:
+                futures = {
+                    executor.submit(index_repository, repo, repo_type, args.token, embedder_type): repo
+                    for repo, repo_type in pending
+                }
+                try:
+                    for future in as_completed(futures):
+                        record(futures[future], future.result())
+                except KeyboardInterrupt:
+                    print("Interrupted, progress is saved; run the same command again to resume")
+                    executor.shutdown(wait=False, cancel_futures=True)
+                    return 130
+
+    results = [state[repo] for repo, _ in pending]
+    failed = sum(1 for result in results if result["status"] != "done")
+    print(f"Indexed {len(results) - failed} repositories in {time.perf_counter() - start:.1f}s, "
+          f"{sum(result.get('tokens', 0) for result in results)} tokens read, "
+          f"{sum(result.get('embedded', 0) for result in results)} chunks embedded, {failed} failed")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    from api.logging_config import setup_logging
+
+    setup_logging()
+    sys.exit(main())
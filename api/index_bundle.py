@@ -0,0 +1,293 @@
+"""
+Portable bundles of a repository index, built once and loaded by other nodes.
+
+A bundle is a tar.gz archive holding everything a node needs to serve a
+repository without embedding it again:
+
+    manifest.json       format, repository, commit, embedder and checksums
+    chunks.json         chunk texts and metadata, in index order
+    vectors.npy         float32 embedding matrix, one row per chunk
+    graph.json          import graph sidecar, when the database has one
+    summaries.json      directory summary sidecar, when the database has one
+
+Usage: python -m api.index_bundle export https://github.com/org/repo repo.tar.gz
+       python -m api.index_bundle import repo.tar.gz
+"""
+
+import argparse
+import hashlib
+import io
+import json
+import logging
+import os
+import sys
+import tarfile
+import time
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from adalflow.core.db import LocalDB
+from adalflow.core.types import Document
+from adalflow.utils import get_adalflow_default_root_path
+
+from api.chunk_store import (CHUNK_STORE_FILE, ChunkStore, chunk_key, embedder_fingerprint, load_index_meta,
+                             save_snapshot)
+from api.code_graph import code_graph_path
+from api.config import configs, get_embedder_type
+from api.summary_index import summary_index_path
+
+logger = logging.getLogger(__name__)
+
+BUNDLE_FORMAT = 1
+MANIFEST_FILE = "manifest.json"
+CHUNKS_FILE = "chunks.json"
+VECTORS_FILE = "vectors.npy"
+GRAPH_FILE = "graph.json"
+SUMMARIES_FILE = "summaries.json"
+# Manifest fields an index cannot be installed without
+MANIFEST_KEYS = ("repo", "revision", "embedder", "dimensions", "chunks")
+
+
+def repo_db_file(repo_url_or_path: str, repo_type: str = None) -> str:
+    """
+    Database file a repository is indexed into under ~/.adalflow.
+
+    Args:
+        repo_url_or_path: The URL or local path of the repository
+        repo_type: Type of repository
+
+    Returns:
+        str: Path of the repository's database file
+    """
+    from api.data_pipeline import DatabaseManager
+
+    repo_url_or_path = repo_url_or_path.strip()
+    if repo_url_or_path.startswith(("https://", "http://")):
+        repo_name = DatabaseManager()._extract_repo_name_from_url(repo_url_or_path, repo_type)
+    else:
+        repo_name = os.path.basename(repo_url_or_path.rstrip("/"))
+    return os.path.join(get_adalflow_default_root_path(), "databases", f"{repo_name}.pkl")
+
+
+def _add_bytes(tar: tarfile.TarFile, name: str, data: bytes) -> None:
+    info = tarfile.TarInfo(name)
+    info.size = len(data)
+    info.mtime = int(time.time())
+    tar.addfile(info, io.BytesIO(data))
+
+
+def export_bundle(db_file: str, bundle_path: str) -> Dict[str, Any]:
+    """
+    Write the current index of a repository to a bundle.
+
+    Args:
+        db_file: Database file of the repository
+        bundle_path: Path of the tar.gz bundle to write
+
+    Returns:
+        Dict: The bundle manifest
+
+    Raises:
+        ValueError: If the database is missing, empty, or has no index metadata
+    """
+    if not os.path.exists(db_file):
+        raise ValueError(f"No index found at {db_file}")
+    meta = load_index_meta(db_file)
+    if not meta.get("embedder"):
+        raise ValueError(f"Index {db_file} has no embedder metadata, refresh it before exporting")
+    documents = LocalDB.load_state(db_file).get_transformed_data(key="split_and_embed")
+    if not documents:
+        raise ValueError(f"Index {db_file} has no embedded chunks")
+
+    vectors = np.array([doc.vector for doc in documents], dtype=np.float32)
+    if vectors.ndim != 2:
+        raise ValueError(f"Index {db_file} has chunks with missing or mismatched embeddings")
+    vectors_buffer = io.BytesIO()
+    np.save(vectors_buffer, vectors, allow_pickle=False)
+    files = {
+        CHUNKS_FILE: json.dumps([
+            {"text": doc.text, "meta_data": doc.meta_data, "order": doc.order, "parent_doc_id": doc.parent_doc_id}
+            for doc in documents
+        ]).encode("utf-8"),
+        VECTORS_FILE: vectors_buffer.getvalue(),
+    }
+    for name, path in ((GRAPH_FILE, code_graph_path(db_file)), (SUMMARIES_FILE, summary_index_path(db_file))):
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                files[name] = f.read()
+
+    manifest = {
+        "format": BUNDLE_FORMAT,
+        "repo": os.path.splitext(os.path.basename(db_file))[0],
+        "revision": meta.get("revision"),
+        "embedder": meta["embedder"],
+        "dimensions": int(vectors.shape[1]),
+        "chunks": len(documents),
+        "created": int(time.time()),
+        "checksums": {name: hashlib.sha256(data).hexdigest() for name, data in files.items()},
+    }
+    os.makedirs(os.path.dirname(os.path.abspath(bundle_path)), exist_ok=True)
+    tmp_path = bundle_path + ".tmp"
+    with tarfile.open(tmp_path, "w:gz") as tar:
+        _add_bytes(tar, MANIFEST_FILE, json.dumps(manifest, indent=2).encode("utf-8"))
+        for name, data in files.items():
+            _add_bytes(tar, name, data)
+    os.replace(tmp_path, bundle_path)
+    logger.info(f"Exported {len(documents)} chunks of {manifest['repo']} at {manifest['revision']} to {bundle_path}")
+    return manifest
+
+
+def read_bundle(bundle_path: str) -> Dict[str, bytes]:
+    """
+    Read the files of a bundle and verify them against the manifest checksums.
+
+    Only the files a bundle is known to contain are read; nothing is extracted
+    to disk.
+
+    Args:
+        bundle_path: Path of the tar.gz bundle
+
+    Returns:
+        Dict mapping file names to their content
+
+    Raises:
+        ValueError: If the bundle is unreadable, of an unknown format, incomplete or corrupted
+    """
+    try:
+        with tarfile.open(bundle_path, "r:gz") as tar:
+            files = {}
+            for member in tar.getmembers():
+                if member.isfile() and member.name in (MANIFEST_FILE, CHUNKS_FILE, VECTORS_FILE, GRAPH_FILE,
+                                                       SUMMARIES_FILE):
+                    files[member.name] = tar.extractfile(member).read()
+    except (OSError, tarfile.TarError) as e:
+        raise ValueError(f"Could not read index bundle {bundle_path}: {e}")
+
+    if MANIFEST_FILE not in files:
+        raise ValueError(f"{bundle_path} is not an index bundle, it has no {MANIFEST_FILE}")
+    manifest = json.loads(files[MANIFEST_FILE])
+    if not isinstance(manifest, dict):
+        raise ValueError(f"Index bundle {bundle_path} has an invalid {MANIFEST_FILE}")
+    if manifest.get("format") != BUNDLE_FORMAT:
+        raise ValueError(f"Unsupported index bundle format {manifest.get('format')}, expected {BUNDLE_FORMAT}")
+    missing = [key for key in MANIFEST_KEYS if key not in manifest]
+    if missing:
+        raise ValueError(f"Index bundle {bundle_path} has no {', '.join(missing)} in its {MANIFEST_FILE}")
+    for key in ("dimensions", "chunks"):
+        if not isinstance(manifest[key], int) or isinstance(manifest[key], bool) or manifest[key] < 0:
+            raise ValueError(f"Index bundle {bundle_path} has an invalid {key}: {manifest[key]!r}")
+    for name, checksum in manifest.get("checksums", {}).items():
+        if name not in files or hashlib.sha256(files[name]).hexdigest() != checksum:
+            raise ValueError(f"Index bundle {bundle_path} is corrupted: {name} does not match its checksum")
+    for name in (CHUNKS_FILE, VECTORS_FILE):
+        if name not in manifest.get("checksums", {}):
+            raise ValueError(f"Index bundle {bundle_path} has no {name}")
+    return files
+
+
+def _check_file_name(bundle_path: str, field: str, value: Any) -> None:
+    """Reject manifest values used in file names that could point outside the databases directory."""
+    if (not isinstance(value, str) or not value or value == "." or ".." in value
+            or "/" in value or "\\" in value or value != os.path.basename(value)):
+        raise ValueError(f"Index bundle {bundle_path} has an invalid {field}: {value!r}")
+
+
+def import_bundle(bundle_path: str, embedder_type: str = None, databases_dir: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Install a bundle as the current index of its repository.
+
+    The chunks are added to the local chunk store and recorded as a snapshot
+    of the bundle's commit, so a later refresh embeds only what changed since.
+
+    Args:
+        bundle_path: Path of the tar.gz bundle
+        embedder_type: Embedder this node queries with, defaults to the configured one
+        databases_dir: Directory of the databases, defaults to ~/.adalflow/databases
+
+    Returns:
+        Dict: The bundle manifest
+
+    Raises:
+        ValueError: If the bundle is corrupted, names an unsafe repository or was embedded with another model
+    """
+    files = read_bundle(bundle_path)
+    manifest = json.loads(files[MANIFEST_FILE])
+    # Bundles may come from shared storage, their names must stay inside the databases directory
+    _check_file_name(bundle_path, "repository name", manifest.get("repo"))
+    _check_file_name(bundle_path, "revision", manifest.get("revision"))
+    fingerprint = embedder_fingerprint(embedder_type or get_embedder_type())
+    if manifest["embedder"] != fingerprint:
+        raise ValueError(
+            f"Index bundle of {manifest['repo']} was embedded with embedder {manifest['embedder']}, "
+            f"this node uses {fingerprint}; re-index the repository instead"
+        )
+
+    chunks = json.loads(files[CHUNKS_FILE])
+    vectors = np.load(io.BytesIO(files[VECTORS_FILE]), allow_pickle=False)
+    if vectors.shape != (manifest["chunks"], manifest["dimensions"]) or len(chunks) != manifest["chunks"]:
+        raise ValueError(f"Index bundle {bundle_path} does not match its manifest: {len(chunks)} chunks, "
+                         f"vectors of shape {vectors.shape}")
+
+    documents: List[Document] = []
+    for entry, vector in zip(chunks, vectors):
+        doc = Document(text=entry["text"], meta_data=entry["meta_data"], order=entry["order"],
+                       parent_doc_id=entry["parent_doc_id"])
+        doc.vector = vector.tolist()
+        documents.append(doc)
+
+    databases_dir = databases_dir or os.path.join(get_adalflow_default_root_path(), "databases")
+    db_file = os.path.join(databases_dir, f"{manifest['repo']}.pkl")
+    os.makedirs(databases_dir, exist_ok=True)
+    store = ChunkStore(os.path.join(databases_dir, CHUNK_STORE_FILE))
+    try:
+        store.put((chunk_key(doc.text, fingerprint), doc.text, doc.vector) for doc in documents)
+    finally:
+        store.close()
+    db = LocalDB()
+    db.transformed_items["split_and_embed"] = documents
+    db.save_state(filepath=db_file)
+    save_snapshot(db_file, manifest["revision"], fingerprint, documents,
+                  configs.get("repository", {}).get("max_snapshots", 5))
+
+    for name, path in ((GRAPH_FILE, code_graph_path(db_file)), (SUMMARIES_FILE, summary_index_path(db_file))):
+        if name in files:
+            with open(path, "wb") as f:
+                f.write(files[name])
+        elif os.path.exists(path):
+            # A sidecar of an older index would not match the imported chunks
+            os.remove(path)
+
+    logger.info(f"Imported {len(documents)} chunks of {manifest['repo']} at {manifest['revision']} into {db_file}")
+    return manifest
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(prog="python -m api.index_bundle", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    commands = parser.add_subparsers(dest="command", required=True)
+    export_parser = commands.add_parser("export", help="Write the index of a repository to a bundle")
+    export_parser.add_argument("repo", help="Repository URL or local path, as it was indexed")
+    export_parser.add_argument("bundle", help="Path of the bundle to write")
+    export_parser.add_argument("--type", default="github", help="Repository type (default: github)")
+    import_parser = commands.add_parser("import", help="Install a bundle as the index of its repository")
+    import_parser.add_argument("bundle", help="Path of the bundle to read")
+    import_parser.add_argument("--embedder", default=None, help="Embedder type (default: the configured one)")
+    args = parser.parse_args(argv)
+
+    try:
+        if args.command == "export":
+            manifest = export_bundle(repo_db_file(args.repo, args.type), args.bundle)
+        else:
+            manifest = import_bundle(args.bundle, embedder_type=args.embedder)
+    except ValueError as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    print(f"{args.command}ed {manifest['chunks']} chunks of {manifest['repo']} at {manifest['revision']}")
+    return 0
+
+
+if __name__ == "__main__":
+    from api.logging_config import setup_logging
+
+    setup_logging()
+    sys.exit(main())
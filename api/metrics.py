@@ -0,0 +1,80 @@
+"""In-process counters for the chat streams, served in the Prometheus text format on /metrics."""
+
+import threading
+from collections import defaultdict
+from typing import Dict, Tuple
+
+# Counter names and their help text
+COUNTERS = {
+    "deepwiki_streams_total": "Provider response streams by outcome (completed, cancelled, failed).",
+    "deepwiki_stream_output_tokens_total": "Output tokens streamed by providers, by outcome.",
+    "deepwiki_cancelled_tokens_saved_total": "Estimated output tokens not generated because the client disconnected.",
+    "deepwiki_client_disconnects_total": "Websocket clients that disconnected before their answer was complete.",
+    "deepwiki_stream_resumes_total": "Websocket clients that reconnected to resume an answer stream.",
+    "deepwiki_session_turns_total": "Turns answered on persistent websocket sessions.",
+}
+
+_lock = threading.Lock()
+_values: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], float] = defaultdict(float)
+
+
+def _key(name: str, labels: Dict[str, str]) -> Tuple[str, Tuple[Tuple[str, str], ...]]:
+    if name not in COUNTERS:
+        raise ValueError(f"Unknown metric: {name}")
+    return name, tuple(sorted((label, str(value)) for label, value in labels.items()))
+
+
+def increment(name: str, value: float = 1, **labels: str) -> None:
+    """
+    Add to a counter.
+
+    Args:
+        name: Counter name, one of COUNTERS
+        value: Amount to add
+        **labels: Label values of the series
+    """
+    with _lock:
+        _values[_key(name, labels)] += value
+
+
+def get_value(name: str, **labels: str) -> float:
+    """Current value of one counter series, 0 if it was never incremented."""
+    with _lock:
+        return _values.get(_key(name, labels), 0)
+
+
+def render() -> str:
+    """All counters in the Prometheus text exposition format."""
+    with _lock:
+        values = dict(_values)
+    lines = []
+    for name, help_text in COUNTERS.items():
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} counter")
+        for (series_name, labels), value in sorted(values.items()):
+            if series_name != name:
+                continue
+            label_text = ",".join(f'{label}="{label_value}"' for label, label_value in labels)
+            lines.append(f"{name}{{{label_text}}} {value:g}" if label_text else f"{name} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+def record_stream(provider: str, outcome: str, output_tokens: int) -> None:
+    """
+    Record a finished provider stream.
+
+    For a cancelled stream the tokens saved are estimated as the average
+    length of the provider's completed answers minus what was already generated.
+
+    Args:
+        provider: Model provider
+        outcome: "completed", "cancelled" or "failed"
+        output_tokens: Output tokens generated before the stream ended
+    """
+    if outcome == "cancelled":
+        completed = get_value("deepwiki_streams_total", provider=provider, outcome="completed")
+        if completed:
+            average = get_value("deepwiki_stream_output_tokens_total", provider=provider, outcome="completed") / completed
+            increment("deepwiki_cancelled_tokens_saved_total", max(average - output_tokens, 0), provider=provider)
+    increment("deepwiki_streams_total", provider=provider, outcome=outcome)
+    increment("deepwiki_stream_output_tokens_total", output_tokens, provider=provider, outcome=outcome)
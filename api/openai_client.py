@@ -201,7 +201,9 @@ class OpenAIClient(ModelClient):
             raise ValueError(
                 f"Environment variable {self._env_api_key_name} must be set"
             )
-        return AsyncOpenAI(api_key=api_key, base_url=self.base_url)
+        from api.http_pool import async_httpx_client
+
+        return AsyncOpenAI(api_key=api_key, base_url=self.base_url, http_client=async_httpx_client())
 
     # def _parse_chat_completion(self, completion: ChatCompletion) -> "GeneratorOutput":
     #     # TODO: raw output it is better to save the whole completion as a source of truth instead of just the message
@@ -1,8 +1,11 @@
+import hashlib
 import logging
+import threading
 import weakref
 import re
+from collections import OrderedDict
 from dataclasses import dataclass
-from typing import Any, List, Tuple, Dict
+from typing import Any, Awaitable, Callable, List, Optional, Tuple, Dict
 from uuid import uuid4
 
 import adalflow as adal
@@ -38,9 +41,13 @@ class CustomConversation:
         self.dialog_turns.append(dialog_turn)
 
 # Import other adalflow components
-from adalflow.components.retriever.faiss_retriever import FAISSRetriever
 from api.config import configs
+from api.code_graph import expand_with_neighbours
+from api.context_packer import count_model_tokens, fit_to_token_budget, merge_file_chunks
 from api.data_pipeline import DatabaseManager
+from api.retriever import RepoRetriever, build_embedding_matrix, choose_top_k
+from api.storage import get_storage
+from api.summary_index import root_summary
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -48,23 +55,122 @@ logger = logging.getLogger(__name__)
 # Maximum token limit for embedding models
 MAX_INPUT_TOKENS = 7500  # Safe threshold below 8192 token limit
 
-class Memory(adal.core.component.DataComponent):
-    """Simple conversation management with a list of dialog turns."""
+# Running summaries of conversation prefixes, by digest of the turns they cover
+_summary_cache: "OrderedDict[str, str]" = OrderedDict()
+_summary_cache_lock = threading.Lock()
 
-    def __init__(self):
+
+def format_dialog_turn(turn: DialogTurn) -> str:
+    """A dialog turn as it appears in the conversation history of a prompt."""
+    return f"<turn>\n<user>{turn.user_query.query_str}</user>\n<assistant>{turn.assistant_response.response_str}</assistant>\n</turn>\n"
+
+
+def _prefix_digests(turns: List[DialogTurn]) -> List[str]:
+    """Digest of every prefix of a conversation, the i-th covering the first i + 1 turns."""
+    digests = []
+    digest = hashlib.sha256()
+    for turn in turns:
+        digest.update(format_dialog_turn(turn).encode("utf-8"))
+        digests.append(digest.copy().hexdigest())
+    return digests
+
+
+class Memory(adal.core.component.DataComponent):
+    """
+    Simple conversation management with a list of dialog turns.
+
+    With a token budget, only the newest turns that fit the budget are returned
+    verbatim and older turns are folded into a running summary. The summary is
+    updated by refresh_summary after an answer, off the critical path, and is
+    cached by the turns it covers, so a request resending the same history
+    picks it up. Until a summary covers them, older turns stay verbatim.
+
+    Args:
+        token_budget: Tokens for the verbatim turns, None to keep the whole history verbatim
+        provider: Model provider, used to count tokens
+        model: Model name, used to count tokens
+    """
+
+    def __init__(self, token_budget: Optional[int] = None, provider: str = None, model: str = None):
         super().__init__()
         # Use our custom implementation instead of the original Conversation class
         self.current_conversation = CustomConversation()
+        self.token_budget = token_budget
+        self.provider = provider
+        self.model = model
+        # Summary of the first summarized_turns turns
+        self.summary = ""
+        self.summarized_turns = 0
+
+    def _dialog_turns(self) -> List[DialogTurn]:
+        return list(getattr(self.current_conversation, 'dialog_turns', None) or [])
+
+    def recent_window_start(self, turns: List[DialogTurn]) -> int:
+        """Index of the oldest turn kept verbatim: the newest turns within the token budget, at least the last one."""
+        newest_first = [format_dialog_turn(turn) for turn in reversed(turns)]
+        return len(turns) - fit_to_token_budget(newest_first, self.token_budget, self.provider, self.model)
+
+    def _use_cached_summary(self, turns: List[DialogTurn], window_start: int) -> None:
+        """Take the cached summary covering the most turns before the verbatim window, if one is newer than ours."""
+        if window_start <= self.summarized_turns:
+            return
+        digests = _prefix_digests(turns[:window_start])
+        with _summary_cache_lock:
+            for covered in range(window_start, self.summarized_turns, -1):
+                summary = _summary_cache.get(digests[covered - 1])
+                if summary is not None:
+                    _summary_cache.move_to_end(digests[covered - 1])
+                    self.summary, self.summarized_turns = summary, covered
+                    return
+
+    def _summary_boundary(self) -> int:
+        """Number of leading turns covered by the summary and left out of the verbatim history."""
+        turns = self._dialog_turns()
+        self._use_cached_summary(turns, self.recent_window_start(turns))
+        return self.summarized_turns
+
+    async def refresh_summary(self, summarize: Callable[[str, List[DialogTurn]], Awaitable[str]]) -> bool:
+        """
+        Fold the turns that no longer fit the token budget into the running summary.
+
+        Args:
+            summarize: Coroutine function taking the previous summary and the turns to fold in, returning the new summary
+
+        Returns:
+            bool: True if the summary was updated
+        """
+        if not self.token_budget:
+            return False
+        turns = self._dialog_turns()
+        window_start = self.recent_window_start(turns)
+        self._use_cached_summary(turns, window_start)
+        covered = self.summarized_turns
+        if window_start <= covered:
+            return False
+
+        summary = await summarize(self.summary, turns[covered:window_start])
+        digest = _prefix_digests(turns[:window_start])[-1]
+        cache_size = configs.get("conversation_memory", {}).get("summary_cache_size", 512)
+        with _summary_cache_lock:
+            _summary_cache[digest] = summary
+            while len(_summary_cache) > cache_size:
+                _summary_cache.popitem(last=False)
+        if window_start > self.summarized_turns:
+            self.summary, self.summarized_turns = summary, window_start
+        logger.info(f"Conversation summary now covers {window_start} of {len(turns)} turns")
+        return True
 
     def call(self) -> Dict:
-        """Return the conversation history as a dictionary."""
+        """Return the conversation history as a dictionary, without the turns covered by the summary."""
         all_dialog_turns = {}
         try:
             # Check if dialog_turns exists and is a list
             if hasattr(self.current_conversation, 'dialog_turns'):
                 if self.current_conversation.dialog_turns:
                     logger.info(f"Memory content: {len(self.current_conversation.dialog_turns)} turns")
-                    for i, turn in enumerate(self.current_conversation.dialog_turns):
+                    # Turns covered by the summary are left out
+                    first = self._summary_boundary() if self.token_budget else 0
+                    for i, turn in enumerate(self.current_conversation.dialog_turns[first:], start=first):
                         if hasattr(turn, 'id') and turn.id is not None:
                             all_dialog_turns[turn.id] = turn
                             logger.info(f"Added turn {i+1} with ID {turn.id} to memory")
@@ -154,19 +260,20 @@ class RAG(adal.Component):
     """RAG with one repo.
     If you want to load a new repos, call prepare_retriever(repo_url_or_path) first."""
 
-    def __init__(self, provider="google", model=None, use_s3: bool = False):  # noqa: F841 - use_s3 is kept for compatibility
+    def __init__(self, provider="google", model=None, use_s3: bool = None):
         """
         Initialize the RAG component.
 
         Args:
             provider: Model provider to use (google, openai, openrouter, ollama)
             model: Model name to use with the provider
-            use_s3: Whether to use S3 for database storage (default: False)
+            use_s3: Whether to share databases through S3 (default: the storage backend in repo.json)
         """
         super().__init__()
 
         self.provider = provider
         self.model = model
+        self.storage = get_storage(use_s3)
 
         # Import the helper functions
         from api.config import get_embedder_config, get_embedder_type
@@ -187,7 +294,9 @@ class RAG(adal.Component):
                     raise Exception(f"Ollama model '{model_name}' not found. Please run 'ollama pull {model_name}' to install it.")
 
         # Initialize components
-        self.memory = Memory()
+        memory_config = configs.get("conversation_memory", {})
+        token_budget = memory_config.get("recent_token_budget", 2000) if memory_config.get("mode") == "summary" else None
+        self.memory = Memory(token_budget=token_budget, provider=provider, model=model)
         self.embedder = get_embedder(embedder_type=self.embedder_type)
 
         self_weakref = weakref.ref(self)
@@ -245,8 +354,10 @@ IMPORTANT FORMATTING RULES:
 
     def initialize_db_manager(self):
         """Initialize the database manager with local storage"""
-        self.db_manager = DatabaseManager()
+        self.db_manager = DatabaseManager(storage=self.storage)
         self.transformed_docs = []
+        self.repo_summary = ""
+        self.code_graph = None
 
     def _validate_and_filter_embeddings(self, documents: List) -> List:
         """
@@ -261,85 +372,7 @@ IMPORTANT FORMATTING RULES:
         if not documents:
             logger.warning("No documents provided for embedding validation")
             return []
-
-        valid_documents = []
-        embedding_sizes = {}
-
-        # First pass: collect all embedding sizes and count occurrences
-        for i, doc in enumerate(documents):
-            if not hasattr(doc, 'vector') or doc.vector is None:
-                logger.warning(f"Document {i} has no embedding vector, skipping")
-                continue
-
-            try:
-                if isinstance(doc.vector, list):
-                    embedding_size = len(doc.vector)
-                elif hasattr(doc.vector, 'shape'):
-                    embedding_size = doc.vector.shape[0] if len(doc.vector.shape) == 1 else doc.vector.shape[-1]
-                elif hasattr(doc.vector, '__len__'):
-                    embedding_size = len(doc.vector)
-                else:
-                    logger.warning(f"Document {i} has invalid embedding vector type: {type(doc.vector)}, skipping")
-                    continue
-
-                if embedding_size == 0:
-                    logger.warning(f"Document {i} has empty embedding vector, skipping")
-                    continue
-
-                embedding_sizes[embedding_size] = embedding_sizes.get(embedding_size, 0) + 1
-
-            except Exception as e:
-                logger.warning(f"Error checking embedding size for document {i}: {str(e)}, skipping")
-                continue
-
-        if not embedding_sizes:
-            logger.error("No valid embeddings found in any documents")
-            return []
-
-        # Find the most common embedding size (this should be the correct one)
-        target_size = max(embedding_sizes.keys(), key=lambda k: embedding_sizes[k])
-        logger.info(f"Target embedding size: {target_size} (found in {embedding_sizes[target_size]} documents)")
-
-        # Log all embedding sizes found
-        for size, count in embedding_sizes.items():
-            if size != target_size:
-                logger.warning(f"Found {count} documents with incorrect embedding size {size}, will be filtered out")
-
-        # Second pass: filter documents with the target embedding size
-        for i, doc in enumerate(documents):
-            if not hasattr(doc, 'vector') or doc.vector is None:
-                continue
-
-            try:
-                if isinstance(doc.vector, list):
-                    embedding_size = len(doc.vector)
-                elif hasattr(doc.vector, 'shape'):
-                    embedding_size = doc.vector.shape[0] if len(doc.vector.shape) == 1 else doc.vector.shape[-1]
-                elif hasattr(doc.vector, '__len__'):
-                    embedding_size = len(doc.vector)
-                else:
-                    continue
-
-                if embedding_size == target_size:
-                    valid_documents.append(doc)
-                else:
-                    # Log which document is being filtered out
-                    file_path = getattr(doc, 'meta_data', {}).get('file_path', f'document_{i}')
-                    logger.warning(f"Filtering out document '{file_path}' due to embedding size mismatch: {embedding_size} != {target_size}")
-
-            except Exception as e:
-                file_path = getattr(doc, 'meta_data', {}).get('file_path', f'document_{i}')
-                logger.warning(f"Error validating embedding for document '{file_path}': {str(e)}, skipping")
-                continue
-
-        logger.info(f"Embedding validation complete: {len(valid_documents)}/{len(documents)} documents have valid embeddings")
-
-        if len(valid_documents) == 0:
-            logger.error("No documents with valid embeddings remain after filtering")
-        elif len(valid_documents) < len(documents):
-            filtered_count = len(documents) - len(valid_documents)
-            logger.warning(f"Filtered out {filtered_count} documents due to embedding issues")
-
+        valid_documents, _ = build_embedding_matrix(documents)
         return valid_documents
 
     def prepare_retriever(self, repo_url_or_path: str, type: str = "github", access_token: str = None,
@@ -349,11 +382,14 @@ IMPORTANT FORMATTING RULES:
         Prepare the retriever for a repository.
         Will load database from local storage if available.
 
+        The database is a single full index of the repository; the file filters
+        below only restrict which chunks are searched at query time.
+
         Args:
             repo_url_or_path: URL or local path to the repository
             access_token: Optional access token for private repositories
-            excluded_dirs: Optional list of directories to exclude from processing
-            excluded_files: Optional list of file patterns to exclude from processing
+            excluded_dirs: Optional list of directories to exclude from retrieval
+            excluded_files: Optional list of file patterns to exclude from retrieval
             included_dirs: Optional list of directories to include exclusively
             included_files: Optional list of file patterns to include exclusively
         """
@@ -371,8 +407,10 @@ IMPORTANT FORMATTING RULES:
         )
         logger.info(f"Loaded {len(self.transformed_docs)} documents for retrieval")
 
-        # Validate and filter embeddings to ensure consistent sizes
-        self.transformed_docs = self._validate_and_filter_embeddings(self.transformed_docs)
+        # Validate embeddings in one pass and keep the matrix for the index
+        self.transformed_docs, embeddings = build_embedding_matrix(self.transformed_docs)
+        self.repo_summary = root_summary(self.transformed_docs)
+        self.code_graph = self.db_manager.code_graph
 
         if not self.transformed_docs:
             raise ValueError("No valid documents with embeddings found. Cannot create retriever.")
@@ -382,56 +420,165 @@ IMPORTANT FORMATTING RULES:
         try:
             # Use the appropriate embedder for retrieval
             retrieve_embedder = self.query_embedder if self.is_ollama_embedder else self.embedder
-            self.retriever = FAISSRetriever(
+            self.retriever = RepoRetriever(
                 **configs["retriever"],
                 embedder=retrieve_embedder,
-                documents=self.transformed_docs,
-                document_map_func=lambda doc: doc.vector,
             )
+            self.retriever.build_index_from_matrix(embeddings)
+            self.retriever.build_file_ids(self.transformed_docs)
             logger.info("FAISS retriever created successfully")
         except Exception as e:
             logger.error(f"Error creating FAISS retriever: {str(e)}")
-            # Try to provide more specific error information
-            if "All embeddings should be of the same size" in str(e):
-                logger.error("Embedding size validation failed. This suggests there are still inconsistent embedding sizes.")
-                # Log embedding sizes for debugging
-                sizes = []
-                for i, doc in enumerate(self.transformed_docs[:10]):  # Check first 10 docs
-                    if hasattr(doc, 'vector') and doc.vector is not None:
-                        try:
-                            if isinstance(doc.vector, list):
-                                size = len(doc.vector)
-                            elif hasattr(doc.vector, 'shape'):
-                                size = doc.vector.shape[0] if len(doc.vector.shape) == 1 else doc.vector.shape[-1]
-                            elif hasattr(doc.vector, '__len__'):
-                                size = len(doc.vector)
-                            else:
-                                size = "unknown"
-                            sizes.append(f"doc_{i}: {size}")
-                        except:
-                            sizes.append(f"doc_{i}: error")
-                logger.error(f"Sample embedding sizes: {', '.join(sizes)}")
             raise
 
-    def call(self, query: str, language: str = "en") -> Tuple[List]:
+        if self.retriever.set_file_filter(excluded_dirs, excluded_files, included_dirs, included_files) == 0:
+            raise ValueError("No documents in the repository index match the requested file filters.")
+
+    def file_chunk_ids(self, file_path: str) -> List[int]:
+        """
+        Ids of the chunks of one file, in document order, looked up by path.
+
+        Args:
+            file_path: Path of the file relative to the repository root
+
+        Returns:
+            List of chunk ids, empty if the file is not in the index
+        """
+        path = file_path.replace("\\", "/").lstrip("/")
+        if path.startswith("./"):
+            path = path[2:]
+        ids = self.retriever.file_ids.get(path)
+        if ids is None:
+            return []
+        return sorted((int(i) for i in ids), key=lambda i: self.transformed_docs[i].order or 0)
+
+    def get_file_content(self, file_path: str) -> str:
+        """
+        Content of an indexed file, rebuilt from its chunks without a network request.
+
+        Args:
+            file_path: Path of the file relative to the repository root
+
+        Returns:
+            str: The file content, empty if the file is not in the index
+        """
+        chunk_ids = self.file_chunk_ids(file_path)
+        if not chunk_ids:
+            return ""
+        return merge_file_chunks([self.transformed_docs[i] for i in chunk_ids])
+
+    def _expand_with_code_graph(self, hit_ids: List[int], token_budget: int = None,
+                                provider: str = None, model: str = None) -> List[int]:
+        """
+        Chunks of files linked to the top hits in the import graph, within the token budget.
+
+        Args:
+            hit_ids: Ids of the retrieved chunks, best first
+            token_budget: Optional number of tokens available for retrieved context
+            provider: Model provider, used to count tokens against token_budget
+            model: Model name, used to count tokens against token_budget
+
+        Returns:
+            List of additional chunk ids
+        """
+        if self.code_graph is None or not hit_ids:
+            return []
+        graph_config = configs.get("code_graph", {})
+        neighbour_ids = expand_with_neighbours(
+            hit_ids,
+            self.code_graph,
+            self.retriever.file_ids,
+            self.retriever.xb,
+            self.transformed_docs,
+            expand_top_hits=graph_config.get("expand_top_hits", 5),
+            max_neighbours_per_hit=graph_config.get("max_neighbours_per_hit", 2),
+            is_visible=self.retriever.is_visible,
+        )
+        if token_budget is None or not neighbour_ids:
+            return neighbour_ids
+        remaining = token_budget - sum(count_model_tokens(self.transformed_docs[i].text, provider, model) for i in hit_ids)
+        if remaining <= 0:
+            return []
+        texts = [self.transformed_docs[i].text for i in neighbour_ids]
+        return neighbour_ids[:fit_to_token_budget(texts, remaining, provider, model, keep_first=False)]
+
+    def _select_documents(self, result, token_budget: int = None, provider: str = None, model: str = None,
+                          focus_ids: List[int] = None) -> None:
+        """
+        Cut one query's candidates to the ones worth putting in the prompt and fill in their documents.
+
+        Args:
+            result: RetrieverOutput of the query, updated in place
+            token_budget: Optional number of tokens available for retrieved context
+            provider: Model provider, used to count tokens against token_budget
+            model: Model name, used to count tokens against token_budget
+            focus_ids: Chunk ids of the file the chat is focused on, left out of the results
+        """
+        if focus_ids:
+            focus = set(focus_ids)
+            kept = [i for i, doc_index in enumerate(result.doc_indices) if doc_index not in focus]
+            result.doc_indices = [result.doc_indices[i] for i in kept]
+            if result.doc_scores is not None:
+                result.doc_scores = [result.doc_scores[i] for i in kept]
+        scores = list(result.doc_scores) if result.doc_scores is not None else []
+
+        k = choose_top_k(scores, self.retriever.min_top_k, self.retriever.max_score_drop) if scores else len(result.doc_indices)
+        score_k = k
+        if token_budget is not None:
+            k = fit_to_token_budget([self.transformed_docs[i].text for i in result.doc_indices[:k]],
+                                    token_budget, provider, model)
+        logger.debug(f"Adaptive top_k: kept {k} of {len(result.doc_indices)} candidates "
+                     f"(score drop-off k={score_k}, token budget={token_budget}), scores={scores}")
+
+        result.doc_indices = result.doc_indices[:k]
+        if result.doc_scores is not None:
+            result.doc_scores = result.doc_scores[:k]
+
+        # Add related files (imports and importers) of the top hits while budget remains
+        if focus_ids:
+            # Expand the focused file first; its chunks are not part of the context itself
+            neighbour_ids = self._expand_with_code_graph(focus_ids[:1] + list(result.doc_indices),
+                                                         token_budget, provider, model)
+        else:
+            neighbour_ids = self._expand_with_code_graph(result.doc_indices, token_budget, provider, model)
+        if neighbour_ids:
+            logger.debug(f"Code graph expansion added {len(neighbour_ids)} chunks")
+            result.doc_indices = list(result.doc_indices) + neighbour_ids
+
+        # Fill in the documents
+        result.documents = [
+            self.transformed_docs[doc_index]
+            for doc_index in result.doc_indices
+        ]
+
+    def call(self, query: str, language: str = "en", token_budget: int = None,
+             provider: str = None, model: str = None, file_path: str = None) -> Tuple[List]:
         """
         Process a query using RAG.
 
+        Up to ``max_top_k`` candidates are retrieved; the number kept depends on how
+        quickly their scores drop off and, when given, on the token budget. Files
+        linked to the top hits in the import graph fill the remaining budget.
+
+        When the chat is about one file, that file's content is expected to be in
+        the prompt already (see ``get_file_content``): its own chunks are left out
+        of the results and its import-graph neighbours are added first.
+
         Args:
             query: The user's query
+            language: Language of the response
+            token_budget: Optional number of tokens available for retrieved context
+            provider: Model provider, used to count tokens against token_budget
+            model: Model name, used to count tokens against token_budget
+            file_path: Optional file the chat is focused on
 
         Returns:
             Tuple of (RAGAnswer, retrieved_documents)
         """
         try:
-            retrieved_documents = self.retriever(query)
-
-            # Fill in the documents
-            retrieved_documents[0].documents = [
-                self.transformed_docs[doc_index]
-                for doc_index in retrieved_documents[0].doc_indices
-            ]
-
+            retrieved_documents = self.retriever(query, top_k=self.retriever.max_top_k)
+            focus_ids = self.file_chunk_ids(file_path) if file_path else []
+            self._select_documents(retrieved_documents[0], token_budget, provider, model, focus_ids)
             return retrieved_documents
 
         except Exception as e:
@@ -443,3 +590,28 @@ IMPORTANT FORMATTING RULES:
                 answer=f"I apologize, but I encountered an error while processing your question. Please try again or rephrase your question."
             )
             return error_response, []
+
+    def retrieve_many(self, queries: List[str], token_budget: int = None, provider: str = None,
+                      model: str = None) -> List:
+        """
+        Retrieve for several queries at once, with one embedding call and one index search.
+
+        Each query's candidates are cut the same way as in ``call``.
+
+        Args:
+            queries: The queries
+            token_budget: Optional number of tokens available for each query's context
+            provider: Model provider, used to count tokens against token_budget
+            model: Model name, used to count tokens against token_budget
+
+        Returns:
+            List with one RetrieverOutput per query, in order
+        """
+        if self.is_ollama_embedder:
+            # The Ollama query embedder takes one string at a time
+            outputs = [self.retriever(query, top_k=self.retriever.max_top_k)[0] for query in queries]
+        else:
+            outputs = self.retriever(list(queries), top_k=self.retriever.max_top_k)
+        for result in outputs:
+            self._select_documents(result, token_budget, provider, model)
+        return outputs
@@ -0,0 +1,355 @@
+"""FAISS retriever over a full repository index with query-time metadata filters."""
+
+import logging
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import faiss
+import numpy as np
+from adalflow.components.retriever.faiss_retriever import FAISSRetriever
+from adalflow.core.types import RetrieverOutput, RetrieverOutputType
+
+from api.data_pipeline import resolve_file_filters, should_process_file, has_custom_file_filters
+
+logger = logging.getLogger(__name__)
+
+# Number of distinct filter combinations whose bitmaps are kept per retriever
+MAX_CACHED_FILTERS = 32
+
+
+def _vector_size(vector: Any) -> int:
+    """Length of an embedding vector, 0 if it is missing or unusable."""
+    if vector is None:
+        return 0
+    shape = getattr(vector, "shape", None)
+    if shape is not None:
+        return shape[-1] if len(shape) else 0
+    try:
+        return len(vector)
+    except TypeError:
+        return 0
+
+
+def build_embedding_matrix(documents: Sequence[Any]) -> Tuple[List[Any], np.ndarray]:
+    """
+    Validate document embeddings in bulk and stack them into one float32 matrix.
+
+    The most common embedding size is taken as the target dimension. Documents
+    with a missing or mismatched vector, or whose vector contains NaN/inf or is
+    all zeros, are dropped.
+
+    Args:
+        documents: Documents carrying a ``vector`` attribute
+
+    Returns:
+        Tuple of the kept documents and their (n, dim) embedding matrix, row-aligned
+    """
+    vectors = [getattr(doc, "vector", None) for doc in documents]
+    sizes = np.fromiter((_vector_size(v) for v in vectors), dtype=np.int64, count=len(vectors))
+    if not sizes.any():
+        logger.error("No valid embeddings found in any documents")
+        return [], np.empty((0, 0), dtype=np.float32)
+
+    size_counts = np.bincount(sizes[sizes > 0])
+    target_size = int(size_counts.argmax())
+    logger.info(f"Target embedding size: {target_size} (found in {size_counts[target_size]} documents)")
+
+    missing = int((sizes == 0).sum())
+    mismatched = len(sizes) - missing - int(size_counts[target_size])
+    if missing:
+        logger.warning(f"{missing} documents have no embedding vector, will be filtered out")
+    if mismatched:
+        logger.warning(f"{mismatched} documents have an embedding size other than {target_size}, will be filtered out")
+
+    keep = np.flatnonzero(sizes == target_size)
+    matrix = np.array([vectors[i] for i in keep], dtype=np.float32)
+
+    norms = np.linalg.norm(matrix, axis=1)
+    usable = np.isfinite(norms) & (norms > 0)
+    if not usable.all():
+        logger.warning(f"{int((~usable).sum())} documents have NaN, infinite or zero embeddings, will be filtered out")
+        keep = keep[usable]
+        matrix = matrix[usable]
+
+    kept_documents = [documents[i] for i in keep]
+    logger.info(f"Embedding validation complete: {len(kept_documents)}/{len(documents)} documents have valid embeddings")
+    return kept_documents, matrix
+
+
+def choose_top_k(scores: Sequence[float], min_top_k: int, max_score_drop: float) -> int:
+    """
+    Number of leading candidates whose score stays close to the best one.
+
+    Args:
+        scores: Candidate scores, best first
+        min_top_k: Minimum number of candidates to keep
+        max_score_drop: Largest allowed drop from the best score
+
+    Returns:
+        int: How many candidates to keep
+    """
+    if len(scores) == 0:
+        return 0
+    scores = np.asarray(scores, dtype=np.float32)
+    k = int(np.count_nonzero(scores >= scores[0] - max_score_drop))
+    return min(len(scores), max(k, min_top_k))
+
+
+class RepoRetriever(FAISSRetriever):
+    """
+    FAISS retriever that indexes every chunk of a repository once and applies
+    file filters at query time.
+
+    Chunk ids are grouped by their ``file_path`` metadata when the index is built.
+    A filter is evaluated once per file (not per chunk) and turned into a packed
+    bitmap that FAISS consults during the search, so custom include/exclude rules
+    never require a separate database or a re-embed.
+
+    Searches return up to ``max_top_k`` scored candidates; ``choose_top_k``
+    narrows them down to the ones worth putting in a prompt.
+
+    On repositories with at least ``two_stage_min_chunks`` chunks the search
+    runs in two stages: files are ranked first by the normalized mean of their
+    chunk vectors, then only the chunks of the ``two_stage_top_files`` best
+    files are scored.
+    """
+
+    def __init__(self, *args, max_top_k: Optional[int] = None, min_top_k: int = 5,
+                 max_score_drop: float = 0.05, two_stage_min_chunks: int = 0,
+                 two_stage_top_files: int = 64, **kwargs):
+        self.max_top_k = max_top_k
+        self.min_top_k = min_top_k
+        self.max_score_drop = max_score_drop
+        self.two_stage_min_chunks = two_stage_min_chunks
+        self.two_stage_top_files = two_stage_top_files
+        self._file_index = None
+        self._file_chunk_ids: List[np.ndarray] = []
+        self._file_first_ids: Optional[np.ndarray] = None
+        self._file_ids: Dict[str, np.ndarray] = {}
+        self._filter_cache: "OrderedDict[Tuple, Tuple[Optional[np.ndarray], int]]" = OrderedDict()
+        self._active_bitmap: Optional[np.ndarray] = None
+        self._active_count: Optional[int] = None
+        super().__init__(*args, **kwargs)
+        if self.max_top_k is None:
+            self.max_top_k = self.top_k
+
+    def build_file_ids(self, documents: Sequence[Any]) -> None:
+        """
+        Group chunk ids by file path.
+
+        Args:
+            documents: The chunk documents, in the same order as the index vectors.
+        """
+        ids_by_file: Dict[str, List[int]] = {}
+        for i, doc in enumerate(documents):
+            meta = getattr(doc, "meta_data", None) or {}
+            ids_by_file.setdefault(meta.get("file_path", ""), []).append(i)
+        self._file_ids = {path: np.asarray(ids, dtype=np.int64) for path, ids in ids_by_file.items()}
+        self._filter_cache.clear()
+        self.clear_file_filter()
+        if self.two_stage_min_chunks and self.total_documents >= self.two_stage_min_chunks:
+            self._build_file_index()
+
+    def _build_file_index(self) -> None:
+        """Index one vector per file: the normalized mean of its chunk vectors."""
+        self._file_chunk_ids = list(self._file_ids.values())
+        self._file_first_ids = np.array([ids[0] for ids in self._file_chunk_ids], dtype=np.int64)
+        file_vectors = np.empty((len(self._file_chunk_ids), self.dimensions), dtype=np.float32)
+        for row, ids in enumerate(self._file_chunk_ids):
+            file_vectors[row] = self.xb[ids].mean(axis=0)
+        file_vectors /= np.maximum(np.linalg.norm(file_vectors, axis=1, keepdims=True), 1e-12)
+        self._file_index = faiss.IndexFlatIP(self.dimensions)
+        self._file_index.add(file_vectors)
+        logger.info(f"Two-stage search enabled over {len(self._file_chunk_ids)} files")
+
+    @property
+    def two_stage(self) -> bool:
+        """Whether searches go through the file-level index first."""
+        return self._file_index is not None
+
+    def build_index_from_matrix(self, xb: np.ndarray) -> None:
+        """
+        Build the FAISS index directly from an embedding matrix.
+
+        Rows are normalized in place when the metric needs it, so no further copy
+        of the matrix is made before it is handed to FAISS.
+
+        Args:
+            xb: float32 matrix of shape (n, dim), e.g. from build_embedding_matrix
+        """
+        if len(xb) == 0:
+            logger.warning("Empty embedding matrix provided to build_index_from_matrix")
+            self.reset_index()
+            return
+        if self._needs_normalized_embeddings:
+            xb /= np.linalg.norm(xb, axis=1, keepdims=True)
+        self.documents = xb
+        self.xb = xb
+        self._preprare_faiss_index_from_np_array(xb)
+        logger.info(f"Index built with {self.total_documents} chunks")
+
+    @property
+    def file_ids(self) -> Dict[str, np.ndarray]:
+        """Mapping of file path to the ids of its chunks in the index."""
+        return self._file_ids
+
+    @property
+    def active_count(self) -> int:
+        """Number of chunks visible through the active filter."""
+        if self._active_count is None:
+            return self.total_documents
+        return self._active_count
+
+    def is_visible(self, chunk_id: int) -> bool:
+        """Whether a chunk passes the active file filter."""
+        if self._active_bitmap is None:
+            return True
+        return bool(self._active_bitmap[chunk_id >> 3] & (1 << (chunk_id & 7)))
+
+    def clear_file_filter(self) -> None:
+        """Search the whole index again."""
+        self._active_bitmap = None
+        self._active_count = None
+
+    def set_file_filter(self, excluded_dirs: List[str] = None, excluded_files: List[str] = None,
+                        included_dirs: List[str] = None, included_files: List[str] = None) -> int:
+        """
+        Restrict subsequent searches to chunks whose file passes the given filters.
+
+        Args:
+            excluded_dirs: Directories to exclude
+            excluded_files: File patterns to exclude
+            included_dirs: Directories to include exclusively
+            included_files: File patterns to include exclusively
+
+        Returns:
+            int: Number of chunks that remain searchable
+        """
+        if not has_custom_file_filters(excluded_dirs, excluded_files, included_dirs, included_files):
+            self.clear_file_filter()
+            return self.active_count
+
+        key = tuple(tuple(sorted(rules or [])) for rules in (excluded_dirs, excluded_files, included_dirs, included_files))
+        if key in self._filter_cache:
+            self._filter_cache.move_to_end(key)
+            bitmap, count = self._filter_cache[key]
+        else:
+            bitmap, count = self._build_bitmap(excluded_dirs, excluded_files, included_dirs, included_files)
+            self._filter_cache[key] = (bitmap, count)
+            if len(self._filter_cache) > MAX_CACHED_FILTERS:
+                self._filter_cache.popitem(last=False)
+
+        self._active_bitmap = bitmap
+        self._active_count = count
+        logger.info(f"File filter keeps {count}/{self.total_documents} chunks")
+        return count
+
+    def _build_bitmap(self, excluded_dirs, excluded_files, included_dirs, included_files) -> Tuple[Optional[np.ndarray], int]:
+        """Evaluate the filter once per file and pack the matching chunk ids into a bitmap."""
+        use_inclusion, inc_dirs, inc_files, exc_dirs, exc_files = resolve_file_filters(
+            excluded_dirs, excluded_files, included_dirs, included_files
+        )
+        mask = np.zeros(self.total_documents, dtype=bool)
+        for file_path, ids in self._file_ids.items():
+            if should_process_file(file_path, use_inclusion, inc_dirs, inc_files, exc_dirs, exc_files):
+                mask[ids] = True
+        count = int(mask.sum())
+        if count == self.total_documents:
+            return None, count
+        return np.packbits(mask, bitorder="little"), count
+
+    def _search(self, xq: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Run the FAISS search, honouring the active file filter."""
+        if self._needs_normalized_embeddings:
+            # Scores are only comparable across queries for unit-length queries
+            xq = xq / np.maximum(np.linalg.norm(xq, axis=1, keepdims=True), 1e-12)
+        if self._file_index is not None:
+            return self._two_stage_search(xq, top_k)
+        if self._active_bitmap is None:
+            return self.index.search(xq, top_k)
+        selector = faiss.IDSelectorBitmap(self.total_documents, faiss.swig_ptr(self._active_bitmap))
+        return self.index.search(xq, top_k, params=faiss.SearchParameters(sel=selector))
+
+    def _two_stage_search(self, xq: np.ndarray, top_k: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Rank files first, then score only the chunks of the best files."""
+        n_files = min(self.two_stage_top_files, self._file_index.ntotal)
+        if self._active_bitmap is None:
+            _, file_rows = self._file_index.search(xq, n_files)
+        else:
+            # Filters apply per file, so the first chunk of a file decides for all of them
+            allowed = np.unpackbits(self._active_bitmap, count=self.total_documents, bitorder="little").astype(bool)
+            file_bitmap = np.packbits(allowed[self._file_first_ids], bitorder="little")
+            selector = faiss.IDSelectorBitmap(self._file_index.ntotal, faiss.swig_ptr(file_bitmap))
+            _, file_rows = self._file_index.search(xq, n_files, params=faiss.SearchParameters(sel=selector))
+        D = np.full((len(xq), top_k), -np.inf, dtype=np.float32)
+        Ind = np.full((len(xq), top_k), -1, dtype=np.int64)
+        for q, rows in enumerate(file_rows):
+            rows = rows[rows >= 0]
+            if len(rows) == 0:
+                continue
+            candidates = np.concatenate([self._file_chunk_ids[row] for row in rows])
+            scores = self.xb[candidates] @ xq[q]
+            k = min(top_k, len(candidates))
+            best = np.argpartition(-scores, k - 1)[:k]
+            best = best[np.argsort(-scores[best])]
+            D[q, :k] = scores[best]
+            Ind[q, :k] = candidates[best]
+        return D, Ind
+
+    def _to_retriever_output(self, Ind: np.ndarray, D: np.ndarray) -> RetrieverOutputType:
+        """
+        One output per query row, dropping that row's empty (-1) slots only.
+
+        The base class drops a column for every query as soon as one query has
+        an empty slot there, which loses valid hits of the other queries in a
+        batch when the filter lets them through differently.
+        """
+        output: RetrieverOutputType = []
+        for indices, scores in zip(Ind, D):
+            found = indices >= 0
+            output.append(RetrieverOutput(doc_indices=indices[found].tolist(), doc_scores=scores[found].tolist()))
+        return output
+
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """
+        Embed query strings with the retriever's embedder.
+
+        Args:
+            queries: Non-empty query strings
+
+        Returns:
+            float32 matrix with one row per query
+        """
+        embeddings = self.embedder(queries)
+        return np.array([data.embedding for data in embeddings.data], dtype=np.float32)
+
+    def retrieve_embedding_queries(self, input: Union[List[float], List[List[float]], np.ndarray],
+                                   top_k: Optional[int] = None) -> RetrieverOutputType:
+        if not self.indexed or self.index.ntotal == 0:
+            raise ValueError("Index is empty. Please set the chunks to build the index from")
+        xq = input if isinstance(input, np.ndarray) else np.array(input, dtype=np.float32)
+        if xq.ndim == 1:
+            xq = xq.reshape(1, -1)
+        D, Ind = self._search(xq, top_k if top_k else self.top_k)
+        if self.metric == "prob":
+            D = self._convert_cosine_similarity_to_probability(D)
+        return self._to_retriever_output(Ind, D)
+
+    def retrieve_string_queries(self, input: Union[str, List[str]], top_k: Optional[int] = None) -> RetrieverOutputType:
+        if not self.indexed or self.index.ntotal == 0:
+            raise ValueError("Index is empty. Please set the chunks to build the index from")
+        queries = [input] if isinstance(input, str) else list(input)
+        valid = [(i, q) for i, q in enumerate(queries) if q]
+        output: RetrieverOutputType = [RetrieverOutput(doc_indices=[], query=query) for query in queries]
+        if not valid:
+            logger.warning("Only empty queries provided, nothing to retrieve")
+            return output
+
+        xq = self.embed_queries([q for _, q in valid])
+        D, Ind = self._search(xq, top_k if top_k else self.top_k)
+        D = self._convert_cosine_similarity_to_probability(D)
+
+        for (initial_index, _), per_query in zip(valid, self._to_retriever_output(Ind, D)):
+            output[initial_index].doc_indices = per_query.doc_indices
+            output[initial_index].doc_scores = per_query.doc_scores
+        return output
@@ -0,0 +1,220 @@
+"""
+Where repository indexes are kept, so stateless API replicas can share them.
+
+``LocalStorage`` keeps indexes on the local disk only. ``S3Storage`` keeps an
+index bundle per repository in an S3-compatible bucket and uses the local
+databases directory as a read-through cache: a replica downloads a bundle the
+first time it serves a repository, then serves it from disk and only checks
+the bucket for a newer bundle every ``check_interval_seconds``.
+"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+from api.config import configs
+
+logger = logging.getLogger(__name__)
+
+
+def _remote_state_path(db_file: str) -> str:
+    """Sidecar recording which remote bundle the local database was downloaded from."""
+    return os.path.splitext(db_file)[0] + ".remote.json"
+
+
+class LocalStorage:
+    """Indexes live on the local disk of the node that built them."""
+
+    def fetch(self, db_file: str, embedder_type: str = None) -> bool:
+        """
+        Make the index of a database file available locally.
+
+        Args:
+            db_file: Database file of the repository
+            embedder_type: Embedder the index must have been built with
+
+        Returns:
+            bool: Whether the database file exists locally afterwards
+        """
+        return os.path.exists(db_file)
+
+    def publish(self, db_file: str) -> None:
+        """Share a freshly built index with other nodes."""
+
+
+class S3Storage(LocalStorage):
+    """
+    Indexes are shared through an S3-compatible bucket, cached on local disk.
+
+    Args:
+        bucket: Bucket holding the index bundles
+        prefix: Key prefix of the bundles
+        endpoint_url: Endpoint of an S3-compatible service such as MinIO, None for AWS
+        region: Region of the bucket
+        check_interval_seconds: How long a cached index is served before the bucket
+                                is asked whether a newer bundle exists
+        client: S3 client to use instead of creating one with boto3
+    """
+
+    def __init__(self, bucket: str, prefix: str = "", endpoint_url: str = None, region: str = None,
+                 check_interval_seconds: float = 60, client=None):
+        if not bucket:
+            raise ValueError("S3 index storage needs a bucket, set storage.bucket in repo.json "
+                             "or the DEEPWIKI_S3_BUCKET environment variable")
+        if client is None:
+            import boto3
+
+            client = boto3.client("s3", endpoint_url=endpoint_url, region_name=region)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+        self.check_interval_seconds = check_interval_seconds
+        self._checked: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def bundle_key(self, db_file: str) -> str:
+        """Object key of the bundle of a database file."""
+        return f"{self.prefix}{os.path.splitext(os.path.basename(db_file))[0]}.tar.gz"
+
+    def _remote_etag(self, key: str) -> Optional[str]:
+        from botocore.exceptions import ClientError
+
+        try:
+            return self.client.head_object(Bucket=self.bucket, Key=key)["ETag"]
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    @staticmethod
+    def _load_remote_state(db_file: str) -> Dict[str, Any]:
+        try:
+            with open(_remote_state_path(db_file), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    @staticmethod
+    def _keeps_local_index(db_file: str, manifest: Dict[str, Any], synced_revision: Optional[str]) -> bool:
+        """
+        Whether the local index must be kept instead of importing a bundle.
+
+        A local index rebuilt since the last download or publish, and built
+        after the bundle was exported, has not been published yet; importing
+        the bundle would roll the repository back.
+        """
+        from api.chunk_store import load_index_meta
+
+        if not os.path.exists(db_file):
+            return False
+        meta = load_index_meta(db_file)
+        revision = meta.get("revision")
+        if revision is None:
+            return False
+        if revision == manifest.get("revision"):
+            return True
+        if revision == synced_revision:
+            return False
+        built = next((s.get("created", 0) for s in meta.get("snapshots", []) if s["revision"] == revision), 0)
+        return built >= manifest.get("created", 0)
+
+    @staticmethod
+    def _save_remote_state(db_file: str, etag: str, revision: str) -> None:
+        with open(_remote_state_path(db_file), "w", encoding="utf-8") as f:
+            json.dump({"etag": etag, "revision": revision}, f)
+
+    def fetch(self, db_file: str, embedder_type: str = None) -> bool:
+        from api.chunk_store import load_index_meta
+        from api.index_bundle import MANIFEST_FILE, import_bundle, read_bundle
+
+        now = time.monotonic()
+        with self._lock:
+            last_check = self._checked.get(db_file)
+            if last_check is not None and now - last_check < self.check_interval_seconds and os.path.exists(db_file):
+                return True
+            self._checked[db_file] = now
+
+        key = self.bundle_key(db_file)
+        try:
+            etag = self._remote_etag(key)
+            state = self._load_remote_state(db_file)
+            local_revision = load_index_meta(db_file).get("revision") if os.path.exists(db_file) else None
+            if etag is None or (etag == state.get("etag") and local_revision == state.get("revision")):
+                return os.path.exists(db_file)
+
+            fd, bundle_path = tempfile.mkstemp(suffix=".tar.gz", dir=os.path.dirname(db_file))
+            os.close(fd)
+            try:
+                self.client.download_file(self.bucket, key, bundle_path)
+                manifest = json.loads(read_bundle(bundle_path)[MANIFEST_FILE])
+                if self._keeps_local_index(db_file, manifest, state.get("revision")):
+                    logger.info(f"Keeping the local index {db_file} at {local_revision}, "
+                                f"s3://{self.bucket}/{key} is not newer")
+                    revision = local_revision
+                else:
+                    logger.info(f"Importing index s3://{self.bucket}/{key} at {manifest.get('revision')}")
+                    revision = import_bundle(bundle_path, embedder_type=embedder_type,
+                                             databases_dir=os.path.dirname(db_file))["revision"]
+            finally:
+                os.remove(bundle_path)
+            self._save_remote_state(db_file, etag, revision)
+        except Exception as e:
+            # The local copy, if any, is still usable; otherwise the index gets built here
+            logger.warning(f"Could not fetch index s3://{self.bucket}/{key}: {e}")
+        return os.path.exists(db_file)
+
+    def publish(self, db_file: str) -> None:
+        from api.chunk_store import load_index_meta
+        from api.index_bundle import export_bundle
+
+        key = self.bundle_key(db_file)
+        fd, bundle_path = tempfile.mkstemp(suffix=".tar.gz", dir=os.path.dirname(db_file))
+        os.close(fd)
+        try:
+            export_bundle(db_file, bundle_path)
+            self.client.upload_file(bundle_path, self.bucket, key)
+            self._save_remote_state(db_file, self._remote_etag(key), load_index_meta(db_file).get("revision"))
+            logger.info(f"Published index to s3://{self.bucket}/{key}")
+        except Exception as e:
+            logger.warning(f"Could not publish index to s3://{self.bucket}/{key}: {e}")
+        finally:
+            os.remove(bundle_path)
+
+
+def get_storage(use_s3: bool = None) -> LocalStorage:
+    """
+    Index storage configured under "storage" in repo.json.
+
+    The backend is created once per process, so the S3 client and the
+    check interval of cached indexes carry over from one request to the next.
+    The DEEPWIKI_S3_BUCKET and DEEPWIKI_S3_ENDPOINT_URL environment variables
+    override the configured bucket and endpoint.
+
+    Args:
+        use_s3: Whether to share indexes through S3, defaults to the configured backend
+
+    Returns:
+        The storage backend
+    """
+    if use_s3 is None:
+        use_s3 = configs.get("storage", {}).get("backend") == "s3"
+    return _create_storage(bool(use_s3))
+
+
+@lru_cache(maxsize=None)
+def _create_storage(use_s3: bool) -> LocalStorage:
+    storage_config = configs.get("storage", {})
+    if not use_s3:
+        return LocalStorage()
+    return S3Storage(
+        bucket=os.environ.get("DEEPWIKI_S3_BUCKET", storage_config.get("bucket")),
+        prefix=storage_config.get("prefix", ""),
+        endpoint_url=os.environ.get("DEEPWIKI_S3_ENDPOINT_URL", storage_config.get("endpoint_url")),
+        region=storage_config.get("region") or os.environ.get("AWS_REGION"),
+        check_interval_seconds=storage_config.get("check_interval_seconds", 60),
+    )
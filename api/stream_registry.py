@@ -0,0 +1,179 @@
+"""Server-side buffers of answer streams, so a client that reconnects can resume where it left off."""
+
+import asyncio
+import logging
+import time
+import uuid
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, Optional, Tuple
+
+from api.config import configs
+
+logger = logging.getLogger(__name__)
+
+
+class AnswerStream:
+    """
+    Text emitted for one answer, with the most recent part kept in a bounded ring buffer.
+
+    Offsets count characters from the start of the answer. The generation
+    writes through send_text and close, the same calls it makes on a WebSocket,
+    and any number of clients follow the stream from an offset.
+
+    Args:
+        stream_id: Identifier the client resumes with
+        buffer_chars: Characters kept for clients that resume, older text is dropped
+    """
+
+    def __init__(self, stream_id: str, buffer_chars: int):
+        self.stream_id = stream_id
+        self.buffer_chars = buffer_chars
+        self.task: Optional[asyncio.Task] = None
+        self.done = False
+        self.start_offset = 0
+        self.end_offset = 0
+        self.followers = 0
+        self.last_seen = time.monotonic()
+        self._chunks: Deque[Tuple[int, str]] = deque()
+        self._changed = asyncio.Condition()
+
+    @property
+    def buffered_chars(self) -> int:
+        return self.end_offset - self.start_offset
+
+    async def send_text(self, text: str) -> None:
+        """Append generated text."""
+        if not text or self.done:
+            return
+        async with self._changed:
+            self._chunks.append((self.end_offset, text))
+            self.end_offset += len(text)
+            while self.buffered_chars > self.buffer_chars and len(self._chunks) > 1:
+                offset, dropped = self._chunks.popleft()
+                self.start_offset = offset + len(dropped)
+            self._changed.notify_all()
+
+    async def close(self) -> None:
+        """Mark the answer as complete."""
+        async with self._changed:
+            self.done = True
+            self._changed.notify_all()
+
+    def read(self, offset: int) -> str:
+        """
+        Buffered text from an offset to the current end.
+
+        Raises:
+            ValueError: If the text at offset is no longer buffered
+        """
+        if offset < self.start_offset or offset > self.end_offset:
+            raise ValueError(f"Offset {offset} is outside the buffered range {self.start_offset}-{self.end_offset}")
+        parts = [text[max(offset - start, 0):] for start, text in self._chunks if start + len(text) > offset]
+        return "".join(parts)
+
+    async def follow(self, offset: int = 0) -> AsyncIterator[Tuple[str, int]]:
+        """
+        Yield the text from an offset on as it is generated, until the answer is complete.
+
+        Yields:
+            (text, end offset) pairs
+        """
+        self.followers += 1
+        self.last_seen = time.monotonic()
+        try:
+            while True:
+                async with self._changed:
+                    await self._changed.wait_for(lambda: self.end_offset > offset or self.done)
+                    text = self.read(offset)
+                if text:
+                    offset += len(text)
+                    self.last_seen = time.monotonic()
+                    yield text, offset
+                elif self.done:
+                    return
+        finally:
+            self.followers -= 1
+            self.last_seen = time.monotonic()
+
+
+class StreamRegistry:
+    """
+    Answer streams by id, evicted by TTL and a total memory cap.
+
+    A stream that no client has followed for ttl_seconds is evicted, and its
+    generation cancelled if still running. When the buffers together exceed
+    max_total_chars, the least recently followed streams without a client go first.
+
+    Args:
+        ttl_seconds: How long a stream is kept without a client
+        buffer_chars: Ring buffer size of each stream
+        max_total_chars: Cap on the characters buffered across all streams
+    """
+
+    def __init__(self, ttl_seconds: float = 600, buffer_chars: int = 262144, max_total_chars: int = 33554432):
+        self.ttl_seconds = ttl_seconds
+        self.buffer_chars = buffer_chars
+        self.max_total_chars = max_total_chars
+        self._streams: Dict[str, AnswerStream] = {}
+
+    def __len__(self) -> int:
+        return len(self._streams)
+
+    def create(self) -> AnswerStream:
+        """Register a new, empty answer stream."""
+        self.evict()
+        stream = AnswerStream(uuid.uuid4().hex, self.buffer_chars)
+        self._streams[stream.stream_id] = stream
+        return stream
+
+    def get(self, stream_id: str) -> Optional[AnswerStream]:
+        """The stream with an id, None if it is unknown or was evicted."""
+        self.evict()
+        return self._streams.get(stream_id)
+
+    def _remove(self, stream: AnswerStream, reason: str) -> None:
+        del self._streams[stream.stream_id]
+        if stream.task is not None and not stream.task.done():
+            stream.task.cancel()
+        logger.info(f"Evicted answer stream {stream.stream_id} ({reason}, {stream.end_offset} characters)")
+
+    def evict(self) -> None:
+        """Drop expired streams, then the least recently followed ones while over the memory cap."""
+        now = time.monotonic()
+        for stream in list(self._streams.values()):
+            if stream.followers == 0 and now - stream.last_seen > self.ttl_seconds:
+                self._remove(stream, "expired")
+
+        total = sum(stream.buffered_chars for stream in self._streams.values())
+        if total <= self.max_total_chars:
+            return
+        # Finished streams before running ones, least recently followed first
+        candidates = sorted((stream for stream in self._streams.values() if stream.followers == 0),
+                            key=lambda stream: (not stream.done, stream.last_seen))
+        for stream in candidates:
+            if total <= self.max_total_chars:
+                break
+            total -= stream.buffered_chars
+            self._remove(stream, "memory cap")
+
+    async def evict_periodically(self, interval_seconds: float) -> None:
+        """Evict every interval_seconds until cancelled, so an idle server releases expired streams too."""
+        while True:
+            await asyncio.sleep(interval_seconds)
+            self.evict()
+
+
+_registry: Optional[StreamRegistry] = None
+
+
+def get_stream_registry() -> StreamRegistry:
+    """The process-wide stream registry, sized by the "streaming" config."""
+    global _registry
+    if _registry is None:
+        streaming_config = configs.get("streaming", {})
+        _registry = StreamRegistry(
+            ttl_seconds=streaming_config.get("resume_ttl_seconds", 600),
+            buffer_chars=streaming_config.get("resume_buffer_chars", 262144),
+            max_total_chars=streaming_config.get("resume_max_total_chars", 33554432),
+        )
+    return _registry
@@ -0,0 +1,350 @@
+"""Streaming adapters that turn each provider's response into plain text deltas."""
+
+import asyncio
+import logging
+import time
+from contextlib import aclosing
+from dataclasses import dataclass
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional
+
+from adalflow.core.types import ModelType
+
+from api import metrics
+from api.config import configs
+
+logger = logging.getLogger(__name__)
+
+# Provider errors containing one of these are retried without the retrieved context
+TOKEN_LIMIT_MARKERS = ("maximum context length", "token limit", "too many tokens")
+
+# Provider display names and configuration hints for error messages sent to the client
+PROVIDER_ERROR_HINTS = {
+    "openrouter": ("OpenRouter API", "Please check that you have set the OPENROUTER_API_KEY environment variable with a valid API key."),
+    "openai": ("Openai API", "Please check that you have set the OPENAI_API_KEY environment variable with a valid API key."),
+    "azure": ("Azure AI API", "Please check that you have set the AZURE_OPENAI_API_KEY, AZURE_OPENAI_ENDPOINT, and AZURE_OPENAI_VERSION environment variables with valid values."),
+    "dashscope": ("Dashscope API", "Please check that you have set the DASHSCOPE_API_KEY environment variable with a valid API key."),
+    "bedrock": ("AWS Bedrock API", "Please check that you have set the AWS_ACCESS_KEY_ID and AWS_SECRET_ACCESS_KEY environment variables with valid credentials."),
+}
+
+TOO_LARGE_MESSAGE = "\nI apologize, but your request is too large for me to process. Please try a shorter query or break it into smaller parts."
+
+
+@dataclass
+class StreamUsage:
+    """Token usage and timing of one streamed response."""
+    prompt_tokens: Optional[int] = None
+    completion_tokens: Optional[int] = None
+    chunks: int = 0
+    characters: int = 0
+    first_token_seconds: Optional[float] = None
+    seconds: float = 0.0
+
+
+async def _acall(model: Any, model_kwargs: Dict[str, Any], prompt: str) -> Any:
+    api_kwargs = model.convert_inputs_to_api_kwargs(
+        input=prompt,
+        model_kwargs=model_kwargs,
+        model_type=ModelType.LLM
+    )
+    return await model.acall(api_kwargs=api_kwargs, model_type=ModelType.LLM)
+
+
+async def _close_stream(stream: Any) -> None:
+    # Closing releases the provider connection when a stream is abandoned part way
+    if hasattr(stream, "aclose"):
+        await stream.aclose()
+    elif asyncio.iscoroutinefunction(getattr(stream, "close", None)):
+        await stream.close()
+
+
+async def _ollama_deltas(model, model_kwargs, prompt, usage: StreamUsage) -> AsyncIterator[str]:
+    response = await _acall(model, model_kwargs, prompt)
+    try:
+        async for chunk in response:
+            if getattr(chunk, "done", False):
+                usage.prompt_tokens = getattr(chunk, "prompt_eval_count", None)
+                usage.completion_tokens = getattr(chunk, "eval_count", None)
+            text = getattr(chunk, 'response', None) or getattr(chunk, 'text', None) or str(chunk)
+            # The final chunk carries no text, only its metadata
+            if text and not text.startswith('model=') and not text.startswith('created_at='):
+                text = text.replace('<think>', '').replace('</think>', '')
+                if text:
+                    yield text
+    finally:
+        await _close_stream(response)
+
+
+async def _openai_deltas(model, model_kwargs, prompt, usage: StreamUsage) -> AsyncIterator[str]:
+    # OpenAI, Azure and Dashscope all stream OpenAI chat completion chunks
+    response = await _acall(model, model_kwargs, prompt)
+    try:
+        async for chunk in response:
+            chunk_usage = getattr(chunk, "usage", None)
+            if chunk_usage is not None:
+                usage.prompt_tokens = getattr(chunk_usage, "prompt_tokens", None)
+                usage.completion_tokens = getattr(chunk_usage, "completion_tokens", None)
+            choices = getattr(chunk, "choices", None)
+            if choices:
+                delta = getattr(choices[0], "delta", None)
+                text = getattr(delta, "content", None)
+                if text:
+                    yield text
+    finally:
+        await _close_stream(response)
+
+
+async def _openrouter_deltas(model, model_kwargs, prompt, usage: StreamUsage) -> AsyncIterator[str]:
+    # OpenRouterClient already parses the server-sent events into text
+    response = await _acall(model, model_kwargs, prompt)
+    try:
+        async for text in response:
+            yield text
+    finally:
+        await _close_stream(response)
+
+
+def _bedrock_event_text(event: Dict[str, Any]) -> str:
+    if event.get("type") == "content_block_delta":
+        # Anthropic messages API
+        return event.get("delta", {}).get("text", "")
+    if "outputText" in event:
+        # Amazon Titan
+        return event["outputText"]
+    if "generations" in event:
+        # Cohere
+        return event["generations"][0].get("text", "")
+    # Meta Llama, Anthropic text completions and other single-field formats
+    for key in ("generation", "completion", "text"):
+        if isinstance(event.get(key), str):
+            return event[key]
+    return ""
+
+
+async def _bedrock_deltas(model, model_kwargs, prompt, usage: StreamUsage) -> AsyncIterator[str]:
+    response = await _acall(model, model_kwargs, prompt)
+    try:
+        async for event in response:
+            # Bedrock adds the token counts to the last event of every model family
+            invocation_metrics = event.get("amazon-bedrock-invocationMetrics")
+            if invocation_metrics:
+                usage.prompt_tokens = invocation_metrics.get("inputTokenCount")
+                usage.completion_tokens = invocation_metrics.get("outputTokenCount")
+            text = _bedrock_event_text(event)
+            if text:
+                yield text
+    finally:
+        await _close_stream(response)
+
+
+async def _google_deltas(model, model_kwargs, prompt, usage: StreamUsage) -> AsyncIterator[str]:
+    response = await model.generate_content_async(prompt, stream=True)
+    async for chunk in response:
+        metadata = getattr(chunk, "usage_metadata", None)
+        if metadata is not None and getattr(metadata, "candidates_token_count", None):
+            usage.prompt_tokens = metadata.prompt_token_count
+            usage.completion_tokens = metadata.candidates_token_count
+        try:
+            text = chunk.text
+        except ValueError:
+            # A chunk without text parts, such as the one carrying the finish reason
+            continue
+        if text:
+            yield text
+
+
+STREAM_ADAPTERS = {
+    "ollama": _ollama_deltas,
+    "openrouter": _openrouter_deltas,
+    "openai": _openai_deltas,
+    "azure": _openai_deltas,
+    "dashscope": _openai_deltas,
+    "bedrock": _bedrock_deltas,
+    "google": _google_deltas,
+}
+
+
+async def stream_text(provider: str, model: Any, model_kwargs: Dict[str, Any], prompt: str,
+                      usage: Optional[StreamUsage] = None) -> AsyncIterator[str]:
+    """
+    Stream a prompt's response as plain text deltas, whatever the provider.
+
+    Args:
+        provider: Model provider the client was created for
+        model: Client returned by get_model_client
+        model_kwargs: Model kwargs returned by get_model_client
+        prompt: The full prompt
+        usage: Filled with token usage and timing as the stream progresses
+
+    Yields:
+        str: Non-empty pieces of the generated text
+    """
+    usage = usage if usage is not None else StreamUsage()
+    adapter = STREAM_ADAPTERS.get(provider, _google_deltas)
+    start = time.perf_counter()
+    outcome = "failed"
+    deltas = adapter(model, model_kwargs, prompt, usage)
+    try:
+        async for text in deltas:
+            if usage.first_token_seconds is None:
+                usage.first_token_seconds = time.perf_counter() - start
+            usage.chunks += 1
+            usage.characters += len(text)
+            yield text
+        outcome = "completed"
+    except (asyncio.CancelledError, GeneratorExit):
+        # The client went away, stop the provider stream now rather than when it is garbage collected
+        outcome = "cancelled"
+        await deltas.aclose()
+        raise
+    finally:
+        usage.seconds = time.perf_counter() - start
+        # About four characters per token when the provider does not report usage
+        output_tokens = usage.completion_tokens or usage.characters // 4
+        metrics.record_stream(provider, outcome, output_tokens)
+        logger.info(f"{provider} stream {outcome}: {usage.chunks} chunks, {usage.characters} characters, "
+                    f"first token after {usage.first_token_seconds or 0:.2f}s, {usage.seconds:.2f}s total, "
+                    f"tokens in/out {usage.prompt_tokens}/{usage.completion_tokens}")
+
+
+def is_token_limit_error(error: Exception) -> bool:
+    """Whether a provider error means the prompt did not fit the model's context window."""
+    message = str(error)
+    return any(marker in message for marker in TOKEN_LIMIT_MARKERS)
+
+
+def error_message(provider: str, error: Exception) -> str:
+    """Error text sent to the client in place of the answer."""
+    if provider in PROVIDER_ERROR_HINTS:
+        name, hint = PROVIDER_ERROR_HINTS[provider]
+        return f"\nError with {name}: {str(error)}\n\n{hint}"
+    return f"\nError: {str(error)}"
+
+
+async def stream_answer(provider: str, model: Any, model_kwargs: Dict[str, Any], prompt: str,
+                        fallback_prompt: Optional[str] = None) -> AsyncIterator[str]:
+    """
+    Stream the answer to a chat prompt, turning provider failures into text for the client.
+
+    When the provider rejects the prompt as too long, the answer is generated
+    again from fallback_prompt, which leaves out the retrieved context.
+
+    Args:
+        provider: Model provider the client was created for
+        model: Client returned by get_model_client
+        model_kwargs: Model kwargs returned by get_model_client
+        prompt: The full prompt
+        fallback_prompt: Smaller prompt to retry with on token limit errors
+
+    Yields:
+        str: Pieces of the answer, or of an error message
+    """
+    try:
+        async with aclosing(stream_text(provider, model, model_kwargs, prompt)) as deltas:
+            async for text in deltas:
+                yield text
+        return
+    except Exception as e:
+        logger.error(f"Error in streaming response: {str(e)}")
+        if fallback_prompt is None or not is_token_limit_error(e):
+            yield error_message(provider, e)
+            return
+
+    logger.warning("Token limit exceeded, retrying without context")
+    try:
+        async with aclosing(stream_text(provider, model, model_kwargs, fallback_prompt)) as deltas:
+            async for text in deltas:
+                yield text
+    except Exception as e_fallback:
+        logger.error(f"Error in fallback streaming response: {str(e_fallback)}")
+        yield TOO_LARGE_MESSAGE
+
+
+class CoalescingSender:
+    """
+    Buffers text deltas and sends them in fewer, larger frames.
+
+    The first delta is sent at once so the time to first token is unchanged;
+    after that the buffer is flushed when it reaches flush_chars characters or
+    flush_interval_ms after its oldest delta arrived, whichever comes first.
+    A flush_interval_ms of 0 sends every delta as its own frame.
+
+    Use as an async context manager so the remaining text is flushed at the end.
+
+    Args:
+        send: Coroutine function sending one frame, such as WebSocket.send_text
+        flush_chars: Buffer size that triggers a flush, defaults to the "streaming" config
+        flush_interval_ms: Longest time a delta waits in the buffer, defaults to the "streaming" config
+    """
+
+    def __init__(self, send: Callable[[str], Awaitable[None]], flush_chars: Optional[int] = None,
+                 flush_interval_ms: Optional[float] = None):
+        streaming_config = configs.get("streaming", {})
+        self.send = send
+        self.flush_chars = flush_chars if flush_chars is not None else streaming_config.get("flush_chars", 1024)
+        if flush_interval_ms is None:
+            flush_interval_ms = streaming_config.get("flush_interval_ms", 30)
+        self.flush_interval = flush_interval_ms / 1000
+        self.frames = 0
+        self._buffer: List[str] = []
+        self._buffered_chars = 0
+        self._timer: Optional[asyncio.Task] = None
+        # Timer that woke up and is sending the buffer
+        self._timed_send: Optional[asyncio.Task] = None
+        # Keeps frames in order when the timer and a full buffer flush at the same time
+        self._send_lock = asyncio.Lock()
+
+    async def add(self, text: str) -> None:
+        """Queue a delta, sending it right away if it is the first one or fills the buffer."""
+        self._buffer.append(text)
+        self._buffered_chars += len(text)
+        if self.frames == 0 or self.flush_interval <= 0 or self._buffered_chars >= self.flush_chars:
+            await self.flush()
+        elif self._timer is None:
+            self._timer = asyncio.create_task(self._flush_later())
+
+    async def flush(self) -> None:
+        """Send everything buffered as one frame."""
+        if self._timer is not None:
+            # Still sleeping, a timer that woke up has already detached itself
+            self._timer.cancel()
+            self._timer = None
+        await self._send_buffer()
+
+    async def _send_buffer(self) -> None:
+        if not self._buffer:
+            return
+        text = "".join(self._buffer)
+        self._buffer = []
+        self._buffered_chars = 0
+        self.frames += 1
+        async with self._send_lock:
+            await self.send(text)
+
+    async def _flush_later(self) -> None:
+        await asyncio.sleep(self.flush_interval)
+        self._timer = None
+        self._timed_send = asyncio.current_task()
+        try:
+            await self._send_buffer()
+        except Exception as e:
+            # The connection went away, the streaming loop reports it on its next send
+            logger.debug(f"Timed flush failed: {e}")
+        finally:
+            if self._timed_send is asyncio.current_task():
+                self._timed_send = None
+
+    async def __aenter__(self) -> "CoalescingSender":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        timed_send = self._timed_send
+        if timed_send is not None:
+            # The last frame must not overtake, or be cut off by closing while, a timed send still in flight
+            if exc_type is not None:
+                timed_send.cancel()
+            await asyncio.gather(timed_send, return_exceptions=True)
+        if exc_type is None:
+            await self._send_buffer()
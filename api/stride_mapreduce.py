@@ -0,0 +1,343 @@
+"""STRIDE threat models of whole repositories: per-partition extraction mapped concurrently, reduced into one OWASP threat model."""
+
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+from api.config import configs
+from api.context_packer import (count_model_tokens, format_file_context, get_context_budget, merge_file_chunks,
+                                truncate_to_tokens)
+from api.generation import generate_text
+from api.prompts import STRIDE_PARTITION_PROMPT, STRIDE_REDUCE_PROMPT
+from api.summary_index import SUMMARY_NODE_TYPE
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_URL = "https://github.com/OWASP/www-project-threat-model-library/blob/v1.0.1/threat-model.schema.json"
+
+# Arrays of the threat model that partitions contribute to, in schema order
+MODEL_ARRAYS = [
+    "trust_zones", "trust_boundaries", "actors", "components", "data_stores", "data_sets", "data_flows",
+    "assumptions", "threat_personas", "threats", "controls", "risks",
+]
+# Arrays the schema requires, even when empty
+REQUIRED_ARRAYS = ["trust_zones", "trust_boundaries", "actors", "components", "data_stores", "data_sets", "data_flows"]
+
+# Cached extractions are only valid for the prompt they were made with
+PROMPT_VERSION = hashlib.sha256(STRIDE_PARTITION_PROMPT.encode("utf-8")).hexdigest()[:12]
+
+_JSON_FENCE = re.compile(r"^```(?:json)?\s*|\s*```$")
+
+
+@dataclass
+class Partition:
+    """
+    Files of one directory or module, analysed in one LLM call.
+
+    Args:
+        name: Directory of the files, with a part number when it was split
+        files: Paths of the files
+        text: Code of the files, within the partition token budget
+    """
+
+    name: str
+    files: List[str] = field(default_factory=list)
+    text: str = ""
+
+    def digest(self, *settings: str) -> str:
+        """Hash of the partition's code and the settings its extraction depends on."""
+        digest = hashlib.sha256()
+        for value in (PROMPT_VERSION, self.name, *settings, self.text):
+            digest.update(str(value).encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+
+def _directory_of(file_path: str, max_depth: int) -> str:
+    parts = file_path.replace("\\", "/").split("/")[:-1][:max_depth]
+    return "/".join(parts) or "."
+
+
+def partition_documents(documents: Sequence[Any], max_depth: int = 2, max_tokens: int = 6000,
+                        provider: str = None, model: str = None) -> List[Partition]:
+    """
+    Group the files of a repository into partitions by directory.
+
+    Files are grouped under their directory, cut to max_depth levels. A
+    directory whose code exceeds max_tokens is split into several partitions,
+    and a single file larger than that is truncated.
+
+    Args:
+        documents: Chunk documents of the repository
+        max_depth: Deepest directory level that gets its own partitions
+        max_tokens: Token budget of the code in one partition
+        provider: Model provider, used to count tokens
+        model: Model name, used to count tokens
+
+    Returns:
+        Partitions sorted by name
+    """
+    chunks_by_file: Dict[str, List[Any]] = {}
+    for doc in documents:
+        meta = doc.meta_data or {}
+        if meta.get("type") == SUMMARY_NODE_TYPE or not meta.get("file_path"):
+            continue
+        chunks_by_file.setdefault(meta["file_path"], []).append(doc)
+
+    files_by_directory: Dict[str, List[str]] = {}
+    for path in sorted(chunks_by_file):
+        files_by_directory.setdefault(_directory_of(path, max_depth), []).append(path)
+
+    partitions = []
+    for directory, paths in sorted(files_by_directory.items()):
+        parts: List[Partition] = []
+        used = 0
+        for path in paths:
+            section = format_file_context(path, merge_file_chunks(chunks_by_file[path]))
+            tokens = count_model_tokens(section, provider, model)
+            if tokens > max_tokens:
+                section = truncate_to_tokens(section, max_tokens, provider, model)
+                tokens = max_tokens
+            if not parts or used + tokens > max_tokens:
+                parts.append(Partition(name=directory))
+                used = 0
+            parts[-1].files.append(path)
+            parts[-1].text += ("\n\n" if parts[-1].text else "") + section
+            used += tokens
+        if len(parts) > 1:
+            for number, part in enumerate(parts, 1):
+                part.name = f"{directory} (part {number})"
+        partitions.extend(parts)
+    return partitions
+
+
+def stride_cache_path(db_file: str) -> str:
+    """Path of the per-partition extraction cache stored next to a repository database."""
+    return os.path.splitext(db_file)[0] + ".stride.json"
+
+
+def load_stride_cache(path: Optional[str]) -> Dict[str, Dict]:
+    """Cached extractions by partition digest, empty if there is no readable cache."""
+    if not path or not os.path.exists(path):
+        return {}
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("partitions", {})
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read STRIDE cache {path}: {e}")
+        return {}
+
+
+def save_stride_cache(path: str, current: Dict[str, Dict], previous: Dict[str, Dict], max_entries: int) -> None:
+    """Write this run's extractions, then the earlier ones, to the cache file up to max_entries."""
+    partitions = dict(current)
+    for digest, fragment in previous.items():
+        if len(partitions) >= max_entries:
+            break
+        partitions.setdefault(digest, fragment)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"partitions": partitions}, f)
+    os.replace(tmp_path, path)
+
+
+def parse_json_object(text: str) -> Dict:
+    """
+    The JSON object in a model's answer, tolerating code fences and text around it.
+
+    Raises:
+        ValueError: If the answer holds no JSON object
+    """
+    text = _JSON_FENCE.sub("", text.strip())
+    start, end = text.find("{"), text.rfind("}")
+    if start < 0 or end < start:
+        raise ValueError("No JSON object in the model's answer")
+    value = json.loads(text[start:end + 1])
+    if not isinstance(value, dict):
+        raise ValueError("The model's answer is not a JSON object")
+    return value
+
+
+def _identity(key: str, item: Dict) -> Optional[str]:
+    if key == "trust_boundaries":
+        zones = sorted(str(item.get(zone, "")) for zone in ("trust_zone_a", "trust_zone_b"))
+        return "|".join(zones)
+    if key == "assumptions":
+        return item.get("description")
+    return item.get("symbolic_name")
+
+
+def merge_fragments(fragments: Sequence[Dict]) -> Dict[str, List[Dict]]:
+    """
+    Merge threat model fragments, keeping one item per symbolic name.
+
+    Elements named the same in several partitions are taken to be the same
+    element; the first definition wins, and the affected components of a
+    threat or the threats of a control are combined.
+
+    Args:
+        fragments: Partial threat models with some of the MODEL_ARRAYS
+
+    Returns:
+        Dict with every array of MODEL_ARRAYS
+    """
+    merged: Dict[str, List[Dict]] = {key: [] for key in MODEL_ARRAYS}
+    seen: Dict[str, Dict[str, Dict]] = {key: {} for key in MODEL_ARRAYS}
+    for fragment in fragments:
+        for key in MODEL_ARRAYS:
+            for item in fragment.get(key) or []:
+                if not isinstance(item, dict):
+                    continue
+                identity = _identity(key, item)
+                if identity is None:
+                    merged[key].append(item)
+                    continue
+                existing = seen[key].get(identity)
+                if existing is None:
+                    # A copy, the fragments stay as cached
+                    seen[key][identity] = dict(item)
+                    merged[key].append(seen[key][identity])
+                    continue
+                for list_field in ("components_affected", "threats"):
+                    if isinstance(existing.get(list_field), list) and isinstance(item.get(list_field), list):
+                        existing[list_field] = existing[list_field] + [
+                            value for value in item[list_field] if value not in existing[list_field]]
+    return merged
+
+
+def _element_listing(merged: Dict[str, List[Dict]]) -> str:
+    """Compact listing of the merged elements for the reduce prompt."""
+    lines = []
+    for key in ("actors", "trust_zones", "components", "data_stores"):
+        for item in merged[key]:
+            zone = f" [zone: {item['trust_zone']}]" if item.get("trust_zone") else ""
+            lines.append(f"{key}: {item.get('symbolic_name')} - {item.get('title', '')}{zone}")
+    for flow in merged["data_flows"]:
+        source = (flow.get("source") or {}).get("object")
+        destination = (flow.get("destination") or {}).get("object")
+        lines.append(f"data_flows: {flow.get('symbolic_name')} - {source} -> {destination}")
+    return "\n".join(lines)
+
+
+def _finish_prompt(prompt: str, query: str, provider: str) -> str:
+    prompt += f"<query>{query}</query>\n\nAssistant: "
+    if provider == "ollama":
+        prompt += " /no_think"
+    return prompt
+
+
+async def build_threat_model(documents: Sequence[Any], prompt_vars: Dict[str, str], provider: str,
+                             model: Optional[str], client, model_kwargs: dict, cache_path: Optional[str] = None,
+                             on_progress: Optional[Callable[[str], Awaitable[None]]] = None) -> Dict:
+    """
+    Build one OWASP threat model of a repository by map-reduce over its partitions.
+
+    Map: the DFD elements and STRIDE threats of every partition are extracted
+    concurrently, at most ``stride_mapreduce.max_concurrency`` LLM calls at a
+    time. Extractions are cached by a hash of the partition's code, the model
+    and the prompt, so on a later run only partitions whose files changed are
+    analysed again. Reduce: the fragments are merged by symbolic name, and one
+    LLM call adds the scope, the description and the flows and trust
+    boundaries between partitions.
+
+    Args:
+        documents: Chunk documents of the repository
+        prompt_vars: repo_type, repo_url, repo_name and language_name for the prompts
+        provider: Model provider
+        model: Model name, used to count tokens and in the cache key
+        client: Model client from get_model_client
+        model_kwargs: Model parameters from get_model_client
+        cache_path: Extraction cache file, None to not cache
+        on_progress: Coroutine function called with a line of progress text as the map step
+                     starts, as each partition is analysed and as the reduce step starts
+
+    Returns:
+        The threat model as a dict following the OWASP Threat Model Schema
+    """
+    stride_config = configs.get("stride_mapreduce", {})
+    semaphore = asyncio.Semaphore(stride_config.get("max_concurrency", 4))
+    started = time.perf_counter()
+
+    # Partitions must also fit the model's window next to the extraction prompt
+    prompt_tokens = count_model_tokens(STRIDE_PARTITION_PROMPT.format(partition="", **prompt_vars), provider, model)
+    max_tokens = max(1, min(stride_config.get("max_partition_tokens", 6000),
+                            get_context_budget(provider, model, prompt_tokens)))
+    partitions = partition_documents(documents, stride_config.get("max_depth", 2), max_tokens, provider, model)
+    digests = [partition.digest(provider, model, prompt_vars.get("language_name", "")) for partition in partitions]
+    cached = await asyncio.to_thread(load_stride_cache, cache_path)
+    fragments: Dict[str, Dict] = {digest: cached[digest] for digest in digests if digest in cached}
+    logger.info(f"STRIDE map-reduce over {len(partitions)} partitions, {len(fragments)} cached")
+    pending = len(partitions) - len(fragments)
+    analysed = 0
+
+    async def report(text: str) -> None:
+        if on_progress is not None:
+            await on_progress(text)
+
+    await report(f"Analysing {pending} of {len(partitions)} partitions, "
+                 f"{len(fragments)} unchanged since the last analysis\n")
+
+    async def extract(partition: Partition, digest: str) -> None:
+        nonlocal analysed
+        prompt = STRIDE_PARTITION_PROMPT.format(partition=partition.name, **prompt_vars) + "\n\n"
+        prompt += f"<START_OF_CONTEXT>\n{partition.text}\n<END_OF_CONTEXT>\n\n"
+        prompt = _finish_prompt(prompt, f"Extract the DFD elements and STRIDE threats of {partition.name}.", provider)
+        async with semaphore:
+            try:
+                answer = await generate_text(provider, client, model_kwargs, prompt)
+                fragments[digest] = parse_json_object(answer)
+                outcome = "analysed"
+            except Exception as e:
+                # Not cached, so the partition is analysed again next time
+                logger.error(f"Error extracting STRIDE threats of {partition.name}: {str(e)}")
+                outcome = "could not be analysed"
+        analysed += 1
+        await report(f"- {partition.name} {outcome} ({analysed}/{pending})\n")
+
+    await asyncio.gather(*(extract(partition, digest) for partition, digest in zip(partitions, digests)
+                           if digest not in fragments))
+    logger.info(f"STRIDE map step done after {time.perf_counter() - started:.1f}s")
+
+    if cache_path:
+        try:
+            await asyncio.to_thread(save_stride_cache, cache_path, {d: fragments[d] for d in digests if d in fragments},
+                                    cached, stride_config.get("cache_max_entries", 2048))
+        except OSError as e:
+            logger.warning(f"Could not write STRIDE cache {cache_path}: {e}")
+
+    merged = merge_fragments([fragments[digest] for digest in digests if digest in fragments])
+    await report("Merging the partitions into one threat model\n")
+
+    prompt = STRIDE_REDUCE_PROMPT.format(**prompt_vars) + "\n\n"
+    prompt += f"<elements>\n{_element_listing(merged)}\n</elements>\n\n"
+    prompt = _finish_prompt(prompt, "Complete the threat model.", provider)
+    try:
+        completion = parse_json_object(await generate_text(provider, client, model_kwargs, prompt))
+    except Exception as e:
+        logger.error(f"Error completing the STRIDE threat model: {str(e)}")
+        completion = {}
+    reduced = merge_fragments([merged, {key: completion.get(key) for key in ("data_flows", "trust_boundaries")}])
+
+    threat_model: Dict[str, Any] = {"$schema": SCHEMA_URL, "version": "1.0"}
+    threat_model["scope"] = completion.get("scope") or {
+        "title": prompt_vars.get("repo_name", ""),
+        "description": f"Threat model of {prompt_vars.get('repo_url', '')}",
+        "business_criticality": "moderate",
+        "data_sensitivity": [],
+        "exposure": "external",
+        "tier": "important",
+    }
+    if completion.get("description"):
+        threat_model["description"] = completion["description"]
+    for key in MODEL_ARRAYS:
+        if reduced[key] or key in REQUIRED_ARRAYS:
+            threat_model[key] = reduced[key]
+    logger.info(f"STRIDE threat model with {len(threat_model.get('threats', []))} threats "
+                f"built in {time.perf_counter() - started:.1f}s")
+    return threat_model
@@ -0,0 +1,338 @@
+"""Hierarchical directory summaries stored as extra retrievable nodes of a repository index."""
+
+import asyncio
+import json
+import logging
+import os
+import subprocess
+import threading
+from typing import Dict, List, Optional
+
+from adalflow.core.types import Document
+
+from api.config import configs, get_model_config
+from api.context_packer import count_model_tokens, truncate_to_tokens
+from api.prompts import DIRECTORY_SUMMARY_PROMPT
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_NODE_TYPE = "directory_summary"
+ROOT_DIRECTORY = "."
+
+# Sidecar files currently being built in the background
+_building = set()
+_building_lock = threading.Lock()
+
+
+def summary_index_path(db_file: str) -> str:
+    """Path of the summary sidecar stored next to a repository database."""
+    return os.path.splitext(db_file)[0] + ".summaries.json"
+
+
+def get_repo_revision(repo_dir: str, db_file: str = None) -> str:
+    """
+    Identify the indexed state of a repository.
+
+    Args:
+        repo_dir: Local checkout of the repository
+        db_file: Database file, used for repositories that are not git checkouts
+
+    Returns:
+        str: The HEAD commit, or the database modification time when there is no git history
+    """
+    try:
+        result = subprocess.run(
+            ["git", "-C", repo_dir, "rev-parse", "HEAD"],
+            check=True,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE,
+        )
+        return result.stdout.decode("utf-8").strip()
+    except (subprocess.CalledProcessError, OSError):
+        if db_file and os.path.exists(db_file):
+            return f"mtime-{os.stat(db_file).st_mtime_ns}"
+        return ""
+
+
+def _directory_of(file_path: str, max_depth: int) -> str:
+    """Directory of a file, cut to at most max_depth levels."""
+    parts = file_path.replace("\\", "/").split("/")[:-1][:max_depth]
+    return "/".join(parts) or ROOT_DIRECTORY
+
+
+def _parent_of(directory: str) -> Optional[str]:
+    if directory == ROOT_DIRECTORY:
+        return None
+    return directory.rsplit("/", 1)[0] if "/" in directory else ROOT_DIRECTORY
+
+
+def collect_directories(documents: List[Document], max_depth: int) -> Dict[str, Dict]:
+    """
+    Group the first chunk of every file under its (depth-limited) directory.
+
+    Args:
+        documents: Chunk documents of the repository
+        max_depth: Deepest directory level that gets its own summary
+
+    Returns:
+        Dict mapping each directory to {"files": {path: excerpt}, "children": set of directories}
+    """
+    first_chunks: Dict[str, Document] = {}
+    for doc in documents:
+        meta = doc.meta_data or {}
+        if meta.get("type") == SUMMARY_NODE_TYPE:
+            continue
+        path = meta.get("file_path")
+        if not path:
+            continue
+        current = first_chunks.get(path)
+        if current is None or (doc.order or 0) < (current.order or 0):
+            first_chunks[path] = doc
+
+    directories: Dict[str, Dict] = {ROOT_DIRECTORY: {"files": {}, "children": set()}}
+    for path in sorted(first_chunks):
+        directory = _directory_of(path, max_depth)
+        directories.setdefault(directory, {"files": {}, "children": set()})["files"][path] = first_chunks[path].text
+        # Make sure every ancestor exists and knows its child
+        child, parent = directory, _parent_of(directory)
+        while parent is not None:
+            entry = directories.setdefault(parent, {"files": {}, "children": set()})
+            entry["children"].add(child)
+            child, parent = parent, _parent_of(parent)
+    return directories
+
+
+def _depth(directory: str) -> int:
+    return 0 if directory == ROOT_DIRECTORY else directory.count("/") + 1
+
+
+def build_summary_prompt(repo_name: str, directory: str, files: Dict[str, str], child_summaries: Dict[str, str],
+                         max_input_tokens: int, provider: str = None, model: str = None) -> str:
+    """
+    Build the prompt summarizing one directory from file excerpts and sub-directory summaries.
+
+    Args:
+        repo_name: Name of the repository
+        directory: Directory being summarized
+        files: File path to excerpt of the files directly in the directory
+        child_summaries: Sub-directory to its summary
+        max_input_tokens: Token budget for excerpts and summaries
+        provider: Model provider, used to count tokens
+        model: Model name, used to count tokens
+
+    Returns:
+        str: The prompt
+    """
+    prompt = DIRECTORY_SUMMARY_PROMPT.format(repo_name=repo_name, directory=directory) + "\n\n"
+    if child_summaries:
+        prompt += "<sub_directories>\n"
+        prompt += "\n\n".join(f"### {child}/\n{summary}" for child, summary in sorted(child_summaries.items()))
+        prompt += "\n</sub_directories>\n\n"
+
+    remaining = max_input_tokens - count_model_tokens(prompt, provider, model)
+    if files and remaining > 0:
+        # Every file gets an equal share, but at least enough tokens to be useful
+        share = max(remaining // len(files), 64)
+        excerpts = []
+        for path, text in list(files.items())[:max(remaining // share, 1)]:
+            excerpts.append(f"### {path}\n{truncate_to_tokens(text, share, provider, model)}")
+        prompt += "<files>\n" + "\n\n".join(excerpts) + "\n</files>\n\n"
+
+    return prompt + f"<query>Summarize the directory {directory}.</query>\n\nAssistant: "
+
+
+async def build_directory_summaries(documents: List[Document], repo_name: str, provider: str, model: str = None,
+                                    max_concurrency: int = 4, max_depth: int = 3,
+                                    max_input_tokens: int = 6000) -> Dict[str, str]:
+    """
+    Summarize directories bottom-up with a bounded number of concurrent LLM calls.
+
+    All directories of one depth are summarized concurrently; a directory's
+    prompt includes the summaries of its sub-directories, so the root summary
+    describes the whole repository.
+
+    Args:
+        documents: Chunk documents of the repository
+        repo_name: Name of the repository
+        provider: Model provider used for the summaries
+        model: Model name used for the summaries
+        max_concurrency: Maximum number of LLM calls in flight
+        max_depth: Deepest directory level that gets its own summary
+        max_input_tokens: Token budget of each summary prompt
+
+    Returns:
+        Dict mapping directory to summary text
+    """
+    from api.generation import get_model_client, generate_text
+
+    model_config = get_model_config(provider, model)["model_kwargs"]
+    client, model_kwargs = get_model_client(provider, model, model_config)
+    directories = collect_directories(documents, max_depth)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    summaries: Dict[str, str] = {}
+
+    async def summarize(directory: str) -> None:
+        entry = directories[directory]
+        children = {child: summaries[child] for child in entry["children"] if child in summaries}
+        if not entry["files"] and not children:
+            return
+        prompt = build_summary_prompt(repo_name, directory, entry["files"], children, max_input_tokens, provider, model)
+        async with semaphore:
+            try:
+                summary = await generate_text(provider, client, model_kwargs, prompt)
+            except Exception as e:
+                logger.error(f"Error summarizing directory {directory}: {str(e)}")
+                return
+        if summary.strip():
+            summaries[directory] = summary.strip()
+
+    for depth in sorted({_depth(d) for d in directories}, reverse=True):
+        await asyncio.gather(*(summarize(d) for d in directories if _depth(d) == depth))
+        logger.info(f"Summarized directories at depth {depth}: {len(summaries)}/{len(directories)} done")
+
+    return summaries
+
+
+def summary_nodes(summaries: Dict[str, str]) -> List[Document]:
+    """Wrap directory summaries into retrievable documents."""
+    return [
+        Document(
+            text=f"Directory: {directory}\n\n{summary}",
+            meta_data={"file_path": directory, "type": SUMMARY_NODE_TYPE, "title": directory},
+        )
+        for directory, summary in sorted(summaries.items())
+    ]
+
+
+def root_summary(nodes: List[Document]) -> str:
+    """Summary of the repository root among the summary nodes, empty if there is none."""
+    for doc in nodes:
+        meta = doc.meta_data or {}
+        if meta.get("type") == SUMMARY_NODE_TYPE and meta.get("file_path") == ROOT_DIRECTORY:
+            return doc.text.split("\n\n", 1)[-1]
+    return ""
+
+
+def load_summary_nodes(path: str, revision: str) -> Optional[List[Document]]:
+    """
+    Load the summary nodes of a repository if they were built for this revision.
+
+    Args:
+        path: Summary sidecar file
+        revision: Current revision of the repository
+
+    Returns:
+        The embedded summary documents, or None if missing or stale
+    """
+    if not revision or not os.path.exists(path):
+        return None
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read summary index {path}: {e}")
+        return None
+    if data.get("revision") != revision:
+        logger.info(f"Summary index {path} is for another revision, ignoring it")
+        return None
+    nodes = []
+    for node in data.get("nodes", []):
+        doc = Document(text=node["text"], meta_data=node["meta_data"])
+        doc.vector = node["vector"]
+        nodes.append(doc)
+    return nodes
+
+
+def save_summary_nodes(path: str, revision: str, nodes: List[Document]) -> None:
+    """Write embedded summary nodes to the sidecar file."""
+    data = {
+        "revision": revision,
+        "nodes": [
+            {"text": doc.text, "meta_data": doc.meta_data, "vector": [float(v) for v in doc.vector]}
+            for doc in nodes
+        ],
+    }
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp_path, path)
+
+
+def build_summary_index(documents: List[Document], repo_name: str, path: str, revision: str,
+                        embedder_type: str = None) -> List[Document]:
+    """
+    Summarize, embed and store the directory summaries of a repository.
+
+    Args:
+        documents: Chunk documents of the repository
+        repo_name: Name of the repository
+        path: Summary sidecar file
+        revision: Revision the summaries are built for
+        embedder_type: Embedder used for the repository chunks
+
+    Returns:
+        The embedded summary documents
+    """
+    from api.data_pipeline import get_embedding_transformer
+
+    summary_config = configs.get("summary_index", {})
+    provider = summary_config.get("provider") or configs.get("default_provider", "google")
+    model = summary_config.get("model") or configs["providers"][provider].get("default_model")
+    from api.generation import close_provider_clients
+
+    async def summarize() -> Dict[str, str]:
+        try:
+            return await build_directory_summaries(
+                documents,
+                repo_name,
+                provider,
+                model,
+                max_concurrency=summary_config.get("max_concurrency", 4),
+                max_depth=summary_config.get("max_depth", 3),
+                max_input_tokens=summary_config.get("max_input_tokens", 6000),
+            )
+        finally:
+            # The clients of this event loop cannot be reused once it is closed
+            await close_provider_clients()
+
+    summaries = asyncio.run(summarize())
+    nodes = summary_nodes(summaries)
+    if nodes:
+        nodes = get_embedding_transformer(embedder_type)(nodes)
+    save_summary_nodes(path, revision, nodes)
+    logger.info(f"Saved {len(nodes)} directory summaries to {path}")
+    return nodes
+
+
+def schedule_summary_index(documents: List[Document], repo_name: str, path: str, revision: str,
+                           embedder_type: str = None) -> bool:
+    """
+    Build the summary index in a background thread unless a build is already running.
+
+    Args:
+        documents: Chunk documents of the repository
+        repo_name: Name of the repository
+        path: Summary sidecar file
+        revision: Revision the summaries are built for
+        embedder_type: Embedder used for the repository chunks
+
+    Returns:
+        bool: True if a new build was started
+    """
+    with _building_lock:
+        if path in _building:
+            return False
+        _building.add(path)
+
+    def run():
+        try:
+            build_summary_index(documents, repo_name, path, revision, embedder_type)
+        except Exception as e:
+            logger.error(f"Error building summary index for {repo_name}: {str(e)}")
+        finally:
+            with _building_lock:
+                _building.discard(path)
+
+    threading.Thread(target=run, name=f"summary-index-{repo_name}", daemon=True).start()
+    logger.info(f"Building directory summaries for {repo_name} in the background")
+    return True
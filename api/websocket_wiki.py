@@ -1,22 +1,29 @@
+import asyncio
+import json
 import logging
 import os
-from typing import List, Optional, Dict, Any
+from collections import deque
+from contextlib import aclosing
+from typing import AsyncIterator, Deque, List, Optional, Union
 from urllib.parse import unquote
 
-import google.generativeai as genai
-from adalflow.components.model_client.ollama_client import OllamaClient
-from adalflow.core.types import ModelType
 from fastapi import WebSocket, WebSocketDisconnect, HTTPException
 from pydantic import BaseModel, Field
 
-from api.config import get_model_config, configs, OPENROUTER_API_KEY, OPENAI_API_KEY
+from api import metrics
+from api.config import get_model_config, configs
+from api.context_packer import count_model_tokens, get_context_budget, pack_context
+from api.deep_research import run_deep_research
 from api.data_pipeline import count_tokens, get_file_content
-from api.openai_client import OpenAIClient
-from api.openrouter_client import OpenRouterClient
-from api.azureai_client import AzureAIClient
-from api.dashscope_client import DashscopeClient
-from api.rag import RAG
-from api.prompts import DFD_SYSTEM_PROMPT, STRIDE_SYSTEM_PROMPT, CONCISE_DFD_PROMPT, OWASP_THREAT_MODEL_SCHEMA
+from api.federated_search import federated_retrieve, get_cached_rag, repo_label
+from api.generation import get_model_client, generate_text
+from api.rag import Memory, RAG, format_dialog_turn
+from api.stream_registry import AnswerStream, get_stream_registry
+from api.stride_mapreduce import build_threat_model, stride_cache_path
+from api.streaming import CoalescingSender, stream_answer
+from api.prompts import (
+    DFD_SYSTEM_PROMPT, STRIDE_SYSTEM_PROMPT, CONCISE_DFD_PROMPT, OWASP_THREAT_MODEL_SCHEMA, CONVERSATION_SUMMARY_PROMPT,
+)
 
 # Configure logging
 from api.logging_config import setup_logging
@@ -24,6 +31,9 @@ from api.logging_config import setup_logging
 setup_logging()
 logger = logging.getLogger(__name__)
 
+# Conversation summaries being updated after an answer, referenced until they finish
+_summary_tasks = set()
+
 
 # Models for the API
 class ChatMessage(BaseModel):
@@ -41,7 +51,7 @@ class ChatCompletionRequest(BaseModel):
     type: Optional[str] = Field("github", description="Type of repository (e.g., 'github', 'gitlab', 'bitbucket')")
 
     # model parameters
-    provider: str = Field("google", description="Model provider (google, openai, openrouter, ollama, azure)")
+    provider: str = Field("google", description="Model provider (google, openai, openrouter, ollama, azure, bedrock, dashscope)")
     model: Optional[str] = Field(None, description="Model name for the specified provider")
 
     language: Optional[str] = Field("en", description="Language for content generation (e.g., 'en', 'ja', 'zh', 'es', 'kr', 'vi')")
@@ -49,90 +59,394 @@ class ChatCompletionRequest(BaseModel):
     excluded_files: Optional[str] = Field(None, description="Comma-separated list of file patterns to exclude from processing")
     included_dirs: Optional[str] = Field(None, description="Comma-separated list of directories to include exclusively")
     included_files: Optional[str] = Field(None, description="Comma-separated list of file patterns to include exclusively")
+    repos: Optional[List[str]] = Field(None, description="Additional repository URLs or paths to search together with repo_url")
+    resumable: Optional[bool] = Field(False, description="Buffer the answer server-side so a reconnecting client can resume it")
+    session: Optional[bool] = Field(False, description="Keep the connection open for further turns, with the conversation kept server-side")
+    server_research: Optional[bool] = Field(False, description="Run a whole Deep Research in one answer on the server, instead of one iteration per request")
 
-def get_model_client(provider: str, model_name: str, model_config: Dict[str, Any]):
+async def _wait_for_disconnect(websocket: WebSocket, received: Optional[Deque[str]] = None) -> None:
     """
-    Initialize and return the appropriate model client based on the provider.
+    Return once the client has closed the connection.
+
+    Anything else the client sends meanwhile is appended to received, or
+    ignored without it.
     """
-    if provider == "ollama":
-        model = OllamaClient()
-        model_kwargs = {
-            "model": model_config["model"],
-            "stream": True,
-            "options": {
-                "temperature": model_config["temperature"],
-                "top_p": model_config["top_p"],
-                "num_ctx": model_config["num_ctx"]
-            }
-        }
-        return model, model_kwargs
-    elif provider == "openrouter":
-        if not OPENROUTER_API_KEY:
-            logger.warning("OPENROUTER_API_KEY not configured")
-        
-        model = OpenRouterClient()
-        model_kwargs = {
-            "model": model_name,
-            "stream": True,
-            "temperature": model_config["temperature"]
-        }
-        if "top_p" in model_config:
-            model_kwargs["top_p"] = model_config["top_p"]
-        return model, model_kwargs
-    elif provider == "openai":
-        if not OPENAI_API_KEY:
-            logger.warning("OPENAI_API_KEY not configured")
-            
-        model = OpenAIClient()
-        model_kwargs = {
-            "model": model_name,
-            "stream": True,
-            "temperature": model_config["temperature"]
-        }
-        if "top_p" in model_config:
-            model_kwargs["top_p"] = model_config["top_p"]
-        return model, model_kwargs
-    elif provider == "azure":
-        model = AzureAIClient()
-        model_kwargs = {
-            "model": model_name,
-            "stream": True,
-            "temperature": model_config["temperature"],
-            "top_p": model_config.get("top_p")
-        }
-        return model, model_kwargs
-    elif provider == "dashscope":
-        model = DashscopeClient()
-        model_kwargs = {
-            "model": model_name,
-            "stream": True,
-            "temperature": model_config["temperature"],
-            "top_p": model_config.get("top_p")
-        }
-        return model, model_kwargs
-    else:
-        # Google Generative AI
-        model = genai.GenerativeModel(
-            model_name=model_config["model"],
-            generation_config={
-                "temperature": model_config["temperature"],
-                "top_p": model_config["top_p"],
-                "top_k": model_config.get("top_k")
-            }
-        )
-        return model, {}
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            return
+        if received is not None:
+            data = message.get("text")
+            if data is None and message.get("bytes") is not None:
+                data = message["bytes"].decode("utf-8", errors="replace")
+            if data is not None:
+                received.append(data)
+
+
+async def _run_until_disconnect(websocket: WebSocket, coro, received: Optional[Deque[str]] = None) -> bool:
+    """
+    Run a coroutine while watching the connection, cancelling it if the client disconnects first.
+
+    Args:
+        websocket: The connection to watch
+        coro: The work to run
+        received: Collects the messages the client sends while the work runs, None to ignore them
+
+    Returns:
+        bool: True if the client disconnected before the coroutine finished
+    """
+    work = asyncio.create_task(coro)
+    disconnect = asyncio.create_task(_wait_for_disconnect(websocket, received))
+    try:
+        await asyncio.wait({work, disconnect}, return_when=asyncio.FIRST_COMPLETED)
+        return not work.done()
+    finally:
+        work.cancel()
+        disconnect.cancel()
+        await asyncio.gather(work, disconnect, return_exceptions=True)
+
 
 async def handle_websocket_chat(websocket: WebSocket):
     """
     Handle WebSocket connection for chat completions.
     This replaces the HTTP streaming endpoint with a WebSocket connection.
+
+    The answer is generated while watching the connection, so a client that
+    disconnects cancels the DFD pre-pass and the provider stream. Preparing
+    the retriever and retrieving run in worker threads, which cannot be
+    interrupted: a disconnect then stops waiting for them and drops their
+    result.
+
+    With "resumable": true in the request the answer is generated into a
+    server-side stream instead and keeps going when the client disconnects.
+    Frames are then JSON: {"type": "stream", "stream_id"} first, then
+    {"type": "delta", "text", "offset"} where offset is the end of the text
+    received so far, and {"type": "done", "offset"} at the end. A new connection
+    sending {"resume_stream": stream_id, "offset": offset} continues from there.
+
+    With "session": true the connection stays open for further turns. The server
+    prepares the retriever once and keeps the conversation, answers the last
+    message of the request if it is from the user, then reads one
+    {"content", "filePath"?} message per turn. Frames are JSON:
+    {"type": "session"} once the session is ready, then per turn
+    {"type": "delta", "text"} and {"type": "end"}. Messages sent before the
+    end of a turn are queued and answered in order after it.
     """
     await websocket.accept()
 
     try:
-        # Receive and parse the request data
         request_data = await websocket.receive_json()
+    except WebSocketDisconnect:
+        logger.info("WebSocket disconnected")
+        return
+
+    if "resume_stream" in request_data:
+        await _resume_stream(websocket, request_data)
+        return
+
+    if request_data.get("session"):
+        await _run_session(websocket, request_data)
+        return
+
+    if request_data.get("resumable"):
+        stream = get_stream_registry().create()
+        stream.task = asyncio.create_task(_generate_into_stream(stream, request_data))
+        logger.info(f"Answering into resumable stream {stream.stream_id}")
+        await websocket.send_json({"type": "stream", "stream_id": stream.stream_id})
+        await _follow_stream(websocket, stream, 0)
+        return
+
+    if await _run_until_disconnect(websocket, _answer_chat(websocket, request_data)):
+        logger.info("WebSocket client disconnected, cancelling the generation")
+        metrics.increment("deepwiki_client_disconnects_total")
+
+
+async def _generate_into_stream(stream: AnswerStream, request_data: dict):
+    """Answer a chat request into a resumable stream, which stands in for the WebSocket."""
+    try:
+        await _answer_chat(stream, request_data)
+    finally:
+        await stream.close()
+
+
+async def _send_stream(websocket: WebSocket, stream: AnswerStream, offset: int):
+    try:
+        async for text, end_offset in stream.follow(offset):
+            await websocket.send_json({"type": "delta", "text": text, "offset": end_offset})
+    except ValueError as e:
+        logger.warning(f"Cannot resume stream {stream.stream_id}: {str(e)}")
+        await websocket.send_json({"type": "error", "message": "The answer is no longer buffered from this offset"})
+    else:
+        await websocket.send_json({"type": "done", "offset": stream.end_offset})
+    await websocket.close()
+
+
+async def _follow_stream(websocket: WebSocket, stream: AnswerStream, offset: int):
+    """Send a stream's text from an offset on, the generation carries on if the client disconnects."""
+    if await _run_until_disconnect(websocket, _send_stream(websocket, stream, offset)):
+        logger.info(f"WebSocket client disconnected, stream {stream.stream_id} stays open for resuming")
+        metrics.increment("deepwiki_client_disconnects_total")
+
+
+async def _resume_stream(websocket: WebSocket, request_data: dict):
+    stream = get_stream_registry().get(str(request_data["resume_stream"]))
+    if stream is None:
+        await websocket.send_json({"type": "error", "message": "Unknown or expired stream"})
+        await websocket.close()
+        return
+    offset = int(request_data.get("offset") or 0)
+    logger.info(f"Resuming stream {stream.stream_id} from offset {offset}")
+    metrics.increment("deepwiki_stream_resumes_total")
+    await _follow_stream(websocket, stream, offset)
+
+
+class ChatSession:
+    """
+    Conversation state of a persistent WebSocket session.
+
+    Args:
+        request: The request that opened the session, its settings apply to every turn
+        request_rag: RAG with the prepared retriever, its memory holds the conversation
+        federated_sources: Additional repositories searched with the main one, or None
+    """
+
+    def __init__(self, request: ChatCompletionRequest, request_rag: RAG, federated_sources):
+        self.request = request
+        self.rag = request_rag
+        self.federated_sources = federated_sources
+        self.messages: List[ChatMessage] = []
+
+    def turn_request(self, content: str, file_path: Optional[str] = None) -> ChatCompletionRequest:
+        """The request of a new user message, with the conversation so far."""
+        # Copies, as answering strips tags from the messages in place
+        messages = [message.model_copy() for message in self.messages]
+        messages.append(ChatMessage(role="user", content=content))
+        return self.request.model_copy(update={"messages": messages, "filePath": file_path})
+
+    def add_turn(self, content: str, answer: str) -> None:
+        """Record a completed turn in the conversation, answering already added it to the RAG's memory."""
+        self.messages.append(ChatMessage(role="user", content=content))
+        self.messages.append(ChatMessage(role="assistant", content=answer))
+
+
+class _SessionChannel:
+    """Stands in for the WebSocket during one session turn: text goes out as delta frames, closing ends the turn."""
+
+    def __init__(self, websocket: WebSocket):
+        self.websocket = websocket
+        self.ended = False
+        self._parts: List[str] = []
+
+    @property
+    def text(self) -> str:
+        return "".join(self._parts)
+
+    async def send_text(self, text: str) -> None:
+        self._parts.append(text)
+        await self.websocket.send_json({"type": "delta", "text": text})
+
+    async def close(self) -> None:
+        if not self.ended:
+            self.ended = True
+            await self.websocket.send_json({"type": "end"})
+
+
+async def _run_session(websocket: WebSocket, request_data: dict):
+    """Answer turns on one connection with a retriever and conversation kept for its lifetime."""
+    try:
         request = ChatCompletionRequest(**request_data)
+    except ValueError as e:
+        logger.error(f"Invalid session request: {str(e)}")
+        await websocket.send_json({"type": "error", "message": str(e)})
+        await websocket.close()
+        return
+
+    prepared = await _prepare_rag(_SessionChannel(websocket), request)
+    if prepared is None:
+        await websocket.close()
+        return
+    session = ChatSession(request, *prepared)
+    _load_history(session.rag, request.messages)
+
+    turn = None
+    if request.messages and request.messages[-1].role == "user":
+        session.messages = list(request.messages[:-1])
+        turn = {"content": request.messages[-1].content, "filePath": request.filePath}
+    else:
+        session.messages = list(request.messages)
+    logger.info(f"Session opened for {request.repo_url} with {len(session.messages)} previous messages")
+    await websocket.send_json({"type": "session"})
+
+    # Turns the client sent while the previous one was being answered
+    pending: Deque[str] = deque()
+    while True:
+        if turn is None:
+            try:
+                data = pending.popleft() if pending else await websocket.receive_text()
+                turn = json.loads(data)
+            except WebSocketDisconnect:
+                logger.info(f"Session closed after {len(session.messages) // 2} turns")
+                return
+            except ValueError:
+                turn = {}
+        content = turn.get("content") if isinstance(turn, dict) else None
+        if not isinstance(content, str) or not content.strip():
+            await websocket.send_json({"type": "error", "message": "A session message needs a non-empty content"})
+            turn = None
+            continue
+
+        channel = _SessionChannel(websocket)
+        if await _run_until_disconnect(websocket, _answer_chat(channel, turn, session), pending):
+            logger.info("WebSocket client disconnected during a session turn, cancelling the generation")
+            metrics.increment("deepwiki_client_disconnects_total")
+            return
+        session.add_turn(content, channel.text)
+        metrics.increment("deepwiki_session_turns_total")
+        turn = None
+
+
+async def _send_answer(websocket: Union[WebSocket, AnswerStream, _SessionChannel], answer: AsyncIterator[str]) -> str:
+    """Stream an answer in coalesced frames, then close the connection. Returns the text sent."""
+    answer_parts = []
+    async with CoalescingSender(websocket.send_text) as sender, aclosing(answer):
+        async for text in answer:
+            answer_parts.append(text)
+            await sender.add(text)
+    # Explicitly close the WebSocket connection after the response is complete
+    await websocket.close()
+    return "".join(answer_parts)
+
+
+def _remember_turn(request: ChatCompletionRequest, request_rag: RAG, user_content: str, answer: str,
+                   model, model_kwargs: dict) -> None:
+    """Add an answered turn to the RAG's memory and update its summary in the background."""
+    request_rag.memory.add_dialog_turn(user_query=user_content, assistant_response=answer)
+    _refresh_conversation_summary(request, request_rag.memory, model, model_kwargs)
+
+
+def _refresh_conversation_summary(request: ChatCompletionRequest, memory: Memory, model, model_kwargs: dict) -> None:
+    """Fold turns that fell out of the memory's token budget into its summary, in the background."""
+    if not memory.token_budget:
+        return
+
+    async def summarize(summary: str, turns: list) -> str:
+        prompt = CONVERSATION_SUMMARY_PROMPT.format(repo_name=repo_label(request.repo_url)) + "\n\n"
+        if summary:
+            prompt += f"<previous_summary>\n{summary}\n</previous_summary>\n\n"
+        prompt += "<new_turns>\n" + "".join(format_dialog_turn(turn) for turn in turns) + "</new_turns>\n\n"
+        prompt += "<query>Write the updated summary of the conversation.</query>\n\nAssistant: "
+        return (await generate_text(request.provider, model, model_kwargs, prompt)).strip()
+
+    async def refresh():
+        try:
+            await memory.refresh_summary(summarize)
+        except Exception as e:
+            logger.warning(f"Could not update the conversation summary: {str(e)}")
+
+    task = asyncio.create_task(refresh())
+    _summary_tasks.add(task)
+    task.add_done_callback(_summary_tasks.discard)
+
+
+async def _prepare_rag(websocket: Union[WebSocket, AnswerStream, _SessionChannel], request: ChatCompletionRequest):
+    """
+    Create the RAG of a request and prepare its retriever, reporting failures to the client.
+
+    Returns:
+        A (RAG, federated sources or None) tuple, or None if the retriever could not be prepared
+    """
+    # Create a new RAG instance for this request
+    try:
+        request_rag = RAG(provider=request.provider, model=request.model)
+
+        # Extract custom file filter parameters if provided
+        excluded_dirs = None
+        excluded_files = None
+        included_dirs = None
+        included_files = None
+
+        if request.excluded_dirs:
+            excluded_dirs = [unquote(dir_path) for dir_path in request.excluded_dirs.split('\n') if dir_path.strip()]
+            logger.info(f"Using custom excluded directories: {excluded_dirs}")
+        if request.excluded_files:
+            excluded_files = [unquote(file_pattern) for file_pattern in request.excluded_files.split('\n') if file_pattern.strip()]
+            logger.info(f"Using custom excluded files: {excluded_files}")
+        if request.included_dirs:
+            included_dirs = [unquote(dir_path) for dir_path in request.included_dirs.split('\n') if dir_path.strip()]
+            logger.info(f"Using custom included directories: {included_dirs}")
+        if request.included_files:
+            included_files = [unquote(file_pattern) for file_pattern in request.included_files.split('\n') if file_pattern.strip()]
+            logger.info(f"Using custom included files: {included_files}")
+
+        def prepare():
+            request_rag.prepare_retriever(request.repo_url, request.type, request.token, excluded_dirs, excluded_files, included_dirs, included_files)
+            logger.info(f"Retriever prepared for {request.repo_url}")
+
+            # Additional repositories are searched together with the main one
+            sources = None
+            if request.repos:
+                sources = [(repo_label(request.repo_url), request_rag)]
+                for repo in request.repos:
+                    sources.append(
+                        (repo_label(repo), get_cached_rag(repo, request.type, request.token, request.provider, request.model))
+                    )
+                logger.info(f"Federated search across {len(sources)} repositories")
+            return sources
+
+        # Loading or building the index blocks, so it runs off the event loop
+        federated_sources = await asyncio.to_thread(prepare)
+    except ValueError as e:
+        if "No valid documents with embeddings found" in str(e):
+            logger.error(f"No valid embeddings found: {str(e)}")
+            await websocket.send_text("Error: No valid document embeddings found. This may be due to embedding size inconsistencies or API errors during document processing. Please try again or check your repository content.")
+            await websocket.close()
+            return None
+        else:
+            logger.error(f"ValueError preparing retriever: {str(e)}")
+            await websocket.send_text(f"Error preparing retriever: {str(e)}")
+            await websocket.close()
+            return None
+    except Exception as e:
+        logger.error(f"Error preparing retriever: {str(e)}")
+        # Check for specific embedding-related errors
+        if "All embeddings should be of the same size" in str(e):
+            await websocket.send_text("Error: Inconsistent embedding sizes detected. Some documents may have failed to embed properly. Please try again.")
+        else:
+            await websocket.send_text(f"Error preparing retriever: {str(e)}")
+        await websocket.close()
+        return None
+
+    return request_rag, federated_sources
+
+
+def _load_history(request_rag: RAG, messages: List[ChatMessage]):
+    """Add the user and assistant turns before the last message to the RAG's memory."""
+    # Process previous messages to build conversation history
+    for i in range(0, len(messages) - 1, 2):
+        if i + 1 < len(messages):
+            user_msg = messages[i]
+            assistant_msg = messages[i + 1]
+
+            if user_msg.role == "user" and assistant_msg.role == "assistant":
+                request_rag.memory.add_dialog_turn(
+                    user_query=user_msg.content,
+                    assistant_response=assistant_msg.content
+                )
+
+
+async def _answer_chat(websocket: Union[WebSocket, AnswerStream, _SessionChannel], request_data: dict,
+                       session: Optional[ChatSession] = None):
+    """
+    Answer one chat request on an accepted WebSocket connection, or into a resumable stream.
+
+    Within a session, request_data only holds the new message and the session
+    provides the prepared retriever and the conversation so far.
+    """
+    try:
+        if session is None:
+            request = ChatCompletionRequest(**request_data)
+        else:
+            request = session.turn_request(request_data["content"], request_data.get("filePath"))
 
         # Check if request contains very large input
         input_too_large = False
@@ -145,51 +459,15 @@ async def handle_websocket_chat(websocket: WebSocket):
                     logger.warning(f"Request exceeds recommended token limit ({tokens} > 7500)")
                     input_too_large = True
 
-        # Create a new RAG instance for this request
-        try:
-            request_rag = RAG(provider=request.provider, model=request.model)
-
-            # Extract custom file filter parameters if provided
-            excluded_dirs = None
-            excluded_files = None
-            included_dirs = None
-            included_files = None
-
-            if request.excluded_dirs:
-                excluded_dirs = [unquote(dir_path) for dir_path in request.excluded_dirs.split('\n') if dir_path.strip()]
-                logger.info(f"Using custom excluded directories: {excluded_dirs}")
-            if request.excluded_files:
-                excluded_files = [unquote(file_pattern) for file_pattern in request.excluded_files.split('\n') if file_pattern.strip()]
-                logger.info(f"Using custom excluded files: {excluded_files}")
-            if request.included_dirs:
-                included_dirs = [unquote(dir_path) for dir_path in request.included_dirs.split('\n') if dir_path.strip()]
-                logger.info(f"Using custom included directories: {included_dirs}")
-            if request.included_files:
-                included_files = [unquote(file_pattern) for file_pattern in request.included_files.split('\n') if file_pattern.strip()]
-                logger.info(f"Using custom included files: {included_files}")
-
-            request_rag.prepare_retriever(request.repo_url, request.type, request.token, excluded_dirs, excluded_files, included_dirs, included_files)
-            logger.info(f"Retriever prepared for {request.repo_url}")
-        except ValueError as e:
-            if "No valid documents with embeddings found" in str(e):
-                logger.error(f"No valid embeddings found: {str(e)}")
-                await websocket.send_text("Error: No valid document embeddings found. This may be due to embedding size inconsistencies or API errors during document processing. Please try again or check your repository content.")
-                await websocket.close()
-                return
-            else:
-                logger.error(f"ValueError preparing retriever: {str(e)}")
-                await websocket.send_text(f"Error preparing retriever: {str(e)}")
-                await websocket.close()
+        if session is None:
+            prepared = await _prepare_rag(websocket, request)
+            if prepared is None:
                 return
-        except Exception as e:
-            logger.error(f"Error preparing retriever: {str(e)}")
-            # Check for specific embedding-related errors
-            if "All embeddings should be of the same size" in str(e):
-                await websocket.send_text("Error: Inconsistent embedding sizes detected. Some documents may have failed to embed properly. Please try again.")
-            else:
-                await websocket.send_text(f"Error preparing retriever: {str(e)}")
-            await websocket.close()
-            return
+            request_rag, federated_sources = prepared
+            _load_history(request_rag, request.messages)
+        else:
+            # The session keeps the warm retriever and the conversation memory
+            request_rag, federated_sources = session.rag, session.federated_sources
 
         # Validate request
         if not request.messages or len(request.messages) == 0:
@@ -202,18 +480,8 @@ async def handle_websocket_chat(websocket: WebSocket):
             await websocket.send_text("Error: Last message must be from the user")
             await websocket.close()
             return
-
-        # Process previous messages to build conversation history
-        for i in range(0, len(request.messages) - 1, 2):
-            if i + 1 < len(request.messages):
-                user_msg = request.messages[i]
-                assistant_msg = request.messages[i + 1]
-
-                if user_msg.role == "user" and assistant_msg.role == "assistant":
-                    request_rag.memory.add_dialog_turn(
-                        user_query=user_msg.content,
-                        assistant_response=assistant_msg.content
-                    )
+        # As sent, for the conversation memory, before commands are stripped below
+        user_content = last_message.content
 
         # Check if this is a Deep Research request
         is_deep_research = False
@@ -264,52 +532,69 @@ async def handle_websocket_chat(websocket: WebSocket):
             last_message.content = last_message.content.replace("/stride", "").strip()
             logger.info("STRIDE request detected")
 
+        # "/stride --full" analyses every partition of the repository instead of the retrieved chunks
+        stride_full = False
+        if is_stride_request and "--full" in last_message.content:
+            stride_full = True
+            last_message.content = last_message.content.replace("--full", "").strip()
+            logger.info("Full-repository STRIDE request detected")
+
         # Get the query from the last message
         query = last_message.content
 
+        # The server plans and retrieves for the whole research itself
+        server_research = is_deep_research and bool(request.server_research)
+
+        # Fetch file content if provided, from the repository index when the file is in it
+        file_content = ""
+        if request.filePath:
+            file_content = request_rag.get_file_content(request.filePath)
+            if file_content:
+                logger.info(f"Loaded content for file {request.filePath} from the repository index")
+            else:
+                try:
+                    # Read from the local clone, the Git host API is only a fallback
+                    file_content = await asyncio.to_thread(
+                        get_file_content, request.repo_url, request.filePath, request.type, request.token,
+                        request_rag.db_manager.repo_paths["save_repo_dir"]
+                    )
+                    logger.info(f"Successfully retrieved content for file: {request.filePath}")
+                except Exception as e:
+                    logger.error(f"Error retrieving file content: {str(e)}")
+                    # Continue without file content if there's an error
+
         # Only retrieve documents if input is not too large
         context_text = ""
         retrieved_documents = None
 
-        if not input_too_large:
+        if not input_too_large and not server_research and not stride_full:
             try:
-                # If filePath exists, modify the query for RAG to focus on the file
-                rag_query = query
-                if request.filePath:
-                    # Use the file path to get relevant context about the file
-                    rag_query = f"Contexts related to {request.filePath}"
-                    logger.info(f"Modified RAG query to focus on file: {request.filePath}")
-
                 # Try to perform RAG retrieval
                 try:
                     # This will use the actual RAG implementation
-                    retrieved_documents = request_rag(rag_query, language=request.language)
+                    # Tokens left for context once the conversation is in the prompt
+                    prompt_tokens = count_model_tokens(
+                        "\n".join(msg.content for msg in request.messages) + file_content, request.provider, request.model
+                    )
+                    token_budget = get_context_budget(request.provider, request.model, prompt_tokens)
+                    # The query embedding call and the search block, so they run off the event loop
+                    if federated_sources:
+                        retrieved_documents = await asyncio.to_thread(
+                            federated_retrieve, federated_sources, query, token_budget, request.provider, request.model
+                        )
+                    else:
+                        retrieved_documents = await asyncio.to_thread(
+                            request_rag, query, language=request.language, token_budget=token_budget,
+                            provider=request.provider, model=request.model, file_path=request.filePath
+                        )
 
                     if retrieved_documents and retrieved_documents[0].documents:
                         # Format context for the prompt in a more structured way
                         documents = retrieved_documents[0].documents
                         logger.info(f"Retrieved {len(documents)} documents")
 
-                        # Group documents by file path
-                        docs_by_file = {}
-                        for doc in documents:
-                            file_path = doc.meta_data.get('file_path', 'unknown')
-                            if file_path not in docs_by_file:
-                                docs_by_file[file_path] = []
-                            docs_by_file[file_path].append(doc)
-
-                        # Format context text with file path grouping
-                        context_parts = []
-                        for file_path, docs in docs_by_file.items():
-                            # Add file header with metadata
-                            header = f"## File Path: {file_path}\n\n"
-                            # Add document content
-                            content = "\n\n".join([doc.text for doc in docs])
-
-                            context_parts.append(f"{header}{content}")
-
-                        # Join all parts with clear separation
-                        context_text = "\n\n" + "-" * 10 + "\n\n".join(context_parts)
+                        # Merge, deduplicate and fit the chunks to the model's context window
+                        context_text = pack_context(documents, token_budget, request.provider, request.model).text
                     else:
                         logger.warning("No documents retrieved from RAG")
                 except Exception as e:
@@ -336,8 +621,36 @@ async def handle_websocket_chat(websocket: WebSocket):
         model_config = get_model_config(request.provider, request.model)["model_kwargs"]
         model, model_kwargs = get_model_client(request.provider, request.model, model_config)
 
+        prompt_vars = {"repo_type": repo_type, "repo_url": repo_url, "repo_name": repo_name,
+                       "language_name": language_name}
+        if stride_full:
+            repo_paths = request_rag.db_manager.repo_paths
+            cache_path = stride_cache_path(repo_paths["save_db_file"]) if repo_paths else None
+            answer_parts = []
+            # The map step can take minutes on a large repository, progress streams while it runs
+            async with CoalescingSender(websocket.send_text) as sender:
+                async def send_progress(text: str) -> None:
+                    answer_parts.append(text)
+                    await sender.add(text)
+
+                threat_model = await build_threat_model(request_rag.transformed_docs, prompt_vars, request.provider,
+                                                        request.model, model, model_kwargs, cache_path,
+                                                        on_progress=send_progress)
+                await send_progress(f"\n```json\n{json.dumps(threat_model, indent=2, ensure_ascii=False)}\n```\n")
+            await websocket.close()
+            _remember_turn(request, request_rag, user_content, "".join(answer_parts), model, model_kwargs)
+            return
+
+        if server_research:
+            research = run_deep_research(query, request_rag, federated_sources, prompt_vars, request.provider,
+                                         request.model, model, model_kwargs)
+            answer_text = await _send_answer(websocket, research)
+            _remember_turn(request, request_rag, user_content, answer_text, model, model_kwargs)
+            return
+
         # Intermediate DFD Generation
         generated_dfd = ""
+        repo_overview = ""
         if is_stride_request:
             # Generate full DFD for STRIDE analysis
             logger.info("Generating internal DFD for STRIDE analysis...")
@@ -357,54 +670,20 @@ async def handle_websocket_chat(websocket: WebSocket):
             if request.provider == "ollama":
                 full_dfd_prompt += " /no_think"
 
-            # Call model (non-streaming if possible, or collect stream)
-            # For simplicity, we'll reuse the streaming client and collect chunks
-            # Note: Ideally we should use a non-streaming call, but the client setup is for streaming.
-            # We'll collect the stream.
-            
-            dfd_response_text = ""
+            # Collect the streamed response of the chat model
             try:
-                # Create api_kwargs for DFD generation
-                dfd_api_kwargs = model.convert_inputs_to_api_kwargs(
-                    input=full_dfd_prompt,
-                    model_kwargs=model_kwargs,
-                    model_type=ModelType.LLM
-                )
-                
-                # We need to handle different providers again here or assume the client interface is consistent
-                # The helper returns (model, model_kwargs). We need to call it.
-                # Since the clients have different interfaces (acall vs generate_content), we might need another helper or just handle it.
-                # To avoid code duplication, let's assume we can use the same logic as the main response loop but collect instead of send.
-                
-                # Actually, let's implement a quick helper for non-streaming generation or just do it inline
-                if request.provider == "google":
-                    resp = model.generate_content(full_dfd_prompt)
-                    dfd_response_text = resp.text
-                else:
-                    response = await model.acall(api_kwargs=dfd_api_kwargs, model_type=ModelType.LLM)
-                    async for chunk in response:
-                        if request.provider == "ollama":
-                            text = getattr(chunk, 'response', None) or getattr(chunk, 'text', None) or str(chunk)
-                            if text and not text.startswith('model=') and not text.startswith('created_at='):
-                                dfd_response_text += text.replace('<think>', '').replace('</think>', '')
-                        elif request.provider == "openai" or request.provider == "azure" or request.provider == "dashscope":
-                            choices = getattr(chunk, "choices", [])
-                            if len(choices) > 0:
-                                delta = getattr(choices[0], "delta", None)
-                                if delta is not None:
-                                    text = getattr(delta, "content", None)
-                                    if text is not None:
-                                        dfd_response_text += text
-                        elif request.provider == "openrouter":
-                            dfd_response_text += str(chunk)
-                            
-                generated_dfd = dfd_response_text
+                generated_dfd = await generate_text(request.provider, model, model_kwargs, full_dfd_prompt)
                 logger.info("Internal DFD generated successfully")
-                
+
             except Exception as e:
                 logger.error(f"Error generating internal DFD: {str(e)}")
                 generated_dfd = "Error generating DFD. Proceeding with raw context."
 
+        elif not is_dfd_request and not is_deep_research and request_rag.repo_summary:
+            # The precomputed repository summary replaces the concise DFD call
+            logger.info("Using the repository summary as architectural context")
+            repo_overview = request_rag.repo_summary
+
         elif not is_dfd_request and not is_deep_research:
             # Generate Concise DFD for normal chat
             logger.info("Generating concise DFD for context...")
@@ -418,37 +697,8 @@ async def handle_websocket_chat(websocket: WebSocket):
                 concise_prompt += " /no_think"
                 
             # Call model to get concise DFD
-            # Similar logic to above, collecting the response
-            dfd_response_text = ""
             try:
-                if request.provider == "google":
-                    resp = model.generate_content(concise_prompt)
-                    dfd_response_text = resp.text
-                else:
-                    # We need to recreate api_kwargs because the input changed
-                    concise_api_kwargs = model.convert_inputs_to_api_kwargs(
-                        input=concise_prompt,
-                        model_kwargs=model_kwargs,
-                        model_type=ModelType.LLM
-                    )
-                    response = await model.acall(api_kwargs=concise_api_kwargs, model_type=ModelType.LLM)
-                    async for chunk in response:
-                        if request.provider == "ollama":
-                            text = getattr(chunk, 'response', None) or getattr(chunk, 'text', None) or str(chunk)
-                            if text and not text.startswith('model=') and not text.startswith('created_at='):
-                                dfd_response_text += text.replace('<think>', '').replace('</think>', '')
-                        elif request.provider == "openai" or request.provider == "azure" or request.provider == "dashscope":
-                            choices = getattr(chunk, "choices", [])
-                            if len(choices) > 0:
-                                delta = getattr(choices[0], "delta", None)
-                                if delta is not None:
-                                    text = getattr(delta, "content", None)
-                                    if text is not None:
-                                        dfd_response_text += text
-                        elif request.provider == "openrouter":
-                            dfd_response_text += str(chunk)
-                            
-                generated_dfd = dfd_response_text
+                generated_dfd = await generate_text(request.provider, model, model_kwargs, concise_prompt)
                 logger.info(f"Concise DFD generated: {generated_dfd[:100]}...")
             except Exception as e:
                 logger.error(f"Error generating concise DFD: {str(e)}")
@@ -614,21 +864,14 @@ This file contains...
 - Use markdown formatting to improve readability
 </style>"""
 
-        # Fetch file content if provided
-        file_content = ""
-        if request.filePath:
-            try:
-                file_content = get_file_content(request.repo_url, request.filePath, request.type, request.token)
-                logger.info(f"Successfully retrieved content for file: {request.filePath}")
-            except Exception as e:
-                logger.error(f"Error retrieving file content: {str(e)}")
-                # Continue without file content if there's an error
-
         # Format conversation history
         conversation_history = ""
         for turn_id, turn in request_rag.memory().items():
             if not isinstance(turn_id, int) and hasattr(turn, 'user_query') and hasattr(turn, 'assistant_response'):
                 conversation_history += f"<turn>\n<user>{turn.user_query.query_str}</user>\n<assistant>{turn.assistant_response.response_str}</assistant>\n</turn>\n"
+        if request_rag.memory.summary:
+            # Older turns folded into the running summary
+            conversation_history = f"<summary>\n{request_rag.memory.summary}\n</summary>\n" + conversation_history
 
         # Create the prompt with context
         prompt = f"/no_think {system_prompt}\n\n"
@@ -648,6 +891,8 @@ This file contains...
         # Inject Generated DFD into context if available
         if generated_dfd:
             context_text = f"## Generated Data Flow Diagram (Architectural Context)\n{generated_dfd}\n\n" + context_text
+        elif repo_overview:
+            context_text = f"## Repository Overview (Architectural Context)\n{repo_overview}\n\n" + context_text
             
         if context_text.strip():
             prompt += f"{CONTEXT_START}\n{context_text}\n{CONTEXT_END}\n\n"
@@ -661,231 +906,25 @@ This file contains...
         if request.provider == "ollama":
             prompt += " /no_think"
 
-        # Update api_kwargs with the final prompt
-        api_kwargs = model.convert_inputs_to_api_kwargs(
-            input=prompt,
-            model_kwargs=model_kwargs,
-            model_type=ModelType.LLM
-        )
+        # Smaller prompt without the retrieved context, for when the full one exceeds the model's token limit
+        simplified_prompt = f"/no_think {system_prompt}\n\n"
+        if conversation_history:
+            simplified_prompt += f"<conversation_history>\n{conversation_history}</conversation_history>\n\n"
 
-        # Process the response based on the provider
-        try:
-            if request.provider == "ollama":
-                # Get the response and handle it properly using the previously created api_kwargs
-                response = await model.acall(api_kwargs=api_kwargs, model_type=ModelType.LLM)
-                # Handle streaming response from Ollama
-                async for chunk in response:
-                    text = getattr(chunk, 'response', None) or getattr(chunk, 'text', None) or str(chunk)
-                    if text and not text.startswith('model=') and not text.startswith('created_at='):
-                        text = text.replace('<think>', '').replace('</think>', '')
-                        await websocket.send_text(text)
-                # Explicitly close the WebSocket connection after the response is complete
-                await websocket.close()
-            elif request.provider == "openrouter":
-                try:
-                    # Get the response and handle it properly using the previously created api_kwargs
-                    logger.info("Making OpenRouter API call")
-                    response = await model.acall(api_kwargs=api_kwargs, model_type=ModelType.LLM)
-                    # Handle streaming response from OpenRouter
-                    async for chunk in response:
-                        await websocket.send_text(chunk)
-                    # Explicitly close the WebSocket connection after the response is complete
-                    await websocket.close()
-                except Exception as e_openrouter:
-                    logger.error(f"Error with OpenRouter API: {str(e_openrouter)}")
-                    error_msg = f"\nError with OpenRouter API: {str(e_openrouter)}\n\nPlease check that you have set the OPENROUTER_API_KEY environment variable with a valid API key."
-                    await websocket.send_text(error_msg)
-                    # Close the WebSocket connection after sending the error message
-                    await websocket.close()
-            elif request.provider == "openai":
-                try:
-                    # Get the response and handle it properly using the previously created api_kwargs
-                    logger.info("Making Openai API call")
-                    response = await model.acall(api_kwargs=api_kwargs, model_type=ModelType.LLM)
-                    # Handle streaming response from Openai
-                    async for chunk in response:
-                        choices = getattr(chunk, "choices", [])
-                        if len(choices) > 0:
-                            delta = getattr(choices[0], "delta", None)
-                            if delta is not None:
-                                text = getattr(delta, "content", None)
-                                if text is not None:
-                                    await websocket.send_text(text)
-                    # Explicitly close the WebSocket connection after the response is complete
-                    await websocket.close()
-                except Exception as e_openai:
-                    logger.error(f"Error with Openai API: {str(e_openai)}")
-                    error_msg = f"\nError with Openai API: {str(e_openai)}\n\nPlease check that you have set the OPENAI_API_KEY environment variable with a valid API key."
-                    await websocket.send_text(error_msg)
-                    # Close the WebSocket connection after sending the error message
-                    await websocket.close()
-            elif request.provider == "azure":
-                try:
-                    # Get the response and handle it properly using the previously created api_kwargs
-                    logger.info("Making Azure AI API call")
-                    response = await model.acall(api_kwargs=api_kwargs, model_type=ModelType.LLM)
-                    # Handle streaming response from Azure AI
-                    async for chunk in response:
-                        choices = getattr(chunk, "choices", [])
-                        if len(choices) > 0:
-                            delta = getattr(choices[0], "delta", None)
-                            if delta is not None:
-                                text = getattr(delta, "content", None)
-                                if text is not None:
-                                    await websocket.send_text(text)
-                    # Explicitly close the WebSocket connection after the response is complete
-                    await websocket.close()
-                except Exception as e_azure:
-                    logger.error(f"Error with Azure AI API: {str(e_azure)}")
-                    error_msg = f"\nError with Azure AI API: {str(e_azure)}\n\nPlease check that you have set the AZURE_OPENAI_API_KEY, AZURE_OPENAI_ENDPOINT, and AZURE_OPENAI_VERSION environment variables with valid values."
-                    await websocket.send_text(error_msg)
-                    # Close the WebSocket connection after sending the error message
-                    await websocket.close()
-            else:
-                # Generate streaming response
-                response = model.generate_content(prompt, stream=True)
-                # Stream the response
-                for chunk in response:
-                    if hasattr(chunk, 'text'):
-                        await websocket.send_text(chunk.text)
-                # Explicitly close the WebSocket connection after the response is complete
-                await websocket.close()
-
-        except Exception as e_outer:
-            logger.error(f"Error in streaming response: {str(e_outer)}")
-            error_message = str(e_outer)
-
-            # Check for token limit errors
-            if "maximum context length" in error_message or "token limit" in error_message or "too many tokens" in error_message:
-                # If we hit a token limit error, try again without context
-                logger.warning("Token limit exceeded, retrying without context")
-                try:
-                    # Create a simplified prompt without context
-                    simplified_prompt = f"/no_think {system_prompt}\n\n"
-                    if conversation_history:
-                        simplified_prompt += f"<conversation_history>\n{conversation_history}</conversation_history>\n\n"
-
-                    # Include file content in the fallback prompt if it was retrieved
-                    if request.filePath and file_content:
-                        simplified_prompt += f"<currentFileContent path=\"{request.filePath}\">\n{file_content}\n</currentFileContent>\n\n"
-
-                    simplified_prompt += "<note>Answering without retrieval augmentation due to input size constraints.</note>\n\n"
-                    simplified_prompt += f"<query>\n{query}\n</query>\n\nAssistant: "
-
-                    if request.provider == "ollama":
-                        simplified_prompt += " /no_think"
-
-                        # Create new api_kwargs with the simplified prompt
-                        fallback_api_kwargs = model.convert_inputs_to_api_kwargs(
-                            input=simplified_prompt,
-                            model_kwargs=model_kwargs,
-                            model_type=ModelType.LLM
-                        )
+        # Include file content in the fallback prompt if it was retrieved
+        if request.filePath and file_content:
+            simplified_prompt += f"<currentFileContent path=\"{request.filePath}\">\n{file_content}\n</currentFileContent>\n\n"
 
-                        # Get the response using the simplified prompt
-                        fallback_response = await model.acall(api_kwargs=fallback_api_kwargs, model_type=ModelType.LLM)
-
-                        # Handle streaming fallback_response from Ollama
-                        async for chunk in fallback_response:
-                            text = getattr(chunk, 'response', None) or getattr(chunk, 'text', None) or str(chunk)
-                            if text and not text.startswith('model=') and not text.startswith('created_at='):
-                                text = text.replace('<think>', '').replace('</think>', '')
-                                await websocket.send_text(text)
-                    elif request.provider == "openrouter":
-                        try:
-                            # Create new api_kwargs with the simplified prompt
-                            fallback_api_kwargs = model.convert_inputs_to_api_kwargs(
-                                input=simplified_prompt,
-                                model_kwargs=model_kwargs,
-                                model_type=ModelType.LLM
-                            )
-
-                            # Get the response using the simplified prompt
-                            logger.info("Making fallback OpenRouter API call")
-                            fallback_response = await model.acall(api_kwargs=fallback_api_kwargs, model_type=ModelType.LLM)
-
-                            # Handle streaming fallback_response from OpenRouter
-                            async for chunk in fallback_response:
-                                await websocket.send_text(chunk)
-                        except Exception as e_fallback:
-                            logger.error(f"Error with OpenRouter API fallback: {str(e_fallback)}")
-                            error_msg = f"\nError with OpenRouter API fallback: {str(e_fallback)}\n\nPlease check that you have set the OPENROUTER_API_KEY environment variable with a valid API key."
-                            await websocket.send_text(error_msg)
-                    elif request.provider == "openai":
-                        try:
-                            # Create new api_kwargs with the simplified prompt
-                            fallback_api_kwargs = model.convert_inputs_to_api_kwargs(
-                                input=simplified_prompt,
-                                model_kwargs=model_kwargs,
-                                model_type=ModelType.LLM
-                            )
-
-                            # Get the response using the simplified prompt
-                            logger.info("Making fallback Openai API call")
-                            fallback_response = await model.acall(api_kwargs=fallback_api_kwargs, model_type=ModelType.LLM)
-
-                            # Handle streaming fallback_response from Openai
-                            async for chunk in fallback_response:
-                                text = chunk if isinstance(chunk, str) else getattr(chunk, 'text', str(chunk))
-                                await websocket.send_text(text)
-                        except Exception as e_fallback:
-                            logger.error(f"Error with Openai API fallback: {str(e_fallback)}")
-                            error_msg = f"\nError with Openai API fallback: {str(e_fallback)}\n\nPlease check that you have set the OPENAI_API_KEY environment variable with a valid API key."
-                            await websocket.send_text(error_msg)
-                    elif request.provider == "azure":
-                        try:
-                            # Create new api_kwargs with the simplified prompt
-                            fallback_api_kwargs = model.convert_inputs_to_api_kwargs(
-                                input=simplified_prompt,
-                                model_kwargs=model_kwargs,
-                                model_type=ModelType.LLM
-                            )
-
-                            # Get the response using the simplified prompt
-                            logger.info("Making fallback Azure AI API call")
-                            fallback_response = await model.acall(api_kwargs=fallback_api_kwargs, model_type=ModelType.LLM)
-
-                            # Handle streaming fallback response from Azure AI
-                            async for chunk in fallback_response:
-                                choices = getattr(chunk, "choices", [])
-                                if len(choices) > 0:
-                                    delta = getattr(choices[0], "delta", None)
-                                    if delta is not None:
-                                        text = getattr(delta, "content", None)
-                                        if text is not None:
-                                            await websocket.send_text(text)
-                        except Exception as e_fallback:
-                            logger.error(f"Error with Azure AI API fallback: {str(e_fallback)}")
-                            error_msg = f"\nError with Azure AI API fallback: {str(e_fallback)}\n\nPlease check that you have set the AZURE_OPENAI_API_KEY, AZURE_OPENAI_ENDPOINT, and AZURE_OPENAI_VERSION environment variables with valid values."
-                            await websocket.send_text(error_msg)
-                    else:
-                        # Initialize Google Generative AI model
-                        model_config = get_model_config(request.provider, request.model)
-                        fallback_model = genai.GenerativeModel(
-                            model_name=model_config["model"],
-                            generation_config={
-                                "temperature": model_config["model_kwargs"].get("temperature", 0.7),
-                                "top_p": model_config["model_kwargs"].get("top_p", 0.8),
-                                "top_k": model_config["model_kwargs"].get("top_k", 40)
-                            }
-                        )
+        simplified_prompt += "<note>Answering without retrieval augmentation due to input size constraints.</note>\n\n"
+        simplified_prompt += f"<query>\n{query}\n</query>\n\nAssistant: "
 
-                        # Get streaming response using simplified prompt
-                        fallback_response = fallback_model.generate_content(simplified_prompt, stream=True)
-                        # Stream the fallback response
-                        for chunk in fallback_response:
-                            if hasattr(chunk, 'text'):
-                                await websocket.send_text(chunk.text)
-                except Exception as e2:
-                    logger.error(f"Error in fallback streaming response: {str(e2)}")
-                    await websocket.send_text(f"\nI apologize, but your request is too large for me to process. Please try a shorter query or break it into smaller parts.")
-                    # Close the WebSocket connection after sending the error message
-                    await websocket.close()
-            else:
-                # For other errors, return the error message
-                await websocket.send_text(f"\nError: {error_message}")
-                # Close the WebSocket connection after sending the error message
-                await websocket.close()
+        if request.provider == "ollama":
+            simplified_prompt += " /no_think"
+
+        # Stream the response in coalesced frames, errors are sent as text in place of the answer
+        answer = stream_answer(request.provider, model, model_kwargs, prompt, simplified_prompt)
+        answer_text = await _send_answer(websocket, answer)
+        _remember_turn(request, request_rag, user_content, answer_text, model, model_kwargs)
 
     except WebSocketDisconnect:
         logger.info("WebSocket disconnected")
@@ -0,0 +1,113 @@
+"""
+Benchmark per-request provider clients against the shared, pooled ones.
+
+Starts a local HTTPS stub of the OpenRouter chat completions endpoint (with a
+self-signed certificate, so every new connection pays a TCP and TLS
+handshake) and streams completions through OpenRouterClient, either creating
+a client and session per request as before or reusing the registry client
+whose keep-alive connections survive between requests. Reports latency per
+request and the number of connections the server accepted.
+
+Usage: python scripts/bench_client_pool.py --requests 200 --concurrency 8
+"""
+
+import argparse
+import asyncio
+import os
+import ssl
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+
+def make_certificate(directory):
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "1", "-subj", "/CN=localhost",
+                    "-addext", "subjectAltName=DNS:localhost", "-keyout", key, "-out", cert],
+                   check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    return cert, key
+
+
+async def completions(request):
+    from aiohttp import web
+
+    request.app["peers"].add(request.transport.get_extra_info("peername"))
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+    await response.prepare(request)
+    for token in ("Hello", " world"):
+        await response.write(f'data: {{"choices": [{{"delta": {{"content": "{token}"}}}}]}}\n\n'.encode())
+    await response.write(b"data: [DONE]\n\n")
+    return response
+
+
+async def run(mode, base_url, total, concurrency):
+    from adalflow.core.types import ModelType
+    from api.generation import close_provider_clients, get_provider_client
+    from api.openrouter_client import OpenRouterClient
+
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one_request():
+        async with semaphore:
+            start = time.perf_counter()
+            client = get_provider_client("openrouter") if mode == "pooled" else OpenRouterClient()
+            client.async_client = {"api_key": "bench", "base_url": base_url}
+            api_kwargs = client.convert_inputs_to_api_kwargs("Hi", {"model": "bench/model"}, ModelType.LLM)
+            text = "".join([chunk async for chunk in await client.acall(api_kwargs, ModelType.LLM)])
+            if mode != "pooled":
+                await client.aclose()
+            assert text == "Hello world", text
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(one_request() for _ in range(total)))
+    elapsed = time.perf_counter() - start
+    await close_provider_clients()
+    return elapsed, latencies
+
+
+async def main_async(args, cert, key):
+    from aiohttp import web
+
+    ssl_context = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    ssl_context.load_cert_chain(cert, key)
+    for mode in ("per-request", "pooled"):
+        app = web.Application()
+        app["peers"] = set()
+        app.router.add_post("/api/v1/chat/completions", completions)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        site = web.TCPSite(runner, "localhost", 0, ssl_context=ssl_context)
+        await site.start()
+        port = site._server.sockets[0].getsockname()[1]
+        try:
+            elapsed, latencies = await run(mode, f"https://localhost:{port}/api/v1", args.requests,
+                                           args.concurrency)
+        finally:
+            await runner.cleanup()
+        latencies.sort()
+        print(f"{mode:12} {args.requests} requests in {elapsed:.2f}s  "
+              f"p50={statistics.median(latencies) * 1000:.1f}ms  "
+              f"p95={latencies[int(len(latencies) * 0.95) - 1] * 1000:.1f}ms  "
+              f"connections={len(app['peers'])}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        cert, key = make_certificate(tmp)
+        # aiohttp loads the default trust store when imported, so the stub's certificate is added first
+        os.environ["SSL_CERT_FILE"] = cert
+        asyncio.run(main_async(args, cert, key))
+
+
+if __name__ == "__main__":
+    main()
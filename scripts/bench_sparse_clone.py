@@ -0,0 +1,92 @@
+"""
+Benchmark full clones against partial, sparse clones of a large repository.
+
+Builds a synthetic monorepo (source files, vendored node_modules and large
+binary assets) in a local bare remote with partial clone enabled, then clones
+it with ``repository.sparse_checkout`` off and on, and with an included
+directory. Reports wall time, object store size and checked-out files.
+
+Usage: python scripts/bench_sparse_clone.py --services 40 --files-per-service 200
+"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from api.config import configs
+from api.data_pipeline import download_repo
+
+
+def git(*args, cwd=None):
+    subprocess.run(["git", *args], cwd=cwd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+
+
+def make_remote(root, services, files_per_service, asset_kb):
+    work = os.path.join(root, "work")
+    for s in range(services):
+        service = os.path.join(work, "services", f"service{s}")
+        os.makedirs(os.path.join(service, "node_modules", "dep"), exist_ok=True)
+        os.makedirs(os.path.join(service, "assets"), exist_ok=True)
+        for f in range(files_per_service):
+            with open(os.path.join(service, f"module{f}.py"), "w") as out:
+                out.write(f"def handler_{s}_{f}():\n    return {f}\n" * 20)
+            with open(os.path.join(service, "node_modules", "dep", f"vendor{f}.js"), "w") as out:
+                out.write(f"module.exports = {f};\n" * 200)
+        with open(os.path.join(service, "assets", "model.bin"), "wb") as out:
+            out.write(os.urandom(asset_kb * 1024))
+    git("init", "-q", cwd=work)
+    git("add", "-A", cwd=work)
+    git("-c", "user.email=bench@example.com", "-c", "user.name=bench", "commit", "-qm", "synthetic", cwd=work)
+    remote = os.path.join(root, "remote.git")
+    git("clone", "-q", "--bare", work, remote)
+    git("config", "uploadpack.allowFilter", "true", cwd=remote)
+    git("config", "uploadpack.allowAnySHA1InWant", "true", cwd=remote)
+    return "file://" + remote
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(d, f)) for d, _, files in os.walk(path) for f in files)
+
+
+def checked_out_files(path):
+    return sum(len(files) for d, _, files in os.walk(path) if ".git" not in d.split(os.sep))
+
+
+def run(label, remote, target, sparse, **filters):
+    configs.setdefault("repository", {})["sparse_checkout"] = sparse
+    start = time.perf_counter()
+    download_repo(remote, target, **filters)
+    elapsed = time.perf_counter() - start
+    objects_mb = directory_size(os.path.join(target, ".git")) / 1024 / 1024
+    print(f"{label:>28}: {elapsed:6.2f} s  {objects_mb:8.1f} MB in .git  {checked_out_files(target):6d} files")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--services", type=int, default=40)
+    parser.add_argument("--files-per-service", type=int, default=200)
+    parser.add_argument("--asset-kb", type=int, default=2048)
+    args = parser.parse_args()
+
+    root = tempfile.mkdtemp(prefix="bench-sparse-")
+    try:
+        start = time.perf_counter()
+        remote = make_remote(root, args.services, args.files_per_service, args.asset_kb)
+        print(f"Synthetic remote with {args.services} services built in {time.perf_counter() - start:.1f} s")
+
+        run("full clone", remote, os.path.join(root, "full"), sparse=False)
+        run("partial + sparse", remote, os.path.join(root, "sparse"), sparse=True)
+        run("partial + sparse, 1 service", remote, os.path.join(root, "one"), sparse=True,
+            included_dirs=["service0"])
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+"""
+Benchmark sending every streamed delta as its own websocket frame against coalescing them.
+
+Runs a local websocket server where each connection streams a fake answer of
+fixed-size tokens at a steady rate, as a fast model would, and as many
+concurrent clients reading the frames. Both ends run in this process, so the
+CPU time covers sending and receiving. Perceived latency is the delay between
+a token being produced and its arrival at the client.
+
+Usage: python scripts/bench_stream_coalescing.py --streams 200 --tokens 300 --token-interval-ms 5
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+from aiohttp import ClientSession, WSMsgType, web
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from api.streaming import CoalescingSender
+
+TOKEN = "tok "
+
+
+async def fake_answer(tokens, interval, produced):
+    for _ in range(tokens):
+        await asyncio.sleep(interval)
+        produced.append(time.perf_counter())
+        yield TOKEN
+
+
+async def stream_handler(request):
+    app = request.app
+    ws = web.WebSocketResponse()
+    await ws.prepare(request)
+    produced = app["produced"].setdefault(request.query["id"], [])
+    answer = fake_answer(app["tokens"], app["interval"], produced)
+    if app["coalesce"]:
+        async with CoalescingSender(ws.send_str, app["flush_chars"], app["flush_interval_ms"]) as sender:
+            async for text in answer:
+                await sender.add(text)
+    else:
+        async for text in answer:
+            await ws.send_str(text)
+    await ws.close()
+    return ws
+
+
+async def read_stream(session, url, stream_id):
+    arrivals, received, frames = [], 0, 0
+    async with session.ws_connect(f"{url}?id={stream_id}") as ws:
+        async for message in ws:
+            if message.type != WSMsgType.TEXT:
+                break
+            now = time.perf_counter()
+            frames += 1
+            received += len(message.data)
+            # Every token that completed with this frame arrived now
+            arrivals.extend([now] * (received // len(TOKEN) - len(arrivals)))
+    return stream_id, frames, arrivals
+
+
+async def run(args, coalesce):
+    app = web.Application()
+    app.update(produced={}, tokens=args.tokens, interval=args.token_interval_ms / 1000, coalesce=coalesce,
+               flush_chars=args.flush_chars, flush_interval_ms=args.flush_interval_ms)
+    app.router.add_get("/ws", stream_handler)
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    try:
+        cpu_start, start = time.process_time(), time.perf_counter()
+        async with ClientSession() as session:
+            results = await asyncio.gather(*(read_stream(session, f"http://127.0.0.1:{port}/ws", str(i))
+                                             for i in range(args.streams)))
+        cpu, elapsed = time.process_time() - cpu_start, time.perf_counter() - start
+    finally:
+        await runner.cleanup()
+
+    frames, delays, first_token = 0, [], []
+    for stream_id, stream_frames, arrivals in results:
+        produced = app["produced"][stream_id]
+        assert len(arrivals) == len(produced) == args.tokens
+        frames += stream_frames
+        delays.extend(arrival - made for arrival, made in zip(arrivals, produced))
+        first_token.append(arrivals[0] - produced[0])
+    delays.sort()
+    return {
+        "frames": frames,
+        "cpu": cpu,
+        "elapsed": elapsed,
+        "first_token_p50": statistics.median(first_token),
+        "delay_p50": statistics.median(delays),
+        "delay_p95": delays[int(len(delays) * 0.95) - 1],
+    }
+
+
+async def main_async(args):
+    for mode, coalesce in (("per-delta", False), ("coalesced", True)):
+        result = await run(args, coalesce)
+        print(f"{mode:10} frames={result['frames']:7d}  cpu={result['cpu']:.2f}s  wall={result['elapsed']:.2f}s  "
+              f"first token p50={result['first_token_p50'] * 1000:.1f}ms  "
+              f"token delay p50={result['delay_p50'] * 1000:.1f}ms p95={result['delay_p95'] * 1000:.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--streams", type=int, default=200)
+    parser.add_argument("--tokens", type=int, default=300)
+    parser.add_argument("--token-interval-ms", type=float, default=5)
+    parser.add_argument("--flush-chars", type=int, default=1024)
+    parser.add_argument("--flush-interval-ms", type=float, default=30)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
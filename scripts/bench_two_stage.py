@@ -0,0 +1,73 @@
+"""
+Benchmark two-stage (file, then chunk) retrieval against flat search.
+
+Builds a synthetic repository whose chunks cluster around per-file topics,
+then compares recall@k of the two-stage search against exact flat search
+and reports the mean latency of both.
+
+Usage: python scripts/bench_two_stage.py --files 5000 --chunks-per-file 40
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+from adalflow.core.types import Document
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from api.retriever import RepoRetriever
+
+
+def make_corpus(n_files, chunks_per_file, dim, seed):
+    rng = np.random.default_rng(seed)
+    topics = rng.standard_normal((n_files, dim)).astype(np.float32)
+    sizes = rng.integers(1, 2 * chunks_per_file, size=n_files)
+    file_of_chunk = np.repeat(np.arange(n_files), sizes)
+    vectors = topics[file_of_chunk] + 0.8 * rng.standard_normal((len(file_of_chunk), dim)).astype(np.float32)
+    documents = [Document(text="", meta_data={"file_path": f"src/file{f}.py"}) for f in file_of_chunk]
+    return documents, vectors
+
+
+def time_search(retriever, queries, top_k):
+    start = time.perf_counter()
+    results = [retriever.retrieve_embedding_queries(q, top_k=top_k)[0].doc_indices for q in queries]
+    return results, (time.perf_counter() - start) / len(queries) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=5000)
+    parser.add_argument("--chunks-per-file", type=int, default=40)
+    parser.add_argument("--dim", type=int, default=256)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--top-k", type=int, default=20)
+    parser.add_argument("--top-files", type=int, nargs="+", default=[16, 64, 256])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    documents, vectors = make_corpus(args.files, args.chunks_per_file, args.dim, args.seed)
+    rng = np.random.default_rng(args.seed + 1)
+    picks = rng.integers(0, len(vectors), size=args.queries)
+    queries = vectors[picks] + 0.5 * rng.standard_normal((args.queries, args.dim)).astype(np.float32)
+    print(f"{len(documents)} chunks in {args.files} files, dim={args.dim}, {args.queries} queries, top_k={args.top_k}")
+
+    flat = RepoRetriever(top_k=args.top_k)
+    flat.build_index_from_matrix(vectors.copy())
+    flat.build_file_ids(documents)
+    truth, flat_ms = time_search(flat, queries, args.top_k)
+    print(f"{'flat':>22}: recall@{args.top_k}=1.000  {flat_ms:7.2f} ms/query")
+
+    for top_files in args.top_files:
+        two_stage = RepoRetriever(top_k=args.top_k, two_stage_min_chunks=1, two_stage_top_files=top_files)
+        two_stage.build_index_from_matrix(vectors.copy())
+        two_stage.build_file_ids(documents)
+        results, ms = time_search(two_stage, queries, args.top_k)
+        recall = np.mean([len(set(r) & set(t)) / len(t) for r, t in zip(results, truth)])
+        print(f"{f'two-stage ({top_files} files)':>22}: recall@{args.top_k}={recall:.3f}  {ms:7.2f} ms/query")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,14 @@
+"""Helpers shared by the indexing tests."""
+
+
+class CountingEmbedder:
+    """Embeds documents with a deterministic vector and records the embedded texts."""
+
+    def __init__(self):
+        self.embedded = []
+
+    def __call__(self, documents):
+        for doc in documents:
+            self.embedded.append(doc.text)
+            doc.vector = [float(len(doc.text)), 1.0, 0.5]
+        return documents
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Tests for persistent websocket chat sessions.
+
+Usage: python -m pytest test/test_chat_session.py
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+import uvicorn
+from aiohttp import ClientSession
+from fastapi import FastAPI
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from api import websocket_wiki
+from api.websocket_wiki import ChatCompletionRequest, ChatSession
+
+
+class FakeMemory:
+    def __init__(self):
+        self.turns = []
+
+    def add_dialog_turn(self, user_query, assistant_response):
+        self.turns.append((user_query, assistant_response))
+
+
+class FakeRAG:
+    def __init__(self):
+        self.memory = FakeMemory()
+
+
+class TestChatSession:
+    """Tests for the server-side conversation of a session"""
+
+    def test_turn_request_copies_the_conversation(self):
+        request = ChatCompletionRequest(repo_url="https://github.com/o/r", messages=[], provider="openai", model="m")
+        session = ChatSession(request, FakeRAG(), None)
+        session.add_turn("Hi", "Hello")
+
+        turn = session.turn_request("What next?", "README.md")
+        assert [(m.role, m.content) for m in turn.messages] == [
+            ("user", "Hi"), ("assistant", "Hello"), ("user", "What next?")]
+        assert (turn.provider, turn.model, turn.filePath) == ("openai", "m", "README.md")
+        turn.messages[0].content = "changed"
+        assert session.messages[0].content == "Hi"
+
+
+class TestSessionWebsocket:
+    """Tests for answering several turns on one connection"""
+
+    def test_turns_share_one_retriever(self, monkeypatch):
+        prepared = []
+        seen = []
+
+        async def prepare(websocket, request):
+            prepared.append(request.repo_url)
+            return FakeRAG(), None
+
+        async def answer(websocket, request_data, session=None):
+            request = session.turn_request(request_data["content"])
+            seen.append([m.content for m in request.messages])
+            await websocket.send_text(f"answer {len(request.messages) // 2 + 1}")
+            await websocket.close()
+
+        async def run():
+            monkeypatch.setattr(websocket_wiki, "_prepare_rag", prepare)
+            monkeypatch.setattr(websocket_wiki, "_answer_chat", answer)
+            app = FastAPI()
+            app.add_api_websocket_route("/ws/chat", websocket_wiki.handle_websocket_chat)
+            server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning",
+                                                   timeout_graceful_shutdown=1))
+            serving = asyncio.create_task(server.serve())
+            while not server.started:
+                await asyncio.sleep(0.01)
+            url = f"http://127.0.0.1:{server.servers[0].sockets[0].getsockname()[1]}/ws/chat"
+            frames = []
+            try:
+                async with ClientSession() as client:
+                    async with client.ws_connect(url) as ws:
+                        await ws.send_json({"repo_url": "https://github.com/o/r", "session": True,
+                                            "messages": [{"role": "user", "content": "first"}]})
+                        for _ in range(3):
+                            frames.append(await ws.receive_json())
+                        await ws.send_json({"content": "second"})
+                        for _ in range(2):
+                            frames.append(await ws.receive_json())
+                        await ws.send_json({"content": ""})
+                        frames.append(await ws.receive_json())
+            finally:
+                server.should_exit = True
+                await serving
+            return frames
+
+        frames = asyncio.run(run())
+        assert prepared == ["https://github.com/o/r"]
+        assert frames[:5] == [
+            {"type": "session"},
+            {"type": "delta", "text": "answer 1"},
+            {"type": "end"},
+            {"type": "delta", "text": "answer 2"},
+            {"type": "end"},
+        ]
+        assert frames[5]["type"] == "error"
+        assert seen == [["first"], ["first", "answer 1", "second"]]
+
+    def test_messages_sent_during_a_turn_are_answered_next(self, monkeypatch):
+        seen = []
+
+        async def prepare(websocket, request):
+            return FakeRAG(), None
+
+        async def answer(websocket, request_data, session=None):
+            request = session.turn_request(request_data["content"])
+            seen.append(request_data["content"])
+            # Long enough for the client's next message to arrive while this turn is answered
+            await asyncio.sleep(0.2)
+            await websocket.send_text(f"answer {len(request.messages) // 2 + 1}")
+            await websocket.close()
+
+        async def run():
+            monkeypatch.setattr(websocket_wiki, "_prepare_rag", prepare)
+            monkeypatch.setattr(websocket_wiki, "_answer_chat", answer)
+            app = FastAPI()
+            app.add_api_websocket_route("/ws/chat", websocket_wiki.handle_websocket_chat)
+            server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning",
+                                                   timeout_graceful_shutdown=1))
+            serving = asyncio.create_task(server.serve())
+            while not server.started:
+                await asyncio.sleep(0.01)
+            url = f"http://127.0.0.1:{server.servers[0].sockets[0].getsockname()[1]}/ws/chat"
+            frames = []
+            try:
+                async with ClientSession() as client:
+                    async with client.ws_connect(url) as ws:
+                        await ws.send_json({"repo_url": "https://github.com/o/r", "session": True,
+                                            "messages": [{"role": "user", "content": "first"}]})
+                        await ws.send_json({"content": "second"})
+                        await ws.send_str("not json")
+                        for _ in range(6):
+                            frames.append(await asyncio.wait_for(ws.receive_json(), 5))
+            finally:
+                server.should_exit = True
+                await serving
+            return frames
+
+        frames = asyncio.run(run())
+        assert frames[:5] == [
+            {"type": "session"},
+            {"type": "delta", "text": "answer 1"},
+            {"type": "end"},
+            {"type": "delta", "text": "answer 2"},
+            {"type": "end"},
+        ]
+        assert frames[5]["type"] == "error"
+        assert seen == ["first", "second"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Tests for repository refresh and commit-keyed index snapshots sharing a chunk store.
+
+Usage: python -m pytest test/test_chunk_store.py
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from adalflow.core.db import LocalDB
+from adalflow.core.types import Document
+
+from api import data_pipeline
+from api.chunk_store import (ChunkStore, chunk_key, collect_garbage, embed_with_store, load_index_meta,
+                             load_snapshot, save_snapshot)
+from api.data_pipeline import DatabaseManager, download_repo, refresh_repo
+from test.conftest import CountingEmbedder
+
+GIT = ["git", "-c", "user.email=test@example.com", "-c", "user.name=test"]
+
+
+def _commit(work, files, message):
+    for path, content in files.items():
+        (work / path).parent.mkdir(parents=True, exist_ok=True)
+        (work / path).write_text(content, encoding="utf-8")
+    subprocess.run(GIT + ["-C", str(work), "add", "-A"], check=True)
+    subprocess.run(GIT + ["-C", str(work), "commit", "-qm", message], check=True)
+    return subprocess.run(["git", "-C", str(work), "rev-parse", "HEAD"], stdout=subprocess.PIPE,
+                          check=True).stdout.decode().strip()
+
+
+def _words(prefix, count):
+    return " ".join(f"{prefix}{i}" for i in range(count))
+
+
+class TestChunkStore:
+    """Tests for content-addressed chunk vectors"""
+
+    def test_put_get_and_delete(self, tmp_path):
+        store = ChunkStore(str(tmp_path / "chunks.sqlite"))
+        store.put([("a", "text a", [1.0, 2.0]), ("b", "text b", [3.0, 4.0])])
+        store.put([("a", "other", [9.0, 9.0])])
+        found = store.get(["a", "b", "missing"])
+        assert set(found) == {"a", "b"}
+        assert found["a"][0] == "text a" and found["a"][1].tolist() == [1.0, 2.0]
+        assert store.delete_except({"a"}) == 1
+        assert len(store) == 1
+        store.close()
+
+    def test_embed_with_store_reuses_vectors(self, tmp_path):
+        store = ChunkStore(str(tmp_path / "chunks.sqlite"))
+        embedder = CountingEmbedder()
+        first = [Document(text="same"), Document(text="old")]
+        embed_with_store(first, store, "fp", embedder)
+        second = [Document(text="same"), Document(text="new")]
+        result = embed_with_store(second, store, "fp", embedder)
+        assert embedder.embedded == ["same", "old", "new"]
+        assert [doc.vector[0] for doc in result] == [4.0, 3.0]
+        # Another embedding model never reuses these vectors
+        embed_with_store([Document(text="same")], store, "other-fp", embedder)
+        assert embedder.embedded[-1] == "same"
+        store.close()
+
+    def test_snapshots_are_pruned_and_collected(self, tmp_path):
+        store = ChunkStore(str(tmp_path / "chunks.sqlite"))
+        db_file = str(tmp_path / "repo.pkl")
+        for revision in ["c1", "c2", "c3"]:
+            doc = Document(text=f"chunk of {revision}", meta_data={"file_path": "a.py"}, order=0)
+            doc.vector = [1.0, 2.0]
+            store.put([(chunk_key(doc.text, "fp"), doc.text, doc.vector)])
+            save_snapshot(db_file, revision, "fp", [doc], max_snapshots=2)
+
+        meta = load_index_meta(db_file)
+        assert meta["revision"] == "c3"
+        assert [s["revision"] for s in meta["snapshots"]] == ["c2", "c3"]
+        assert load_snapshot(db_file, "c1", store) is None
+        # The chunk of c1 was stored just now, it is only collected once the grace period is over
+        assert collect_garbage(store, str(tmp_path)) == 0
+        assert collect_garbage(store, str(tmp_path), grace_seconds=0) == 1
+        restored = load_snapshot(db_file, "c2", store)
+        assert restored[0].text == "chunk of c2" and restored[0].vector == [1.0, 2.0]
+        assert load_snapshot(db_file, "c2", store, fingerprint="other-fp") is None
+        store.close()
+
+    def test_collection_spares_builds_in_progress(self, tmp_path):
+        store = ChunkStore(str(tmp_path / "chunks.sqlite"))
+        db_file = str(tmp_path / "repo.pkl")
+        old = Document(text="old chunk", meta_data={"file_path": "a.py"}, order=0)
+        embed_with_store([old], store, "fp", CountingEmbedder())
+        save_snapshot(db_file, "c1", "fp", [old])
+        save_snapshot(db_file, "c2", "fp", [], max_snapshots=1)
+
+        time.sleep(0.3)
+
+        # Another build reuses the old chunk and stores a new one, but has not snapshotted them yet
+        embed_with_store([Document(text="old chunk"), Document(text="fresh chunk")], store, "fp", CountingEmbedder())
+        assert collect_garbage(store, str(tmp_path), grace_seconds=0.2) == 0
+        assert len(store) == 2
+        store.close()
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+class TestRepositoryRefresh:
+    """Tests for refreshing clones and indexes"""
+
+    def test_refresh_repo_fetches_new_head(self, tmp_path):
+        work = tmp_path / "work"
+        subprocess.run(GIT + ["init", "-q", str(work)], check=True)
+        _commit(work, {"app.py": "v1"}, "first")
+        bare = tmp_path / "remote.git"
+        subprocess.run(["git", "clone", "-q", "--bare", str(work), str(bare)], check=True)
+        subprocess.run(["git", "-C", str(bare), "config", "uploadpack.allowFilter", "true"], check=True)
+        download_repo("file://" + str(bare), str(tmp_path / "clone"))
+
+        head = _commit(work, {"app.py": "v2"}, "second")
+        subprocess.run(["git", "-C", str(work), "push", "-q", str(bare), "HEAD"], check=True)
+        assert refresh_repo(str(tmp_path / "clone")) == head
+        assert (tmp_path / "clone" / "app.py").read_text(encoding="utf-8") == "v2"
+
+    def test_refresh_database_embeds_changed_chunks_only(self, tmp_path, monkeypatch):
+        embedder = CountingEmbedder()
+        monkeypatch.setattr(data_pipeline, "get_adalflow_default_root_path", lambda: str(tmp_path / "adalflow"))
+        monkeypatch.setattr(data_pipeline, "get_embedding_transformer", lambda embedder_type: embedder)
+        # Directory exclusions match any component of the absolute path, including the /tmp of tmp_path
+        monkeypatch.setattr(data_pipeline, "DEFAULT_EXCLUDED_DIRS", [])
+        monkeypatch.setitem(data_pipeline.configs, "text_splitter",
+                            {"split_by": "word", "chunk_size": 50, "chunk_overlap": 0})
+
+        repo = tmp_path / "repo"
+        subprocess.run(GIT + ["init", "-q", str(repo)], check=True)
+        first = _commit(repo, {"a.py": _words("alpha", 120), "b.py": _words("beta", 40)}, "first")
+
+        documents = DatabaseManager().refresh_database(str(repo), "local", embedder_type="openai")
+        assert len(documents) == 4 and len(embedder.embedded) == 4
+
+        second = _commit(repo, {"b.py": _words("gamma", 40)}, "second")
+        manager = DatabaseManager()
+        documents = manager.refresh_database(str(repo), "local", embedder_type="openai")
+        assert len(documents) == 4
+        assert embedder.embedded[4:] == [_words("gamma", 40)]
+
+        meta = load_index_meta(manager.repo_paths["save_db_file"])
+        assert meta["revision"] == second
+        assert [s["revision"] for s in meta["snapshots"]] == [first, second]
+
+        # Unchanged revisions load the saved database without embedding anything
+        DatabaseManager().refresh_database(str(repo), "local", embedder_type="openai")
+        assert len(embedder.embedded) == 5
+
+        # Going back to an indexed commit restores its snapshot
+        subprocess.run(["git", "-C", str(repo), "checkout", "-q", first], check=True)
+        documents = DatabaseManager().refresh_database(str(repo), "local", embedder_type="openai")
+        assert len(embedder.embedded) == 5
+        assert any(doc.text.startswith("beta0") for doc in documents)
+        assert not any("gamma" in doc.text for doc in documents)
+        meta = load_index_meta(manager.repo_paths["save_db_file"])
+        assert meta["revision"] == first
+        assert [s["revision"] for s in meta["snapshots"]] == [second, first]
+
+    def test_databases_without_index_format_are_rebuilt(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(data_pipeline, "get_adalflow_default_root_path", lambda: str(tmp_path / "adalflow"))
+        monkeypatch.setattr(data_pipeline, "get_embedding_transformer", lambda embedder_type: CountingEmbedder())
+        monkeypatch.setattr(data_pipeline, "DEFAULT_EXCLUDED_DIRS", [])
+        repo = tmp_path / "repo"
+        subprocess.run(GIT + ["init", "-q", str(repo)], check=True)
+        _commit(repo, {"a.py": "alpha", "docs/b.md": "beta"}, "first")
+
+        # An older version built this database with a custom filter that kept a.py only
+        filtered = Document(text="alpha", meta_data={"file_path": "a.py"}, order=0)
+        filtered.vector = [5.0, 1.0, 0.5]
+        db = LocalDB()
+        db.transformed_items["split_and_embed"] = [filtered]
+        os.makedirs(tmp_path / "adalflow" / "databases")
+        db.save_state(filepath=str(tmp_path / "adalflow" / "databases" / "repo.pkl"))
+
+        documents = DatabaseManager().prepare_database(str(repo), "local", embedder_type="openai")
+        assert sorted(doc.meta_data["file_path"] for doc in documents) == ["a.py", "docs/b.md"]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Tests for the shared provider client registry and its keep-alive connections.
+
+Usage: python -m pytest test/test_client_registry.py
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+from aiohttp import web
+from adalflow.core.types import ModelType
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from api.generation import close_provider_clients, get_model_client, get_provider_client
+
+
+async def _completions(request):
+    request.app["peers"].add(request.transport.get_extra_info("peername"))
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+    await response.prepare(request)
+    await response.write(b'data: {"choices": [{"delta": {"content": "ok"}}]}\n\ndata: [DONE]\n\n')
+    return response
+
+
+class TestClientRegistry:
+    """Tests for shared provider clients"""
+
+    def test_clients_are_shared_per_event_loop(self):
+        async def clients():
+            first = get_provider_client("openrouter")
+            model, model_kwargs = get_model_client("openrouter", "openai/gpt-4o", {"temperature": 0.7})
+            assert model is first and model_kwargs["model"] == "openai/gpt-4o"
+            first.get_session()
+            await close_provider_clients()
+            assert first.session is None
+            second = get_provider_client("openrouter")
+            await close_provider_clients()
+            return first, second
+
+        first, second = asyncio.run(clients())
+        assert first is not second
+        other_loop, _ = asyncio.run(clients())
+        assert other_loop is not first
+
+    def test_connections_are_kept_alive(self):
+        async def run():
+            app = web.Application()
+            app["peers"] = set()
+            app.router.add_post("/api/v1/chat/completions", _completions)
+            runner = web.AppRunner(app)
+            await runner.setup()
+            site = web.TCPSite(runner, "127.0.0.1", 0)
+            await site.start()
+            port = site._server.sockets[0].getsockname()[1]
+            try:
+                for _ in range(3):
+                    client = get_provider_client("openrouter")
+                    client.async_client = {"api_key": "test-key", "base_url": f"http://127.0.0.1:{port}/api/v1"}
+                    api_kwargs = client.convert_inputs_to_api_kwargs("Hi", {"model": "m"}, ModelType.LLM)
+                    chunks = [chunk async for chunk in await client.acall(api_kwargs, ModelType.LLM)]
+                    assert chunks == ["ok"]
+            finally:
+                await close_provider_clients()
+                await runner.cleanup()
+            return app["peers"]
+
+        assert len(asyncio.run(run())) == 1
+
+    def test_per_host_limit_is_not_the_keepalive_count(self, monkeypatch):
+        from api import http_pool
+
+        async def limits():
+            connector = http_pool.aiohttp_connector()
+            try:
+                return connector.limit, connector.limit_per_host
+            finally:
+                await connector.close()
+
+        monkeypatch.setitem(http_pool.configs, "http_pool", {"max_connections": 100, "max_keepalive_connections": 20})
+        # Streams hold their connection, so more than 20 of them reach one host at once
+        assert asyncio.run(limits()) == (100, 0)
+        monkeypatch.setitem(http_pool.configs, "http_pool", {"max_connections": 100, "max_connections_per_host": 50})
+        assert asyncio.run(limits()) == (100, 50)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
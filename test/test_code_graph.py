@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Tests for the repository import graph.
+
+Usage: python -m pytest test/test_code_graph.py
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from adalflow.core.types import Document
+
+from api.code_graph import CodeGraph, RepoPaths, build_code_graph, expand_with_neighbours, extract_imports
+
+REPO = {
+    "api/__init__.py": "",
+    "api/server.py": "import os\nfrom api import auth\nfrom .models import User, Group\n",
+    "api/auth.py": "from api.models import (\n    User,\n)\nimport api.tokens\n",
+    "api/models.py": "class User: pass\n",
+    "api/tokens.py": "SECRET = 1\n",
+    "web/src/app.ts": "import { api } from './client';\nconst util = require('../lib/util');\n",
+    "web/src/client.ts": "export const api = 1;\n",
+    "web/lib/util.js": "module.exports = {};\n",
+    "cmd/main.go": 'package main\n\nimport (\n\t"fmt"\n\t"example.com/app/pkg/store"\n)\n',
+    "pkg/store/store.go": "package store\n",
+    "src/main/java/com/acme/App.java": "import com.acme.db.Repo;\nimport java.util.List;\n",
+    "src/main/java/com/acme/db/Repo.java": "class Repo {}\n",
+    "native/main.c": '#include "util.h"\n#include <stdio.h>\n',
+    "native/util.h": "int f();\n",
+}
+
+
+def _imports(path):
+    return extract_imports(path, REPO[path], RepoPaths(REPO))
+
+
+class TestCodeGraph:
+    """Tests for import extraction, persistence and hit expansion"""
+
+    def test_python_imports(self):
+        assert _imports("api/server.py") == {"api/auth.py", "api/models.py", "api/__init__.py"}
+        assert _imports("api/auth.py") == {"api/models.py", "api/tokens.py"}
+
+    def test_js_go_java_c_imports(self):
+        assert _imports("web/src/app.ts") == {"web/src/client.ts", "web/lib/util.js"}
+        assert _imports("cmd/main.go") == {"pkg/store/store.go"}
+        assert _imports("src/main/java/com/acme/App.java") == {"src/main/java/com/acme/db/Repo.java"}
+        assert _imports("native/main.c") == {"native/util.h"}
+
+    def test_graph_from_chunks_and_persistence(self, tmp_path):
+        docs = []
+        for path, text in REPO.items():
+            # Split every file in two chunks to mimic the stored database
+            middle = len(text) // 2
+            docs.append(Document(text=text[:middle], meta_data={"file_path": path}, order=0))
+            docs.append(Document(text=text[middle:], meta_data={"file_path": path}, order=1))
+        graph = build_code_graph(docs)
+        assert graph.neighbours("api/models.py") == ["api/auth.py", "api/server.py"]
+
+        path = str(tmp_path / "repo.graph.json")
+        graph.save(path)
+        assert CodeGraph.load(path).edges == graph.edges
+        assert CodeGraph.load(str(tmp_path / "missing.json")) is None
+
+    def test_expand_with_neighbours(self):
+        graph = CodeGraph({"a.py": ["b.py", "c.py"], "d.py": ["a.py"]})
+        docs = [Document(text=path, meta_data={"file_path": path}) for path in ["a.py", "b.py", "b.py", "c.py", "d.py"]]
+        file_ids = {"a.py": np.array([0]), "b.py": np.array([1, 2]), "c.py": np.array([3]), "d.py": np.array([4])}
+        vectors = np.array([[1, 0], [0, 1], [1, 0.1], [1, 0], [1, 0]], dtype=np.float32)
+
+        # The chunk of b.py closest to the hit is picked, and the quota per hit is respected
+        assert expand_with_neighbours([0], graph, file_ids, vectors, docs, max_neighbours_per_hit=2) == [2, 3]
+        # Files already retrieved or hidden by the file filter are skipped
+        assert expand_with_neighbours([0, 3], graph, file_ids, vectors, docs, max_neighbours_per_hit=5,
+                                      is_visible=lambda chunk_id: chunk_id != 4) == [2]
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Tests for the token-budgeted context packer.
+
+Usage: python -m pytest test/test_context_packer.py
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from adalflow.core.types import Document
+
+from api.config import get_context_window
+from api.context_packer import count_model_tokens, get_context_budget, overlap_length, pack_context
+
+
+def _split(path, words, size=40, overlap=10):
+    """Split words into overlapping chunks the way the word TextSplitter does."""
+    chunks = []
+    for order, start in enumerate(range(0, len(words), size - overlap)):
+        text = " ".join(words[start:start + size]) + " "
+        chunks.append(Document(text=text, meta_data={"file_path": path}, order=order))
+        if start + size >= len(words):
+            break
+    return chunks
+
+
+class TestContextPacker:
+    """Tests for chunk merging, deduplication and budget fitting"""
+
+    def setup_method(self):
+        self.words = [f"word{i}" for i in range(100)]
+        self.chunks = _split("src/app.py", self.words)
+
+    def test_overlap_length(self):
+        assert overlap_length("a b c d ", "c d e f ") == len("c d ")
+        assert overlap_length("a b ", "x y ") == 0
+
+    def test_adjacent_chunks_are_merged(self):
+        packed = pack_context(self.chunks, 10000, "google")
+        assert packed.files == 1
+        assert packed.text.count("word35 ") == 1
+        assert " ".join(self.words) in packed.text
+
+    def test_duplicate_chunks_are_dropped(self):
+        duplicate = Document(text=self.chunks[0].text, meta_data={"file_path": "vendor/app.py"}, order=0)
+        packed = pack_context([self.chunks[0], duplicate], 10000, "google")
+        assert packed.dropped == 1
+        assert "vendor/app.py" not in packed.text
+
+    def test_non_adjacent_chunks_keep_a_gap(self):
+        packed = pack_context([self.chunks[0], self.chunks[2]], 10000, "google")
+        assert "\n...\n" in packed.text
+
+    def test_budget_is_respected(self):
+        other = _split("src/util.py", [f"other{i}" for i in range(400)])
+        packed = pack_context(self.chunks + other, 150, "google")
+        assert packed.tokens <= 150
+        assert packed.dropped > 0
+        assert count_model_tokens(packed.text, "google") == packed.tokens
+
+    def test_empty_input(self):
+        assert pack_context([], 1000, "google").text == ""
+
+    def test_context_window_lookup(self):
+        assert get_context_window("ollama", "llama3:8b") == 8000
+        assert get_context_window("dashscope", "deepseek-r1") == 65536
+        assert get_context_window("unknown-provider") > 0
+        assert get_context_budget("ollama", "llama3:8b", prompt_tokens=10**6) == 0
+
+    def test_small_windows_keep_context(self):
+        # The output reserve alone would take the whole 8000-token window
+        budget = get_context_budget("ollama", "llama3:8b", prompt_tokens=500)
+        assert 0 < budget < get_context_window("ollama", "llama3:8b") - 500
+        assert get_context_budget("ollama", "llama3:8b", prompt_tokens=7000) > 0
+        packed = pack_context(self.chunks, budget, "ollama", "llama3:8b")
+        assert packed.chunks == len(self.chunks) and packed.text
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Tests for the token-budgeted conversation memory and its running summary.
+
+Usage: python -m pytest test/test_conversation_memory.py
+"""
+
+import asyncio
+import os
+import sys
+import uuid
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from api.context_packer import count_model_tokens
+from api.rag import Memory, format_dialog_turn
+
+
+def _fill(memory, topic, turns=5):
+    # Unique per test, the summary cache is shared by the process
+    for i in range(turns):
+        memory.add_dialog_turn(f"{topic} question {i} " + "word " * 80, f"{topic} answer {i} " + "word " * 80)
+
+
+def _budget_for(memory, turns):
+    """Token budget that fits exactly the last few turns."""
+    recent = list(memory.current_conversation.dialog_turns)[-turns:]
+    return sum(count_model_tokens(format_dialog_turn(turn)) for turn in recent)
+
+
+class Summarizer:
+    def __init__(self):
+        self.calls = []
+
+    async def __call__(self, summary, turns):
+        self.calls.append((summary, [turn.user_query.query_str.split(" word")[0] for turn in turns]))
+        return f"summary of {len(self.calls)} calls"
+
+
+class TestConversationMemory:
+    """Tests for keeping recent turns verbatim and folding older ones into a summary"""
+
+    def test_without_budget_every_turn_is_returned(self):
+        memory = Memory()
+        _fill(memory, "full")
+        assert len(memory()) == 5
+        assert not asyncio.run(memory.refresh_summary(Summarizer()))
+
+    def test_older_turns_are_folded_into_the_summary(self):
+        topic = uuid.uuid4().hex
+        memory = Memory()
+        _fill(memory, topic)
+        memory.token_budget = _budget_for(memory, 2)
+        summarize = Summarizer()
+
+        # Until the summary is computed the whole history stays verbatim
+        assert len(memory()) == 5
+        assert asyncio.run(memory.refresh_summary(summarize))
+        assert summarize.calls == [("", [f"{topic} question {i}" for i in range(3)])]
+        recent = list(memory().values())
+        assert [turn.user_query.query_str.split(" word")[0] for turn in recent] == [f"{topic} question 3",
+                                                                                    f"{topic} question 4"]
+        assert memory.summary == "summary of 1 calls"
+
+        # Only the turns that fell out of the window since are summarized next
+        memory.add_dialog_turn(f"{topic} question 5 " + "word " * 80, f"{topic} answer 5 " + "word " * 80)
+        assert asyncio.run(memory.refresh_summary(summarize))
+        assert summarize.calls[1] == ("summary of 1 calls", [f"{topic} question 3"])
+        assert memory.summarized_turns == 4
+        assert not asyncio.run(memory.refresh_summary(summarize))
+
+    def test_summary_is_reused_for_the_same_history(self):
+        topic = uuid.uuid4().hex
+        first = Memory()
+        _fill(first, topic)
+        first.token_budget = _budget_for(first, 2)
+        asyncio.run(first.refresh_summary(Summarizer()))
+
+        # A later request resends the same history and gets the cached summary
+        second = Memory(token_budget=first.token_budget)
+        _fill(second, topic)
+        assert len(second()) == 2
+        assert second.summary == first.summary
+
+        # A different history does not
+        other = Memory(token_budget=first.token_budget)
+        _fill(other, uuid.uuid4().hex)
+        assert len(other()) == 5
+        assert other.summary == ""
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Tests for the server-orchestrated Deep Research.
+
+Usage: python -m pytest test/test_deep_research.py
+"""
+
+import asyncio
+import os
+import sys
+from types import SimpleNamespace
+
+import adalflow as adal
+import numpy as np
+import pytest
+from adalflow.core.types import Document, RetrieverOutput
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from api import deep_research
+from api.code_graph import CodeGraph
+from api.deep_research import parse_subquestions, run_deep_research
+from api.rag import RAG
+from api.retriever import RepoRetriever, build_embedding_matrix
+
+PROMPT_VARS = {"repo_type": "github", "repo_url": "https://github.com/o/r", "repo_name": "r", "language_name": "English"}
+
+
+class FakeRAG:
+    def __init__(self):
+        self.batches = []
+
+    def retrieve_many(self, queries, token_budget=None, provider=None, model=None):
+        self.batches.append(queries)
+        return [RetrieverOutput(doc_indices=[0], query=query,
+                                documents=[Document(text=f"code about {query}", meta_data={"file_path": "app.py"})])
+                for query in queries]
+
+
+class FakeModel:
+    """Plans three sub-questions and answers each after a delay, the first one slowest."""
+
+    def __init__(self):
+        self.prompts = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def generate_text(self, provider, client, model_kwargs, prompt):
+        self.prompts.append(prompt)
+        if "planning a Deep Research" in prompt:
+            return "Here is the plan:\n1. How is auth done?\n2) Where are tokens stored?\n- How is auth done?\n* What expires sessions?"
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            delay = 0.15 if "How is auth done?\n</query>" in prompt else 0.05
+            await asyncio.sleep(delay)
+        finally:
+            self.in_flight -= 1
+        return "finding for " + prompt.split("<query>\n")[1].split("\n</query>")[0]
+
+    async def stream_answer(self, provider, client, model_kwargs, prompt, fallback_prompt=None):
+        self.prompts.append(prompt)
+        for text in ["## Final ", "Conclusion"]:
+            yield text
+
+
+def _make_rag(embedder_calls):
+    """RAG over a few files whose embedder records every call."""
+    rng = np.random.default_rng(5)
+    docs = [Document(text=f"chunk {i}", meta_data={"file_path": f"src/f{i}.py"}, order=0) for i in range(12)]
+    for doc in docs:
+        doc.vector = rng.standard_normal(8).tolist()
+    query_vectors = {"auth": docs[0].vector, "tokens": docs[5].vector}
+
+    def embedder(queries):
+        embedder_calls.append(list(queries))
+        return SimpleNamespace(data=[SimpleNamespace(embedding=query_vectors[q]) for q in queries])
+
+    rag = RAG.__new__(RAG)
+    adal.Component.__init__(rag)
+    rag.is_ollama_embedder = False
+    rag.transformed_docs, matrix = build_embedding_matrix(docs)
+    rag.code_graph = CodeGraph({})
+    rag.retriever = RepoRetriever(top_k=4, max_top_k=6, min_top_k=1, max_score_drop=0.05, embedder=embedder)
+    rag.retriever.build_index_from_matrix(matrix)
+    rag.retriever.build_file_ids(rag.transformed_docs)
+    return rag
+
+
+class TestRetrieveMany:
+    """Tests for retrieving the sub-questions in one batch"""
+
+    def test_batch_matches_single_queries_with_one_embedding_call(self):
+        calls = []
+        rag = _make_rag(calls)
+        batch = rag.retrieve_many(["auth", "tokens"])
+        assert calls == [["auth", "tokens"]]
+        for query, result in zip(["auth", "tokens"], batch):
+            single = rag.call(query)[0]
+            assert result.doc_indices == single.doc_indices
+            assert [doc.text for doc in result.documents] == [doc.text for doc in single.documents]
+        assert batch[0].documents[0].text == "chunk 0"
+        assert batch[1].documents[0].text == "chunk 5"
+
+
+class TestParseSubquestions:
+    """Tests for reading the planner's answer"""
+
+    def test_markers_headings_and_duplicates_are_dropped(self):
+        text = "## Plan\nThe sub-questions are:\n1. First?\n2) Second?\n- First?\n* Third?\n\n"
+        assert parse_subquestions(text, 5) == ["First?", "Second?", "Third?"]
+        assert parse_subquestions(text, 2) == ["First?", "Second?"]
+
+
+class TestRunDeepResearch:
+    """Tests for planning, batched retrieval and concurrent analyses"""
+
+    def test_research_streams_plan_findings_and_conclusion(self, monkeypatch):
+        fake = FakeModel()
+        rag = FakeRAG()
+        monkeypatch.setattr(deep_research, "generate_text", fake.generate_text)
+        monkeypatch.setattr(deep_research, "stream_answer", fake.stream_answer)
+        monkeypatch.setitem(deep_research.configs, "deep_research", {"max_subquestions": 5, "max_concurrency": 2})
+
+        async def run():
+            return [text async for text in run_deep_research("Explain auth", rag, None, PROMPT_VARS,
+                                                              "openai", "gpt-4o", object(), {})]
+
+        parts = asyncio.run(run())
+        questions = ["How is auth done?", "Where are tokens stored?", "What expires sessions?"]
+        assert rag.batches == [questions]
+        assert parts[0] == "## Research Plan\n\n" + "".join(f"{i}. {q}\n" for i, q in enumerate(questions, 1)) + "\n"
+        assert parts[1] == "## Findings\n\n"
+        # Findings arrive as their analyses complete, the slow first one last
+        assert [part.split("\n")[0] for part in parts[2:5]] == [
+            "### Where are tokens stored?", "### What expires sessions?", "### How is auth done?"]
+        assert "finding for Where are tokens stored?" in parts[2]
+        assert "".join(parts[5:]) == "## Final Conclusion"
+        assert fake.max_in_flight == 2
+
+        analysis_prompts = [p for p in fake.prompts if "investigating one sub-question" in p]
+        assert all("code about" in p for p in analysis_prompts)
+        synthesis = fake.prompts[-1]
+        assert synthesis.count("<finding>") == 3 and "finding for What expires sessions?" in synthesis
+
+    def test_failed_plan_researches_the_topic_itself(self, monkeypatch):
+        rag = FakeRAG()
+
+        async def failing_generate(provider, client, model_kwargs, prompt):
+            raise ValueError("model unavailable")
+
+        async def conclusion(*args, **kwargs):
+            yield "done"
+
+        monkeypatch.setattr(deep_research, "generate_text", failing_generate)
+        monkeypatch.setattr(deep_research, "stream_answer", conclusion)
+
+        async def run():
+            return [text async for text in run_deep_research("Explain auth", rag, None, PROMPT_VARS,
+                                                              "openai", "gpt-4o", object(), {})]
+
+        parts = asyncio.run(run())
+        assert rag.batches == [["Explain auth"]]
+        assert "could not be analysed: model unavailable" in parts[2]
+        assert parts[-1] == "done"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
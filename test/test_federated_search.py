@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+"""
+Tests for federated search across several repository indexes.
+
+Usage: python -m pytest test/test_federated_search.py
+"""
+
+import os
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import adalflow as adal
+from adalflow.core.types import Document
+
+from api.federated_search import federated_retrieve, repo_label
+from api.rag import RAG
+from api.retriever import RepoRetriever, build_embedding_matrix
+
+DIM = 8
+
+
+def _make_rag(name, vectors, query_vector=None):
+    """Build a RAG with a prepared retriever without touching any embedding API."""
+    docs = []
+    for i, vector in enumerate(vectors):
+        doc = Document(text=f"{name} chunk {i}", meta_data={"file_path": f"file{i}.py"}, order=0)
+        doc.vector = list(vector)
+        docs.append(doc)
+
+    rag = RAG.__new__(RAG)
+    adal.Component.__init__(rag)
+    rag.transformed_docs, matrix = build_embedding_matrix(docs)
+    embedder = lambda queries: SimpleNamespace(data=[SimpleNamespace(embedding=query_vector) for _ in queries])
+    rag.retriever = RepoRetriever(top_k=4, max_top_k=10, min_top_k=1, max_score_drop=1.0, embedder=embedder)
+    rag.retriever.build_index_from_matrix(matrix)
+    return rag
+
+
+class TestFederatedSearch:
+    """Tests for merging hits of several repositories"""
+
+    def setup_method(self):
+        rng = np.random.default_rng(1)
+        self.query = np.ones(DIM, dtype=np.float32)
+        # The service repo holds the closest match, the client repo the runner-up
+        service = rng.standard_normal((5, DIM))
+        service[0] = self.query
+        client = rng.standard_normal((5, DIM))
+        client[0] = self.query + 0.1 * rng.standard_normal(DIM)
+        self.service = _make_rag("service", service, self.query.tolist())
+        self.client = _make_rag("client", client, self.query.tolist())
+
+    def test_merges_by_score(self):
+        result = federated_retrieve([("org/service", self.service), ("org/client", self.client)], "query")[0]
+        assert result.documents[0].meta_data["repo"] == "org/service"
+        assert result.documents[1].meta_data["repo"] == "org/client"
+        assert result.doc_scores == sorted(result.doc_scores, reverse=True)
+        assert {doc.meta_data["repo"] for doc in result.documents} == {"org/service", "org/client"}
+
+    def test_file_paths_are_prefixed(self):
+        result = federated_retrieve([("org/service", self.service), ("org/client", self.client)], "query")[0]
+        assert all(doc.meta_data["file_path"].startswith(doc.meta_data["repo"] + "/") for doc in result.documents)
+        # Source documents are left untouched
+        assert self.service.transformed_docs[0].meta_data["file_path"] == "file0.py"
+
+    def test_per_repo_quota(self, monkeypatch):
+        from api import federated_search
+        monkeypatch.setitem(federated_search.configs, "federated_search", {"max_per_repo": 2})
+        result = federated_retrieve([("org/service", self.service), ("org/client", self.client)], "query")[0]
+        assert len(result.documents) == 4
+
+    def test_repo_label(self):
+        assert repo_label("https://github.com/org/service.git") == "org/service"
+        assert repo_label("https://gitlab.com/group/sub/client/") == "sub/client"
+        assert repo_label("/home/me/projects/local-repo") == "local-repo"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
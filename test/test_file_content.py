@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Tests for reading file content from the local clone and the ETag-cached API fallback.
+
+Usage: python -m pytest test/test_file_content.py
+"""
+
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from api import data_pipeline
+from api.data_pipeline import get_file_content, read_local_file
+
+
+class FakeResponse:
+    def __init__(self, status_code, text="", headers=None):
+        self.status_code = status_code
+        self.text = text
+        self.headers = headers or {}
+
+    def raise_for_status(self):
+        if self.status_code >= 400:
+            raise data_pipeline.RequestException(f"HTTP {self.status_code}")
+
+
+class FakeSession:
+    """Serves one GitLab file with an ETag and counts requests."""
+
+    def __init__(self):
+        self.requests = []
+
+    def get(self, url, headers=None, timeout=None):
+        self.requests.append((url, dict(headers or {})))
+        if "/repository/files/" not in url:
+            return FakeResponse(404)
+        if (headers or {}).get("If-None-Match") == '"v1"':
+            return FakeResponse(304)
+        return FakeResponse(200, "print('remote')\n", {"ETag": '"v1"'})
+
+
+@pytest.fixture
+def session(monkeypatch):
+    fake = FakeSession()
+    monkeypatch.setattr(data_pipeline, "_http_session", fake)
+    monkeypatch.setattr(data_pipeline, "_etag_cache", data_pipeline.OrderedDict())
+    monkeypatch.setattr(data_pipeline, "_default_branches", {})
+    return fake
+
+
+class TestFileContent:
+    """Tests for file content lookups"""
+
+    def test_read_local_file(self, tmp_path):
+        (tmp_path / "src").mkdir()
+        (tmp_path / "src" / "app.py").write_text("print('local')\n", encoding="utf-8")
+        assert read_local_file(str(tmp_path), "src/app.py") == "print('local')\n"
+        assert read_local_file(str(tmp_path), "/src/app.py") == "print('local')\n"
+
+    def test_read_local_file_rejects_traversal(self, tmp_path):
+        (tmp_path / "repo").mkdir()
+        (tmp_path / "secret.txt").write_text("secret", encoding="utf-8")
+        with pytest.raises(ValueError, match="outside the repository"):
+            read_local_file(str(tmp_path / "repo"), "../secret.txt")
+        with pytest.raises(ValueError, match="outside the repository"):
+            get_file_content("https://gitlab.com/group/project", "../secret.txt", "gitlab", None,
+                             str(tmp_path / "repo"))
+
+    def test_local_clone_is_read_without_network(self, tmp_path, session):
+        (tmp_path / "app.py").write_text("print('local')\n", encoding="utf-8")
+        content = get_file_content("https://gitlab.com/group/project", "app.py", "gitlab", None, str(tmp_path))
+        assert content == "print('local')\n"
+        assert session.requests == []
+
+    def test_missing_local_file_falls_back_to_api_with_etag(self, tmp_path, session):
+        url = "https://gitlab.com/group/project"
+        assert get_file_content(url, "app.py", "gitlab", None, str(tmp_path)) == "print('remote')\n"
+        assert get_file_content(url, "app.py", "gitlab", None, str(tmp_path)) == "print('remote')\n"
+        file_requests = [headers for request_url, headers in session.requests if "/repository/files/" in request_url]
+        assert len(file_requests) == 2
+        assert file_requests[1]["If-None-Match"] == '"v1"'
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Tests for file-focused chats: direct chunk lookup by path instead of semantic search.
+
+Usage: python -m pytest test/test_file_focus.py
+"""
+
+import os
+import sys
+from types import SimpleNamespace
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import adalflow as adal
+from adalflow.core.types import Document
+
+from api.code_graph import CodeGraph
+from api.rag import RAG
+from api.retriever import RepoRetriever, build_embedding_matrix
+
+DIM = 8
+FOCUS_TEXT = " ".join(f"word{i}" for i in range(30)) + "\nend of file\n"
+
+
+def _word_chunks(text, size=12, overlap=4):
+    """Split a text into overlapping word chunks, like the repository text splitter."""
+    words = text.split(" ")
+    chunks = []
+    for start in range(0, len(words), size - overlap):
+        chunks.append(" ".join(words[start:start + size]))
+        if start + size >= len(words):
+            break
+    return chunks
+
+
+def _make_rag():
+    """RAG over a focused file, one of its imports and an unrelated file."""
+    rng = np.random.default_rng(3)
+    query = np.ones(DIM, dtype=np.float32)
+    docs = []
+    # Chunks are stored out of order to check that lookups restore document order
+    for order, text in reversed(list(enumerate(_word_chunks(FOCUS_TEXT)))):
+        docs.append(Document(text=text, meta_data={"file_path": "src/app.py"}, order=order))
+    docs.append(Document(text="def helper(): pass", meta_data={"file_path": "src/util.py"}, order=0))
+    docs.append(Document(text="unrelated", meta_data={"file_path": "docs/readme.md"}, order=0))
+    for doc in docs:
+        doc.vector = rng.standard_normal(DIM).tolist()
+    # The focused file is the best semantic match for the query
+    docs[0].vector = query.tolist()
+
+    rag = RAG.__new__(RAG)
+    adal.Component.__init__(rag)
+    rag.transformed_docs, matrix = build_embedding_matrix(docs)
+    rag.code_graph = CodeGraph({"src/app.py": ["src/util.py"]})
+    embedder = lambda queries: SimpleNamespace(data=[SimpleNamespace(embedding=query.tolist()) for _ in queries])
+    rag.retriever = RepoRetriever(top_k=4, max_top_k=10, min_top_k=1, max_score_drop=1.0, embedder=embedder)
+    rag.retriever.build_index_from_matrix(matrix)
+    rag.retriever.build_file_ids(rag.transformed_docs)
+    return rag
+
+
+class TestFileFocus:
+    """Tests for looking up a file's chunks by path"""
+
+    def setup_method(self):
+        self.rag = _make_rag()
+
+    def test_file_chunk_ids_in_document_order(self):
+        ids = self.rag.file_chunk_ids("src/app.py")
+        assert [self.rag.transformed_docs[i].order for i in ids] == list(range(len(ids)))
+        assert self.rag.file_chunk_ids("./src/app.py") == ids
+        assert self.rag.file_chunk_ids("/src\\app.py") == ids
+        assert self.rag.file_chunk_ids("src/missing.py") == []
+
+    def test_file_content_rebuilt_from_chunks(self):
+        assert self.rag.get_file_content("src/app.py") == FOCUS_TEXT.strip()
+        assert self.rag.get_file_content("src/missing.py") == ""
+
+    def test_focused_call_skips_own_chunks_and_adds_neighbours(self):
+        result = self.rag.call("how does this work", file_path="src/app.py")[0]
+        paths = [doc.meta_data["file_path"] for doc in result.documents]
+        assert "src/app.py" not in paths
+        assert "src/util.py" in paths
+        assert len(result.doc_scores) <= len(result.doc_indices)
+
+    def test_unfocused_call_keeps_semantic_hits(self):
+        result = self.rag.call("how does this work")[0]
+        assert result.documents[0].meta_data["file_path"] == "src/app.py"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+"""
+Tests for exporting and importing portable index bundles.
+
+Usage: python -m pytest test/test_index_bundle.py
+"""
+
+import io
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tarfile
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from api import data_pipeline, index_bundle
+from api.chunk_store import load_index_meta
+from api.data_pipeline import DatabaseManager
+from api.index_bundle import MANIFEST_FILE, VECTORS_FILE, export_bundle, import_bundle, repo_db_file
+from test.conftest import CountingEmbedder
+
+GIT = ["git", "-c", "user.email=test@example.com", "-c", "user.name=test"]
+
+
+def _rewrite_manifest(bundle, tampered, update):
+    """Copy a bundle with its manifest changed by update, without fixing the checksums."""
+    with tarfile.open(bundle, "r:gz") as tar:
+        members = {member.name: tar.extractfile(member).read() for member in tar.getmembers()}
+    manifest = json.loads(members[MANIFEST_FILE])
+    update(manifest)
+    members[MANIFEST_FILE] = json.dumps(manifest).encode("utf-8")
+    with tarfile.open(tampered, "w:gz") as tar:
+        for name, data in members.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+
+@pytest.fixture
+def indexed_repo(tmp_path, monkeypatch):
+    """A local git repository indexed under a build box root, with its embedder."""
+    embedder = CountingEmbedder()
+    monkeypatch.setattr(data_pipeline, "get_adalflow_default_root_path", lambda: str(tmp_path / "build"))
+    monkeypatch.setattr(data_pipeline, "get_embedding_transformer", lambda embedder_type: embedder)
+    # Directory exclusions match any component of the absolute path, including the /tmp of tmp_path
+    monkeypatch.setattr(data_pipeline, "DEFAULT_EXCLUDED_DIRS", [])
+
+    repo = tmp_path / "service"
+    subprocess.run(GIT + ["init", "-q", str(repo)], check=True)
+    (repo / "app.py").write_text("def handler():\n    return 1\n", encoding="utf-8")
+    (repo / "README.md").write_text("# Service\n", encoding="utf-8")
+    subprocess.run(GIT + ["-C", str(repo), "add", "-A"], check=True)
+    subprocess.run(GIT + ["-C", str(repo), "commit", "-qm", "init"], check=True)
+    manager = DatabaseManager()
+    manager.refresh_database(str(repo), "local", embedder_type="openai")
+    return manager, embedder
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+class TestIndexBundle:
+    """Tests for index bundles"""
+
+    def test_round_trip_without_reembedding(self, indexed_repo, tmp_path, monkeypatch):
+        manager, embedder = indexed_repo
+        bundle = str(tmp_path / "service.tar.gz")
+        manifest = export_bundle(manager.repo_paths["save_db_file"], bundle)
+        assert manifest["chunks"] == 2 and manifest["dimensions"] == 3
+
+        # Another node with an empty root
+        monkeypatch.setattr(data_pipeline, "get_adalflow_default_root_path", lambda: str(tmp_path / "node"))
+        import_bundle(bundle, embedder_type="openai", databases_dir=str(tmp_path / "node" / "databases"))
+        db_file = str(tmp_path / "node" / "databases" / "service.pkl")
+        assert load_index_meta(db_file)["revision"] == manifest["revision"]
+
+        documents = DatabaseManager().prepare_database(manager.repo_paths["save_repo_dir"], "local",
+                                                       embedder_type="openai")
+        assert sorted(doc.meta_data["file_path"] for doc in documents) == ["README.md", "app.py"]
+        assert len(embedder.embedded) == 2
+
+    def test_import_rejects_other_embedder(self, indexed_repo, tmp_path):
+        manager, _ = indexed_repo
+        bundle = str(tmp_path / "service.tar.gz")
+        export_bundle(manager.repo_paths["save_db_file"], bundle)
+        with pytest.raises(ValueError, match="re-index"):
+            import_bundle(bundle, embedder_type="ollama", databases_dir=str(tmp_path / "node"))
+
+    def test_import_rejects_corrupted_bundle(self, indexed_repo, tmp_path):
+        manager, _ = indexed_repo
+        bundle = str(tmp_path / "service.tar.gz")
+        export_bundle(manager.repo_paths["save_db_file"], bundle)
+        with tarfile.open(bundle, "r:gz") as tar:
+            manifest = tar.extractfile(MANIFEST_FILE).read()
+        corrupted = str(tmp_path / "corrupted.tar.gz")
+        with tarfile.open(corrupted, "w:gz") as tar:
+            for name, data in ((MANIFEST_FILE, manifest), (VECTORS_FILE, b"not vectors")):
+                info = tarfile.TarInfo(name)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+        with pytest.raises(ValueError, match="checksum"):
+            import_bundle(corrupted, embedder_type="openai", databases_dir=str(tmp_path / "node"))
+
+    @pytest.mark.parametrize("repo", ["../../x", "/tmp/x", "a/b", "..", "a\\b"])
+    def test_import_rejects_unsafe_repo_name(self, indexed_repo, tmp_path, repo):
+        manager, _ = indexed_repo
+        bundle = str(tmp_path / "service.tar.gz")
+        export_bundle(manager.repo_paths["save_db_file"], bundle)
+        tampered = str(tmp_path / "tampered.tar.gz")
+        _rewrite_manifest(bundle, tampered, lambda manifest: manifest.update(repo=repo))
+        databases_dir = tmp_path / "node" / "databases"
+        with pytest.raises(ValueError, match="invalid repository name"):
+            import_bundle(tampered, embedder_type="openai", databases_dir=str(databases_dir))
+        assert not databases_dir.exists()
+
+    @pytest.mark.parametrize("key", ["embedder", "chunks", "dimensions"])
+    def test_cli_reports_incomplete_manifest(self, indexed_repo, tmp_path, capsys, key):
+        manager, _ = indexed_repo
+        bundle = str(tmp_path / "service.tar.gz")
+        export_bundle(manager.repo_paths["save_db_file"], bundle)
+        tampered = str(tmp_path / "tampered.tar.gz")
+        _rewrite_manifest(bundle, tampered, lambda manifest: manifest.pop(key))
+        assert index_bundle.main(["import", tampered, "--embedder", "openai"]) == 1
+        assert capsys.readouterr().err.startswith(f"Error: Index bundle {tampered} has no {key}")
+
+    def test_repo_db_file(self, monkeypatch, tmp_path):
+        monkeypatch.setattr("api.index_bundle.get_adalflow_default_root_path", lambda: str(tmp_path))
+        assert repo_db_file("https://github.com/org/repo", "github") == str(tmp_path / "databases" / "org_repo.pkl")
+        assert repo_db_file("/srv/checkouts/service/") == str(tmp_path / "databases" / "service.pkl")
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Tests for the offline batch indexing command.
+
+Usage: python -m pytest test/test_index_cli.py
+"""
+
+import json
+import os
+import shutil
+import subprocess
+import sys
+import time
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from api import data_pipeline, index
+from api.chunk_store import CHUNK_STORE_FILE, ChunkStore, load_index_meta, load_snapshot
+from api.index import guess_repo_type, pending_repositories, read_repo_list
+from test.conftest import CountingEmbedder
+
+GIT = ["git", "-c", "user.email=test@example.com", "-c", "user.name=test"]
+
+
+class TestIndexCli:
+    """Tests for batch indexing"""
+
+    def test_guess_repo_type(self):
+        assert guess_repo_type("https://github.com/org/repo") == "github"
+        assert guess_repo_type("https://gitlab.example.com/group/repo") == "gitlab"
+        assert guess_repo_type("https://bitbucket.org/team/repo") == "bitbucket"
+        assert guess_repo_type("/srv/repos/local") == "local"
+
+    def test_read_repo_list(self, tmp_path):
+        repos_file = tmp_path / "repos.txt"
+        repos_file.write_text("# nightly\nhttps://github.com/org/a\n\nhttps://git.corp/org/b gitlab\n", encoding="utf-8")
+        assert read_repo_list(str(repos_file)) == [("https://github.com/org/a", "github"),
+                                                   ("https://git.corp/org/b", "gitlab")]
+
+    def test_pending_repositories_skip_done(self):
+        repos = [("a", "github"), ("b", "github"), ("c", "github")]
+        state = {"a": {"status": "done"}, "b": {"status": "failed"}}
+        assert pending_repositories(repos, state) == [("b", "github"), ("c", "github")]
+
+    @pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+    def test_main_indexes_and_resumes(self, tmp_path, monkeypatch, capsys):
+        embedder = CountingEmbedder()
+        monkeypatch.setattr(data_pipeline, "get_adalflow_default_root_path", lambda: str(tmp_path / "adalflow"))
+        monkeypatch.setattr(data_pipeline, "get_embedding_transformer", lambda embedder_type: embedder)
+        # Directory exclusions match any component of the absolute path, including the /tmp of tmp_path
+        monkeypatch.setattr(data_pipeline, "DEFAULT_EXCLUDED_DIRS", [])
+
+        repo = tmp_path / "service"
+        subprocess.run(GIT + ["init", "-q", str(repo)], check=True)
+        (repo / "app.py").write_text("def handler():\n    return 1\n", encoding="utf-8")
+        subprocess.run(GIT + ["-C", str(repo), "add", "-A"], check=True)
+        subprocess.run(GIT + ["-C", str(repo), "commit", "-qm", "init"], check=True)
+        state_file = tmp_path / "state.json"
+        missing = str(tmp_path / "missing")
+
+        args = [str(repo), missing, "--workers", "0", "--state-file", str(state_file), "--embedder", "openai"]
+        assert index.main(args) == 1
+        state = json.loads(state_file.read_text(encoding="utf-8"))
+        assert state[str(repo)]["status"] == "done" and state[str(repo)]["embedded"] == 1
+        assert state[missing]["status"] == "failed"
+        assert "done   " + str(repo) in capsys.readouterr().out
+
+        # The second run only retries the failed repository
+        assert index.main(args) == 1
+        assert "Indexing 1 of 2 repositories" in capsys.readouterr().out
+        assert len(embedder.embedded) == 1
+
+    @pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+    def test_parallel_workers_keep_each_others_chunks(self, tmp_path, monkeypatch):
+        root = tmp_path / "adalflow"
+        monkeypatch.setattr(data_pipeline, "get_adalflow_default_root_path", lambda: str(root))
+        monkeypatch.setattr(data_pipeline, "get_embedding_transformer", lambda embedder_type: CountingEmbedder())
+        monkeypatch.setattr(data_pipeline, "DEFAULT_EXCLUDED_DIRS", [])
+        # Every build drops the previous snapshot, so every build collects garbage
+        monkeypatch.setitem(data_pipeline.configs, "repository", {"max_snapshots": 1})
+        real_save_snapshot = data_pipeline.save_snapshot
+
+        def slow_save_snapshot(db_file, *args, **kwargs):
+            # The slow build has stored its chunks but not snapshotted them while the other one collects
+            if os.path.basename(db_file).startswith("slow"):
+                time.sleep(2)
+            return real_save_snapshot(db_file, *args, **kwargs)
+
+        monkeypatch.setattr(data_pipeline, "save_snapshot", slow_save_snapshot)
+
+        repos = []
+        for name in ("slow", "fast"):
+            repo = tmp_path / name
+            subprocess.run(GIT + ["init", "-q", str(repo)], check=True)
+            (repo / "shared.py").write_text("def shared():\n    return 0\n", encoding="utf-8")
+            (repo / "app.py").write_text(f"def {name}():\n    return 1\n", encoding="utf-8")
+            subprocess.run(GIT + ["-C", str(repo), "add", "-A"], check=True)
+            subprocess.run(GIT + ["-C", str(repo), "commit", "-qm", "init"], check=True)
+            repos.append(repo)
+        common = ["--state-file", str(tmp_path / "state.json"), "--embedder", "openai", "--fresh"]
+        assert index.main([str(repo) for repo in repos] + ["--workers", "0"] + common) == 0
+
+        for repo in repos:
+            (repo / "app.py").write_text(f"def {repo.name}():\n    return 2\n", encoding="utf-8")
+            subprocess.run(GIT + ["-C", str(repo), "commit", "-qam", "change"], check=True)
+        assert index.main([str(repo) for repo in repos] + ["--workers", "2", "--embed-concurrency", "2"] + common) == 0
+
+        databases_dir = root / "databases"
+        store = ChunkStore(str(databases_dir / CHUNK_STORE_FILE))
+        try:
+            for repo in repos:
+                db_file = str(databases_dir / f"{repo.name}.pkl")
+                documents = load_snapshot(db_file, load_index_meta(db_file)["revision"], store)
+                assert documents is not None
+                assert any("return 2" in doc.text for doc in documents)
+        finally:
+            store.close()
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Tests for server-sent-event streaming in the OpenRouter client, against a local stub server.
+
+Usage: python -m pytest test/test_openrouter_streaming.py
+"""
+
+import asyncio
+import json
+import os
+import sys
+import time
+
+import pytest
+from aiohttp import web
+from adalflow.core.types import ModelType
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from api import openrouter_client
+from api.openrouter_client import OpenRouterClient
+from api.streaming import stream_answer
+
+# Seconds the stub waits between the first token and the rest of the answer
+GENERATION_DELAY = 0.5
+
+
+def _event(payload) -> bytes:
+    return f"data: {json.dumps(payload, ensure_ascii=False)}\n\n".encode("utf-8")
+
+
+def _delta(content) -> bytes:
+    return _event({"choices": [{"delta": {"content": content}}]})
+
+
+async def _completions(request):
+    body = await request.json()
+    request.app["requests"].append(body)
+    if body["model"] == "missing/model":
+        return web.json_response({"error": {"message": "model not found"}}, status=404)
+    if body["messages"][0]["content"] == "long":
+        return web.json_response({"error": {"message": "This model's maximum context length is 8192 tokens"}},
+                                 status=400)
+
+    response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+    await response.prepare(request)
+    await response.write(b": OPENROUTER PROCESSING\n\n")
+    await response.write(_delta("Hel"))
+    await asyncio.sleep(GENERATION_DELAY)
+    if body["model"] == "failing/model":
+        await response.write(_event({"error": {"message": "upstream overloaded"}}))
+        return response
+    if body["model"] == "stalled/model":
+        await asyncio.sleep(GENERATION_DELAY * 4)
+        return response
+    # A multi-byte character split across two writes
+    encoded = _delta("lo wörld")
+    split = encoded.index("ö".encode("utf-8")) + 1
+    await response.write(encoded[:split])
+    await response.write(encoded[split:])
+    await response.write(b"data: [DONE]\n\n")
+    await response.write(_delta("after done"))
+    return response
+
+
+async def _serve():
+    app = web.Application()
+    app["requests"] = []
+    app.router.add_post("/api/v1/chat/completions", _completions)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    client = OpenRouterClient()
+    client.async_client = {"api_key": "test-key", "base_url": f"http://127.0.0.1:{port}/api/v1"}
+    return app, runner, client
+
+
+async def _collect(model):
+    """Chunks, time to the first chunk, requests received and the error that ended the stream."""
+    app, runner, client = await _serve()
+    chunks, first_token, error = [], None, None
+    try:
+        api_kwargs = client.convert_inputs_to_api_kwargs("Hi", {"model": model}, ModelType.LLM)
+        start = time.perf_counter()
+        try:
+            async for chunk in await client.acall(api_kwargs=api_kwargs, model_type=ModelType.LLM):
+                if first_token is None:
+                    first_token = time.perf_counter() - start
+                chunks.append(chunk)
+        except Exception as e:
+            error = e
+        return chunks, first_token, app["requests"], error
+    finally:
+        await client.aclose()
+        await runner.cleanup()
+
+
+class TestOpenRouterStreaming:
+    """Tests for OpenRouterClient.acall streaming"""
+
+    def test_tokens_arrive_before_generation_finishes(self):
+        chunks, first_token, requests, error = asyncio.run(_collect("openai/gpt-4o"))
+        assert chunks == ["Hel", "lo wörld"] and error is None
+        assert first_token < GENERATION_DELAY
+        assert requests[0]["stream"] is True
+
+    def test_http_error_is_raised(self):
+        chunks, _, _, error = asyncio.run(_collect("missing/model"))
+        assert chunks == []
+        assert isinstance(error, ValueError) and "OpenRouter API error (404)" in str(error)
+
+    def test_error_event_is_raised(self):
+        chunks, _, _, error = asyncio.run(_collect("failing/model"))
+        assert chunks == ["Hel"]
+        assert isinstance(error, ValueError) and str(error) == "OpenRouter API error: upstream overloaded"
+
+    def test_stalled_stream_times_out(self, monkeypatch):
+        monkeypatch.setattr(openrouter_client, "STREAM_READ_TIMEOUT", GENERATION_DELAY)
+        chunks, _, _, error = asyncio.run(_collect("stalled/model"))
+        assert chunks == ["Hel"]
+        assert isinstance(error, asyncio.TimeoutError) and "timed out" in str(error)
+
+    def test_token_limit_error_falls_back_to_simplified_prompt(self):
+        async def run():
+            app, runner, client = await _serve()
+            try:
+                chunks = [text async for text in stream_answer("openrouter", client, {"model": "openai/gpt-4o"},
+                                                               "long", fallback_prompt="short")]
+                return chunks, [request["messages"][0]["content"] for request in app["requests"]]
+            finally:
+                await client.aclose()
+                await runner.cleanup()
+
+        chunks, prompts = asyncio.run(run())
+        assert prompts == ["long", "short"]
+        assert chunks == ["Hel", "lo wörld"]
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,165 @@
+#!/usr/bin/env python3
+"""
+Tests for query-time file filtering in RepoRetriever.
+
+Usage: python -m pytest test/test_retriever.py
+"""
+
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from adalflow.core.types import Document
+
+from api.retriever import RepoRetriever, build_embedding_matrix, choose_top_k
+
+
+FILES = ["src/app.py", "src/util.py", "docs/guide.md", "tests/test_app.py"]
+CHUNKS_PER_FILE = 5
+DIM = 16
+
+
+def _make_documents():
+    rng = np.random.default_rng(0)
+    docs = []
+    for path in FILES:
+        for i in range(CHUNKS_PER_FILE):
+            doc = Document(text=f"{path} chunk {i}", meta_data={"file_path": path})
+            doc.vector = rng.standard_normal(DIM).astype(np.float32).tolist()
+            docs.append(doc)
+    return docs
+
+
+class TestRepoRetriever:
+    """Tests for the bitmap filter applied on top of the full FAISS index"""
+
+    def setup_method(self):
+        self.docs = _make_documents()
+        self.retriever = RepoRetriever(
+            top_k=len(self.docs),
+            documents=self.docs,
+            document_map_func=lambda doc: doc.vector,
+        )
+        self.retriever.build_file_ids(self.docs)
+
+    def _paths(self, output):
+        return {self.docs[i].meta_data["file_path"] for i in output[0].doc_indices}
+
+    def test_file_ids_group_chunks(self):
+        assert set(self.retriever.file_ids) == set(FILES)
+        assert all(len(ids) == CHUNKS_PER_FILE for ids in self.retriever.file_ids.values())
+
+    def test_no_filter_searches_everything(self):
+        assert self.retriever.set_file_filter() == len(self.docs)
+        output = self.retriever.retrieve_embedding_queries(self.docs[0].vector)
+        assert self._paths(output) == set(FILES)
+
+    def test_excluded_dirs(self):
+        count = self.retriever.set_file_filter(excluded_dirs=["./docs/"])
+        assert count == 3 * CHUNKS_PER_FILE
+        output = self.retriever.retrieve_embedding_queries(self.docs[0].vector)
+        assert len(output[0].doc_indices) == count
+        assert "docs/guide.md" not in self._paths(output)
+
+    def test_included_files(self):
+        count = self.retriever.set_file_filter(included_files=["util.py"])
+        assert count == CHUNKS_PER_FILE
+        output = self.retriever.retrieve_embedding_queries(self.docs[0].vector)
+        assert self._paths(output) == {"src/util.py"}
+
+    def test_filter_matching_nothing(self):
+        assert self.retriever.set_file_filter(included_dirs=["missing"]) == 0
+        output = self.retriever.retrieve_embedding_queries(self.docs[0].vector)
+        assert output[0].doc_indices == []
+
+    def test_two_stage_search(self):
+        two_stage = RepoRetriever(top_k=3, documents=self.docs, document_map_func=lambda doc: doc.vector,
+                                  two_stage_min_chunks=1, two_stage_top_files=len(FILES))
+        two_stage.build_file_ids(self.docs)
+        assert two_stage.two_stage
+        flat = self.retriever.retrieve_embedding_queries(self.docs[6].vector, top_k=3)
+        output = two_stage.retrieve_embedding_queries(self.docs[6].vector)
+        assert output[0].doc_indices == flat[0].doc_indices
+
+        two_stage.set_file_filter(included_dirs=["docs"])
+        output = two_stage.retrieve_embedding_queries(self.docs[6].vector)
+        assert {self.docs[i].meta_data["file_path"] for i in output[0].doc_indices} == {"docs/guide.md"}
+
+    def test_batch_keeps_each_querys_hits(self):
+        # The second query's best file has fewer chunks than top_k, the first query's does not
+        docs = self.docs + [Document(text="small chunk", meta_data={"file_path": "small.py"})]
+        docs[-1].vector = (-np.asarray(self.docs[0].vector)).tolist()
+        two_stage = RepoRetriever(top_k=4, documents=docs, document_map_func=lambda doc: doc.vector,
+                                  two_stage_min_chunks=1, two_stage_top_files=1)
+        two_stage.build_file_ids(docs)
+        output = two_stage.retrieve_embedding_queries([docs[0].vector, docs[-1].vector])
+        assert len(output[0].doc_indices) == 4
+        assert output[1].doc_indices == [len(docs) - 1]
+        assert len(output[1].doc_scores) == 1
+
+    def test_filter_cache_and_reset(self):
+        self.retriever.set_file_filter(included_files=["app.py"])
+        self.retriever.set_file_filter(included_files=["app.py"])
+        assert len(self.retriever._filter_cache) == 1
+        self.retriever.clear_file_filter()
+        assert self.retriever.active_count == len(self.docs)
+
+
+class TestBuildEmbeddingMatrix:
+    """Tests for the vectorised embedding validation"""
+
+    def test_drops_invalid_vectors(self):
+        docs = _make_documents()
+        docs[1].vector = None
+        docs[2].vector = [0.5] * (DIM + 1)
+        docs[3].vector = [0.0] * DIM
+        docs[4].vector = [float("nan")] * DIM
+        docs[5].vector = np.ones(DIM, dtype=np.float32)
+
+        kept, matrix = build_embedding_matrix(docs)
+
+        assert matrix.shape == (len(docs) - 4, DIM)
+        assert matrix.dtype == np.float32
+        assert all(doc not in kept for doc in docs[1:5])
+        assert np.allclose(matrix[1], 1.0)
+
+    def test_no_vectors(self):
+        kept, matrix = build_embedding_matrix([Document(text="x")])
+        assert kept == []
+        assert matrix.size == 0
+
+    def test_index_from_matrix_matches_documents(self):
+        docs = _make_documents()
+        kept, matrix = build_embedding_matrix(docs)
+        retriever = RepoRetriever(top_k=1)
+        retriever.build_index_from_matrix(matrix)
+        assert np.allclose(np.linalg.norm(retriever.xb, axis=1), 1.0, atol=1e-5)
+        output = retriever.retrieve_embedding_queries(docs[7].vector)
+        assert output[0].doc_indices == [7]
+
+
+class TestChooseTopK:
+    """Tests for the score drop-off cut"""
+
+    def test_cuts_at_score_drop(self):
+        assert choose_top_k([0.95, 0.94, 0.92, 0.80, 0.79], min_top_k=1, max_score_drop=0.05) == 3
+
+    def test_keeps_minimum(self):
+        assert choose_top_k([0.95, 0.70, 0.60], min_top_k=2, max_score_drop=0.05) == 2
+        assert choose_top_k([0.95], min_top_k=5, max_score_drop=0.05) == 1
+
+    def test_no_scores(self):
+        assert choose_top_k([], min_top_k=5, max_score_drop=0.05) == 0
+
+    def test_retriever_settings(self):
+        retriever = RepoRetriever(top_k=20, max_top_k=40, min_top_k=3, max_score_drop=0.1)
+        assert (retriever.top_k, retriever.max_top_k, retriever.min_top_k) == (20, 40, 3)
+        assert RepoRetriever(top_k=20).max_top_k == 20
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Tests for partial, sparse clones driven by the file filters.
+
+Usage: python -m pytest test/test_sparse_clone.py
+"""
+
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from api import data_pipeline
+from api.data_pipeline import download_repo, sparse_checkout_patterns
+
+GIT = ["git", "-c", "user.email=test@example.com", "-c", "user.name=test"]
+
+
+@pytest.fixture
+def remote(tmp_path):
+    """Local bare remote serving a small repository with partial clone enabled."""
+    work = tmp_path / "work"
+    for path, content in {
+        "README.md": "# readme",
+        "yarn.lock": "lock",
+        "services/pay/api.py": "def pay(): pass",
+        "services/pay/logo.png": "binary",
+        "services/pay/node_modules/dep/index.js": "module.exports = 1",
+        "services/search/query.py": "def search(): pass",
+        "docs/guide.md": "guide",
+    }.items():
+        (work / path).parent.mkdir(parents=True, exist_ok=True)
+        (work / path).write_text(content, encoding="utf-8")
+    subprocess.run(GIT + ["init", "-q", str(work)], check=True)
+    subprocess.run(GIT + ["-C", str(work), "add", "-A"], check=True)
+    subprocess.run(GIT + ["-C", str(work), "commit", "-qm", "init"], check=True)
+    bare = tmp_path / "remote.git"
+    subprocess.run(["git", "clone", "-q", "--bare", str(work), str(bare)], check=True)
+    subprocess.run(["git", "-C", str(bare), "config", "uploadpack.allowFilter", "true"], check=True)
+    return "file://" + str(bare)
+
+
+def _files(path):
+    return sorted(
+        os.path.relpath(os.path.join(d, f), path).replace(os.sep, "/")
+        for d, _, files in os.walk(path) if ".git" not in d.split(os.sep) for f in files
+    )
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+class TestSparseClone:
+    """Tests for sparse checkout patterns and partial clones"""
+
+    def test_exclusion_patterns(self):
+        patterns = sparse_checkout_patterns(excluded_dirs=["./vendor/"], excluded_files=["secrets.json"])
+        assert "*.py" in patterns and "*.md" in patterns
+        assert "!**/node_modules/**" in patterns and "!**/vendor/**" in patterns
+        assert "!secrets.json" in patterns and "!yarn.lock" in patterns
+        # Wildcard exclusions are compared literally when indexing, so they must not narrow the checkout
+        assert "!*.min.js" not in patterns
+
+    def test_inclusion_patterns(self):
+        patterns = sparse_checkout_patterns(included_dirs=["./pay/", "services/search"], included_files=["Dockerfile"])
+        assert "**/pay/**/*.py" in patterns
+        assert "/services/search/**/*.py" in patterns
+        assert "*Dockerfile" in patterns
+
+    def test_sparse_clone_checks_out_indexed_files_only(self, remote, tmp_path, monkeypatch):
+        monkeypatch.setitem(data_pipeline.configs, "repository", {"sparse_checkout": True})
+        download_repo(remote, str(tmp_path / "clone"))
+        assert _files(tmp_path / "clone") == ["README.md", "services/pay/api.py", "services/search/query.py"]
+        config = subprocess.run(["git", "-C", str(tmp_path / "clone"), "config", "remote.origin.partialclonefilter"],
+                                stdout=subprocess.PIPE, check=True)
+        assert config.stdout.decode().strip() == "blob:none"
+
+    def test_sparse_clone_of_included_dir(self, remote, tmp_path, monkeypatch):
+        monkeypatch.setitem(data_pipeline.configs, "repository", {"sparse_checkout": True})
+        download_repo(remote, str(tmp_path / "clone"), included_dirs=["pay"])
+        assert _files(tmp_path / "clone") == ["services/pay/api.py", "services/pay/node_modules/dep/index.js"]
+
+    def test_full_clone_when_disabled(self, remote, tmp_path, monkeypatch):
+        monkeypatch.setitem(data_pipeline.configs, "repository", {"sparse_checkout": False})
+        download_repo(remote, str(tmp_path / "clone"))
+        assert len(_files(tmp_path / "clone")) == 7
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
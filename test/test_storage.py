@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Tests for sharing repository indexes between replicas through S3.
+
+Usage: python -m pytest test/test_storage.py
+"""
+
+import hashlib
+import os
+import shutil
+import subprocess
+import sys
+
+import pytest
+from botocore.exceptions import ClientError
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from api import data_pipeline
+from api.chunk_store import load_index_meta
+from api.data_pipeline import DatabaseManager
+from api.storage import LocalStorage, S3Storage, get_storage
+from test.conftest import CountingEmbedder
+
+GIT = ["git", "-c", "user.email=test@example.com", "-c", "user.name=test"]
+
+
+class FakeS3Client:
+    """In-memory stand-in for the boto3 S3 client calls the storage makes."""
+
+    def __init__(self):
+        self.objects = {}
+        self.head_requests = 0
+
+    def upload_file(self, filename, bucket, key):
+        with open(filename, "rb") as f:
+            self.objects[(bucket, key)] = f.read()
+
+    def download_file(self, bucket, key, filename):
+        with open(filename, "wb") as f:
+            f.write(self.objects[(bucket, key)])
+
+    def head_object(self, Bucket, Key):
+        self.head_requests += 1
+        if (Bucket, Key) not in self.objects:
+            raise ClientError({"Error": {"Code": "404", "Message": "Not Found"}}, "HeadObject")
+        return {"ETag": '"%s"' % hashlib.md5(self.objects[(Bucket, Key)]).hexdigest()}
+
+
+def _commit(repo, content):
+    (repo / "app.py").write_text(content, encoding="utf-8")
+    subprocess.run(GIT + ["-C", str(repo), "add", "-A"], check=True)
+    subprocess.run(GIT + ["-C", str(repo), "commit", "-qm", "change"], check=True)
+
+
+@pytest.mark.skipif(shutil.which("git") is None, reason="git is not installed")
+class TestS3Storage:
+    """Tests for the S3 index tier with a local read-through cache"""
+
+    def test_replicas_share_indexes(self, tmp_path, monkeypatch):
+        embedder = CountingEmbedder()
+        monkeypatch.setattr(data_pipeline, "get_embedding_transformer", lambda embedder_type: embedder)
+        # Directory exclusions match any component of the absolute path, including the /tmp of tmp_path
+        monkeypatch.setattr(data_pipeline, "DEFAULT_EXCLUDED_DIRS", [])
+        repo = tmp_path / "service"
+        subprocess.run(GIT + ["init", "-q", str(repo)], check=True)
+        _commit(repo, "def handler():\n    return 1\n")
+
+        client = FakeS3Client()
+        builder = S3Storage("indexes", prefix="deepwiki/", client=client)
+        replica = S3Storage("indexes", prefix="deepwiki/", client=client, check_interval_seconds=3600)
+
+        monkeypatch.setattr(data_pipeline, "get_adalflow_default_root_path", lambda: str(tmp_path / "builder"))
+        DatabaseManager(storage=builder).refresh_database(str(repo), "local", embedder_type="openai")
+        assert ("indexes", "deepwiki/service.tar.gz") in client.objects
+        assert len(embedder.embedded) == 1
+
+        monkeypatch.setattr(data_pipeline, "get_adalflow_default_root_path", lambda: str(tmp_path / "replica"))
+        manager = DatabaseManager(storage=replica)
+        documents = manager.prepare_database(str(repo), "local", embedder_type="openai")
+        assert [doc.meta_data["file_path"] for doc in documents] == ["app.py"]
+        assert len(embedder.embedded) == 1
+
+        # Served from the local cache without asking the bucket again
+        head_requests = client.head_requests
+        DatabaseManager(storage=replica).prepare_database(str(repo), "local", embedder_type="openai")
+        assert client.head_requests == head_requests
+
+        # A newer bundle is picked up once the check interval has passed
+        _commit(repo, "def handler():\n    return 2\n")
+        monkeypatch.setattr(data_pipeline, "get_adalflow_default_root_path", lambda: str(tmp_path / "builder"))
+        DatabaseManager(storage=builder).refresh_database(str(repo), "local", embedder_type="openai")
+        replica.check_interval_seconds = 0
+        monkeypatch.setattr(data_pipeline, "get_adalflow_default_root_path", lambda: str(tmp_path / "replica"))
+        documents = DatabaseManager(storage=replica).prepare_database(str(repo), "local", embedder_type="openai")
+        assert "return 2" in documents[0].text
+        assert load_index_meta(manager.repo_paths["save_db_file"])["revision"] == \
+            load_index_meta(str(tmp_path / "builder" / "databases" / "service.pkl"))["revision"]
+        assert len(embedder.embedded) == 2
+
+    def test_failed_publish_is_not_rolled_back(self, tmp_path, monkeypatch):
+        monkeypatch.setattr(data_pipeline, "get_embedding_transformer", lambda embedder_type: CountingEmbedder())
+        monkeypatch.setattr(data_pipeline, "DEFAULT_EXCLUDED_DIRS", [])
+        monkeypatch.setattr(data_pipeline, "get_adalflow_default_root_path", lambda: str(tmp_path / "node"))
+        repo = tmp_path / "service"
+        subprocess.run(GIT + ["init", "-q", str(repo)], check=True)
+        _commit(repo, "def handler():\n    return 1\n")
+
+        client = FakeS3Client()
+        storage = S3Storage("indexes", client=client, check_interval_seconds=0)
+        DatabaseManager(storage=storage).refresh_database(str(repo), "local", embedder_type="openai")
+
+        # The next build cannot be published, the bucket keeps the older bundle
+        def failing_upload(filename, bucket, key):
+            raise OSError("connection reset")
+
+        monkeypatch.setattr(client, "upload_file", failing_upload)
+        _commit(repo, "def handler():\n    return 2\n")
+        manager = DatabaseManager(storage=storage)
+        manager.refresh_database(str(repo), "local", embedder_type="openai")
+        db_file = manager.repo_paths["save_db_file"]
+        revision = load_index_meta(db_file)["revision"]
+
+        documents = DatabaseManager(storage=storage).prepare_database(str(repo), "local", embedder_type="openai")
+        assert "return 2" in documents[0].text
+        assert load_index_meta(db_file)["revision"] == revision
+
+    def test_missing_bundle_falls_back_to_local(self, tmp_path):
+        storage = S3Storage("indexes", client=FakeS3Client())
+        assert storage.fetch(str(tmp_path / "service.pkl")) is False
+
+    def test_get_storage(self, monkeypatch):
+        monkeypatch.setitem(data_pipeline.configs, "storage", {"backend": "local"})
+        assert type(get_storage()) is LocalStorage
+        # One backend per process, so cached indexes are not checked again on every request
+        assert get_storage() is get_storage(use_s3=False)
+        monkeypatch.delenv("DEEPWIKI_S3_BUCKET", raising=False)
+        with pytest.raises(ValueError, match="bucket"):
+            get_storage(use_s3=True)
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
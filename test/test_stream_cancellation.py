@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+"""
+Tests for cancelling generation when the websocket client disconnects, and the stream metrics.
+
+Usage: python -m pytest test/test_stream_cancellation.py
+"""
+
+import asyncio
+import os
+import sys
+import threading
+import time
+
+import pytest
+import uvicorn
+from aiohttp import ClientSession
+from fastapi import FastAPI
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from api import metrics, simple_chat, websocket_wiki
+from api.streaming import stream_answer, stream_text
+
+
+class EndlessStream:
+    """Provider stream that sends one token and then waits forever, like a slow model."""
+
+    def __init__(self):
+        self.closed = False
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not hasattr(self, "sent"):
+            self.sent = True
+            return "token "
+        await asyncio.Event().wait()
+
+    async def aclose(self):
+        self.closed = True
+
+
+class EndlessClient:
+    def __init__(self):
+        self.stream = EndlessStream()
+
+    def convert_inputs_to_api_kwargs(self, input=None, model_kwargs=None, model_type=None):
+        return {"input": input}
+
+    async def acall(self, api_kwargs=None, model_type=None):
+        return self.stream
+
+
+def _counter(name, **labels):
+    return metrics.get_value(name, **labels)
+
+
+class TestStreamCancellation:
+    """Tests for closing provider streams that are abandoned part way"""
+
+    def test_cancelled_stream_is_closed_and_counted(self):
+        client = EndlessClient()
+        cancelled = _counter("deepwiki_streams_total", provider="openrouter", outcome="cancelled")
+
+        async def run():
+            received = []
+
+            async def consume():
+                async for text in stream_answer("openrouter", client, {}, "Hi"):
+                    received.append(text)
+
+            task = asyncio.create_task(consume())
+            while not received:
+                await asyncio.sleep(0.01)
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+            return received
+
+        assert asyncio.run(run()) == ["token "]
+        assert client.stream.closed
+        assert _counter("deepwiki_streams_total", provider="openrouter", outcome="cancelled") == cancelled + 1
+
+    def test_savings_are_estimated_from_completed_answers(self):
+        provider = "savings-test"
+        metrics.record_stream(provider, "completed", 100)
+        metrics.record_stream(provider, "completed", 300)
+        metrics.record_stream(provider, "cancelled", 50)
+        assert _counter("deepwiki_cancelled_tokens_saved_total", provider=provider) == 150
+        assert _counter("deepwiki_stream_output_tokens_total", provider=provider, outcome="cancelled") == 50
+
+    def test_abandoned_consumer_closes_the_stream(self):
+        client = EndlessClient()
+
+        async def run():
+            deltas = stream_text("openrouter", client, {}, "Hi")
+            assert await deltas.__anext__() == "token "
+            await deltas.aclose()
+
+        asyncio.run(run())
+        assert client.stream.closed
+
+    def test_render(self):
+        metrics.increment("deepwiki_client_disconnects_total", 0)
+        text = metrics.render()
+        assert "# TYPE deepwiki_streams_total counter" in text
+        assert 'deepwiki_streams_total{outcome="completed",provider="savings-test"} 2' in text
+        with pytest.raises(ValueError):
+            metrics.increment("unknown_metric")
+
+
+async def _serve(app):
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning",
+                                           timeout_graceful_shutdown=1))
+    serving = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.01)
+    return server, serving, server.servers[0].sockets[0].getsockname()[1]
+
+
+class TestWebsocketDisconnect:
+    """Tests for the websocket handler's disconnect watcher"""
+
+    def test_disconnect_during_retriever_preparation(self, monkeypatch):
+        release = threading.Event()
+
+        class SlowRAG:
+            def __init__(self, provider=None, model=None):
+                pass
+
+            def prepare_retriever(self, *args):
+                # Blocks like loading a large index
+                release.wait(10)
+
+        monkeypatch.setattr(websocket_wiki, "RAG", SlowRAG)
+
+        async def run():
+            app = FastAPI()
+            app.add_api_websocket_route("/ws/chat", websocket_wiki.handle_websocket_chat)
+            server, serving, port = await _serve(app)
+            disconnects = _counter("deepwiki_client_disconnects_total")
+            try:
+                async with ClientSession() as session:
+                    async with session.ws_connect(f"http://127.0.0.1:{port}/ws/chat") as ws:
+                        await ws.send_json({"repo_url": "https://github.com/o/r",
+                                            "messages": [{"role": "user", "content": "Hi"}]})
+                        await asyncio.sleep(0.1)
+                # The event loop notices the disconnect while the preparation is still blocked
+                for _ in range(100):
+                    if _counter("deepwiki_client_disconnects_total") > disconnects:
+                        break
+                    await asyncio.sleep(0.02)
+                assert not release.is_set()
+                return _counter("deepwiki_client_disconnects_total") - disconnects
+            finally:
+                release.set()
+                server.should_exit = True
+                await serving
+
+        assert asyncio.run(run()) == 1
+
+    def test_http_chat_prepares_retriever_off_the_event_loop(self, monkeypatch):
+        started = threading.Event()
+        finished = threading.Event()
+
+        class SlowRAG:
+            def __init__(self, provider=None, model=None):
+                pass
+
+            def prepare_retriever(self, *args):
+                started.set()
+                # Blocks like loading a large index
+                time.sleep(1)
+                finished.set()
+
+        monkeypatch.setattr(simple_chat, "RAG", SlowRAG)
+        request = simple_chat.ChatCompletionRequest(
+            repo_url="https://github.com/o/r", messages=[simple_chat.ChatMessage(role="user", content="Hi")]
+        )
+
+        async def run():
+            chat = asyncio.create_task(simple_chat.chat_completions_stream(request))
+            try:
+                while not started.is_set():
+                    await asyncio.sleep(0.01)
+                # Other connections are still served while the preparation blocks
+                await asyncio.sleep(0.05)
+                return not finished.is_set()
+            finally:
+                chat.cancel()
+
+        assert asyncio.run(run())
+
+    def test_disconnect_cancels_generation(self, monkeypatch):
+        async def run():
+            cancelled = asyncio.Event()
+
+            async def endless_answer(websocket, request_data):
+                await websocket.send_text("first")
+                try:
+                    await asyncio.Event().wait()
+                except asyncio.CancelledError:
+                    cancelled.set()
+                    raise
+
+            monkeypatch.setattr(websocket_wiki, "_answer_chat", endless_answer)
+            app = FastAPI()
+            app.add_api_websocket_route("/ws/chat", websocket_wiki.handle_websocket_chat)
+            server, serving, port = await _serve(app)
+            try:
+                async with ClientSession() as session:
+                    async with session.ws_connect(f"http://127.0.0.1:{port}/ws/chat") as ws:
+                        await ws.send_json({"repo_url": "https://github.com/o/r", "messages": []})
+                        assert (await ws.receive()).data == "first"
+                # The client is gone while the answer is still being generated
+                await asyncio.wait_for(cancelled.wait(), 5)
+            finally:
+                server.should_exit = True
+                await serving
+
+        disconnects = _counter("deepwiki_client_disconnects_total")
+        asyncio.run(run())
+        assert _counter("deepwiki_client_disconnects_total") == disconnects + 1
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Tests for resumable answer streams and their eviction.
+
+Usage: python -m pytest test/test_stream_registry.py
+"""
+
+import asyncio
+import os
+import sys
+import time
+
+import pytest
+import uvicorn
+from aiohttp import ClientSession
+from fastapi import FastAPI
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from api import websocket_wiki
+from api.stream_registry import AnswerStream, StreamRegistry
+
+
+async def _collect(stream, offset=0):
+    return [item async for item in stream.follow(offset)]
+
+
+class TestAnswerStream:
+    """Tests for the ring buffer of one answer"""
+
+    def test_ring_buffer_keeps_recent_text(self):
+        async def run():
+            stream = AnswerStream("s", buffer_chars=8)
+            for text in ["abcd", "efgh", "ijkl"]:
+                await stream.send_text(text)
+            assert (stream.start_offset, stream.end_offset) == (4, 12)
+            assert stream.read(6) == "ghijkl"
+            assert stream.read(12) == ""
+            with pytest.raises(ValueError):
+                stream.read(2)
+
+        asyncio.run(run())
+
+    def test_follow_waits_for_new_text(self):
+        async def run():
+            stream = AnswerStream("s", buffer_chars=100)
+            await stream.send_text("Hello")
+            follower = asyncio.create_task(_collect(stream, 2))
+            await asyncio.sleep(0.01)
+            await stream.send_text(" world")
+            await stream.close()
+            return await follower
+
+        assert asyncio.run(run()) == [("llo", 5), (" world", 11)]
+
+
+class TestStreamRegistry:
+    """Tests for evicting streams by TTL and memory cap"""
+
+    def test_expired_stream_cancels_generation(self):
+        async def run():
+            registry = StreamRegistry(ttl_seconds=60)
+            stream = registry.create()
+            stream.task = asyncio.create_task(asyncio.Event().wait())
+            assert registry.get(stream.stream_id) is stream
+            stream.last_seen = time.monotonic() - 120
+            assert registry.get(stream.stream_id) is None
+            await asyncio.sleep(0)
+            return stream.task
+
+        assert asyncio.run(run()).cancelled()
+
+    def test_idle_registry_evicts_expired_streams(self):
+        async def run():
+            registry = StreamRegistry(ttl_seconds=0.05)
+            stream = registry.create()
+            await stream.send_text("answer")
+            await stream.close()
+            # No stream is created or resumed afterwards
+            eviction = asyncio.create_task(registry.evict_periodically(0.02))
+            await asyncio.sleep(0.2)
+            eviction.cancel()
+            return len(registry)
+
+        assert asyncio.run(run()) == 0
+
+    def test_memory_cap_evicts_finished_streams_first(self):
+        async def run():
+            registry = StreamRegistry(max_total_chars=10)
+            finished, running = registry.create(), registry.create()
+            await running.send_text("123456")
+            await finished.send_text("123456")
+            await finished.close()
+            newest = registry.create()
+            return registry, finished, running, newest
+
+        registry, finished, running, newest = asyncio.run(run())
+        assert len(registry) == 2
+        assert registry.get(finished.stream_id) is None
+        assert registry.get(running.stream_id) is running
+
+
+class TestResumableWebsocket:
+    """Tests for resuming an answer on a new connection"""
+
+    def test_resume_after_disconnect(self, monkeypatch):
+        async def run():
+            release = asyncio.Event()
+
+            async def answer(websocket, request_data):
+                await websocket.send_text("Hello")
+                await release.wait()
+                await websocket.send_text(" world")
+                await websocket.close()
+
+            monkeypatch.setattr(websocket_wiki, "_answer_chat", answer)
+            app = FastAPI()
+            app.add_api_websocket_route("/ws/chat", websocket_wiki.handle_websocket_chat)
+            server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=0, log_level="warning",
+                                                   timeout_graceful_shutdown=1))
+            serving = asyncio.create_task(server.serve())
+            while not server.started:
+                await asyncio.sleep(0.01)
+            url = f"http://127.0.0.1:{server.servers[0].sockets[0].getsockname()[1]}/ws/chat"
+            try:
+                async with ClientSession() as session:
+                    async with session.ws_connect(url) as ws:
+                        await ws.send_json({"repo_url": "https://github.com/o/r", "messages": [], "resumable": True})
+                        stream_id = (await ws.receive_json())["stream_id"]
+                        first = await ws.receive_json()
+                    # Generation goes on while nobody is connected
+                    release.set()
+                    await asyncio.sleep(0.05)
+                    async with session.ws_connect(url) as ws:
+                        await ws.send_json({"resume_stream": stream_id, "offset": first["offset"]})
+                        rest = [await ws.receive_json(), await ws.receive_json()]
+                    async with session.ws_connect(url) as ws:
+                        await ws.send_json({"resume_stream": "missing", "offset": 0})
+                        missing = await ws.receive_json()
+            finally:
+                server.should_exit = True
+                await serving
+            return first, rest, missing
+
+        first, rest, missing = asyncio.run(run())
+        assert first == {"type": "delta", "text": "Hello", "offset": 5}
+        assert rest == [{"type": "delta", "text": " world", "offset": 11}, {"type": "done", "offset": 11}]
+        assert missing["type"] == "error"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,309 @@
+#!/usr/bin/env python3
+"""
+Tests for the provider streaming adapters and the shared answer loop.
+
+Usage: python -m pytest test/test_streaming.py
+"""
+
+import asyncio
+import json
+import os
+import sys
+from types import SimpleNamespace
+
+import pytest
+from ollama import GenerateResponse
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from api.bedrock_client import BedrockClient
+from api.generation import generate_text
+from api.streaming import CoalescingSender, StreamUsage, stream_answer, stream_text
+
+
+class FakeClient:
+    """Model client whose acall streams canned chunks, or fails for prompts listed in errors."""
+
+    def __init__(self, chunks, errors=None):
+        self.chunks = chunks
+        self.errors = errors or {}
+        self.prompts = []
+
+    def convert_inputs_to_api_kwargs(self, input=None, model_kwargs=None, model_type=None):
+        return {"input": input, **(model_kwargs or {})}
+
+    async def acall(self, api_kwargs=None, model_type=None):
+        self.prompts.append(api_kwargs["input"])
+        if api_kwargs["input"] in self.errors:
+            raise self.errors[api_kwargs["input"]]
+
+        async def chunks():
+            for chunk in self.chunks:
+                yield chunk
+        return chunks()
+
+
+class FakeGemini:
+    """Stand-in for google.generativeai.GenerativeModel streaming."""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    async def generate_content_async(self, prompt, stream=False):
+        assert stream
+
+        async def chunks():
+            for chunk in self.chunks:
+                yield chunk
+        return chunks()
+
+
+class GeminiChunk:
+    def __init__(self, text=None, usage_metadata=None):
+        self._text = text
+        self.usage_metadata = usage_metadata
+
+    @property
+    def text(self):
+        if self._text is None:
+            raise ValueError("The response has no text parts")
+        return self._text
+
+
+def _openai_chunk(content=None, usage=None):
+    choices = [SimpleNamespace(delta=SimpleNamespace(content=content))] if usage is None else []
+    return SimpleNamespace(choices=choices, usage=usage)
+
+
+def _collect(provider, model, prompt="Hi", usage=None):
+    async def run():
+        return [text async for text in stream_text(provider, model, {}, prompt, usage)]
+    return asyncio.run(run())
+
+
+def _answer(provider, model, prompt="Hi", fallback_prompt=None):
+    async def run():
+        return [text async for text in stream_answer(provider, model, {}, prompt, fallback_prompt)]
+    return asyncio.run(run())
+
+
+class TestStreamAdapters:
+    """Tests for the per-provider text delta adapters"""
+
+    def test_openai_compatible_chunks(self):
+        chunks = [_openai_chunk("Hel"), _openai_chunk(None), _openai_chunk("lo"),
+                  _openai_chunk(usage=SimpleNamespace(prompt_tokens=12, completion_tokens=2))]
+        for provider in ("openai", "azure", "dashscope"):
+            usage = StreamUsage()
+            assert _collect(provider, FakeClient(chunks), usage=usage) == ["Hel", "lo"]
+            assert (usage.prompt_tokens, usage.completion_tokens) == (12, 2)
+            assert usage.chunks == 2 and usage.characters == 5
+            assert usage.first_token_seconds is not None
+
+    def test_ollama_chunks(self):
+        chunks = [GenerateResponse(model="m", response="<think>", done=False),
+                  GenerateResponse(model="m", response="Hi</think>", done=False),
+                  GenerateResponse(model="m", response="", done=True, prompt_eval_count=7, eval_count=3)]
+        usage = StreamUsage()
+        assert _collect("ollama", FakeClient(chunks), usage=usage) == ["Hi"]
+        assert (usage.prompt_tokens, usage.completion_tokens) == (7, 3)
+
+    def test_openrouter_strings(self):
+        assert _collect("openrouter", FakeClient(["Hel", "lo"])) == ["Hel", "lo"]
+
+    def test_bedrock_events(self):
+        events = [
+            {"type": "message_start", "message": {"role": "assistant"}},
+            {"type": "content_block_delta", "delta": {"type": "text_delta", "text": "Hel"}},
+            {"type": "content_block_delta", "delta": {"type": "text_delta", "text": "lo"}},
+            {"type": "message_stop", "amazon-bedrock-invocationMetrics": {"inputTokenCount": 9, "outputTokenCount": 2}},
+        ]
+        usage = StreamUsage()
+        assert _collect("bedrock", FakeClient(events), usage=usage) == ["Hel", "lo"]
+        assert (usage.prompt_tokens, usage.completion_tokens) == (9, 2)
+        titan = [{"outputText": "Hi", "index": 0}, {"generation": " there"}]
+        assert _collect("bedrock", FakeClient(titan)) == ["Hi", " there"]
+
+    def test_google_chunks(self):
+        metadata = SimpleNamespace(prompt_token_count=4, candidates_token_count=1)
+        usage = StreamUsage()
+        chunks = [GeminiChunk("Hi"), GeminiChunk(None, usage_metadata=metadata)]
+        assert _collect("google", FakeGemini(chunks), usage=usage) == ["Hi"]
+        assert (usage.prompt_tokens, usage.completion_tokens) == (4, 1)
+
+    def test_generate_text_joins_deltas(self):
+        text = asyncio.run(generate_text("openai", FakeClient([_openai_chunk("a"), _openai_chunk("b")]), {}, "Hi"))
+        assert text == "ab"
+
+
+class TestStreamAnswer:
+    """Tests for the shared answer loop"""
+
+    def test_token_limit_retries_with_fallback_prompt(self):
+        client = FakeClient(["short answer"], errors={"full": ValueError("This model's maximum context length is 8192")})
+        assert _answer("openrouter", client, "full", "small") == ["short answer"]
+        assert client.prompts == ["full", "small"]
+
+    def test_failed_fallback_apologizes(self):
+        error = ValueError("too many tokens")
+        client = FakeClient([], errors={"full": error, "small": error})
+        chunks = _answer("openai", client, "full", "small")
+        assert len(chunks) == 1 and "request is too large" in chunks[0]
+
+    def test_other_errors_are_sent_with_a_hint(self):
+        client = FakeClient([], errors={"Hi": ValueError("invalid api key")})
+        chunks = _answer("azure", client, fallback_prompt="small")
+        assert chunks == ["\nError with Azure AI API: invalid api key\n\nPlease check that you have set the "
+                          "AZURE_OPENAI_API_KEY, AZURE_OPENAI_ENDPOINT, and AZURE_OPENAI_VERSION environment "
+                          "variables with valid values."]
+        assert client.prompts == ["Hi"]
+        assert _answer("ollama", FakeClient([], errors={"Hi": ValueError("boom")})) == ["\nError: boom"]
+
+
+class TestCoalescingSender:
+    """Tests for coalescing deltas into websocket frames"""
+
+    def test_deltas_are_coalesced_by_size(self):
+        frames = []
+
+        async def send(text):
+            frames.append(text)
+
+        async def run():
+            async with CoalescingSender(send, flush_chars=10, flush_interval_ms=1000) as sender:
+                for token in ["Hi", " a", "bc", "de", "fg", "hi", "j", "k"]:
+                    await sender.add(token)
+            return sender.frames
+
+        assert asyncio.run(run()) == 3
+        assert frames == ["Hi", " abcdefghi", "jk"]
+
+    def test_buffer_is_flushed_after_the_interval(self):
+        frames = []
+
+        async def send(text):
+            frames.append(text)
+
+        async def run():
+            sender = CoalescingSender(send, flush_chars=1000, flush_interval_ms=20)
+            await sender.add("first")
+            await sender.add("second")
+            await sender.add(" third")
+            assert frames == ["first"]
+            await asyncio.sleep(0.1)
+            assert frames == ["first", "second third"]
+            await sender.flush()
+
+        asyncio.run(run())
+        assert len(frames) == 2
+
+    def test_exit_waits_for_a_timed_send_in_flight(self):
+        frames = []
+
+        async def send(text):
+            if text != "first":
+                await asyncio.sleep(0.1)
+            frames.append(text)
+
+        async def run():
+            async with CoalescingSender(send, flush_chars=1000, flush_interval_ms=10) as sender:
+                await sender.add("first")
+                await sender.add("second")
+                # The timer wakes up and starts its slow send before the stream ends
+                await asyncio.sleep(0.03)
+            frames.append("closed")
+
+        asyncio.run(run())
+        assert frames == ["first", "second", "closed"]
+
+    def test_zero_interval_sends_every_delta(self):
+        frames = []
+
+        async def send(text):
+            frames.append(text)
+
+        async def run():
+            async with CoalescingSender(send, flush_chars=1000, flush_interval_ms=0) as sender:
+                for token in ["a", "b", "c"]:
+                    await sender.add(token)
+
+        asyncio.run(run())
+        assert frames == ["a", "b", "c"]
+
+
+class FakeEventStream:
+    """Stand-in for botocore's EventStream response body."""
+
+    def __init__(self, events):
+        self.events = events
+        self.closed = False
+
+    def __iter__(self):
+        return iter(self.events)
+
+    def close(self):
+        self.closed = True
+
+
+class FakeBedrockRuntime:
+    """Stand-in for the boto3 bedrock-runtime client."""
+
+    def __init__(self, events):
+        self.events = events
+        self.requests = []
+        self.streams = []
+
+    def invoke_model_with_response_stream(self, modelId, body):
+        self.requests.append((modelId, json.loads(body)))
+        self.streams.append(FakeEventStream(self.events))
+        return {"body": self.streams[-1]}
+
+
+class TestBedrockStreaming:
+    """Tests for BedrockClient response streaming"""
+
+    def test_stream_events_are_decoded(self):
+        payloads = [{"type": "content_block_delta", "delta": {"text": "Hi"}},
+                    {"type": "message_stop", "amazon-bedrock-invocationMetrics": {"inputTokenCount": 3, "outputTokenCount": 1}}]
+        client = BedrockClient()
+        client.sync_client = FakeBedrockRuntime([{"chunk": {"bytes": json.dumps(p).encode()}} for p in payloads])
+        model_kwargs = {"model": "anthropic.claude-3-haiku-20240307-v1:0", "stream": True, "temperature": 0.2}
+        usage = StreamUsage()
+
+        async def run():
+            return [text async for text in stream_text("bedrock", client, model_kwargs, "Hello", usage)]
+
+        assert asyncio.run(run()) == ["Hi"]
+        assert usage.completion_tokens == 1
+        model_id, body = client.sync_client.requests[0]
+        assert model_id == "anthropic.claude-3-haiku-20240307-v1:0"
+        assert body["messages"][0]["content"][0]["text"] == "Hello" and body["temperature"] == 0.2
+
+    def test_stream_error_event_raises(self):
+        client = BedrockClient()
+        client.sync_client = FakeBedrockRuntime([{"throttlingException": {"message": "slow down"}}])
+
+        async def run():
+            model_kwargs = {"model": "anthropic.claude-3-haiku-20240307-v1:0", "stream": True}
+            return [text async for text in stream_answer("bedrock", client, model_kwargs, "Hello")]
+
+        chunks = asyncio.run(run())
+        assert len(chunks) == 1 and "AWS Bedrock stream error" in chunks[0]
+        assert client.sync_client.streams[0].closed
+
+    def test_abandoned_stream_is_closed(self):
+        client = BedrockClient()
+        client.sync_client = FakeBedrockRuntime([{"chunk": {"bytes": json.dumps({"n": n}).encode()}} for n in range(3)])
+
+        async def run():
+            events = client._stream_events({"model": "anthropic.claude-3-haiku-20240307-v1:0", "input": "Hello"})
+            first = await events.__anext__()
+            await events.aclose()
+            return first
+
+        assert asyncio.run(run()) == {"n": 0}
+        assert client.sync_client.streams[0].closed
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,175 @@
+#!/usr/bin/env python3
+"""
+Tests for the map-reduce STRIDE analysis over repository partitions.
+
+Usage: python -m pytest test/test_stride_mapreduce.py
+"""
+
+import asyncio
+import json
+import os
+import sys
+
+import pytest
+from adalflow.core.types import Document
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from api import stride_mapreduce
+from api.stride_mapreduce import build_threat_model, merge_fragments, parse_json_object, partition_documents
+from api.summary_index import SUMMARY_NODE_TYPE
+
+PROMPT_VARS = {"repo_type": "github", "repo_url": "https://github.com/o/r", "repo_name": "r", "language_name": "English"}
+
+
+def _documents(overrides=None):
+    files = {
+        "api/auth/login.py": "def login(user, password): check(password)",
+        "api/auth/tokens.py": "def issue_token(user): return sign(user)",
+        "api/db.py": "def query(sql): return conn.execute(sql)",
+        "web/app.js": "fetch('/api/login')",
+        "README.md": "# Service",
+    }
+    files.update(overrides or {})
+    docs = [Document(text=text, meta_data={"file_path": path}, order=0) for path, text in files.items()]
+    docs.append(Document(text="Directory: api", meta_data={"file_path": "api", "type": SUMMARY_NODE_TYPE}))
+    return docs
+
+
+class FakeModel:
+    """Answers partition prompts with one component and one threat each, and the reduce prompt with a scope."""
+
+    def __init__(self, fail_partition=None):
+        self.partitions = []
+        self.fail_partition = fail_partition
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def generate_text(self, provider, client, model_kwargs, prompt):
+        if "Complete the threat model" in prompt:
+            return json.dumps({
+                "scope": {"title": "r", "description": "Login service", "business_criticality": "high",
+                          "data_sensitivity": ["cred"], "exposure": "external", "tier": "important"},
+                "description": "A login service.",
+                "trust_boundaries": [{"trust_zone_a": "internet", "trust_zone_b": "backend"}],
+            })
+        name = prompt.split("<query>Extract the DFD elements and STRIDE threats of ")[1].split(".</query>")[0]
+        self.partitions.append(name)
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.02)
+        finally:
+            self.in_flight -= 1
+        if name == self.fail_partition:
+            return "I cannot do that."
+        slug = name.replace("/", "-").replace(".", "root")
+        fragment = {
+            "trust_zones": [{"symbolic_name": "backend", "title": "Backend", "description": ""}],
+            "components": [{"symbolic_name": slug, "title": name, "description": "", "trust_zone": "backend"}],
+            "threats": [{"symbolic_name": "credential-theft", "title": "[Spoofing] Credential theft",
+                         "components_affected": [slug]}],
+        }
+        return "```json\n" + json.dumps(fragment) + "\n```"
+
+
+class TestPartitioning:
+    """Tests for grouping files into partitions"""
+
+    def test_files_are_grouped_by_directory(self):
+        partitions = partition_documents(_documents(), max_depth=2)
+        assert [(p.name, p.files) for p in partitions] == [
+            (".", ["README.md"]),
+            ("api", ["api/db.py"]),
+            ("api/auth", ["api/auth/login.py", "api/auth/tokens.py"]),
+            ("web", ["web/app.js"]),
+        ]
+        assert "## File Path: api/auth/tokens.py" in partitions[2].text
+
+    def test_large_directories_are_split(self):
+        partitions = partition_documents(_documents(), max_depth=2, max_tokens=20)
+        assert [p.name for p in partitions if p.name.startswith("api/auth")] == ["api/auth (part 1)", "api/auth (part 2)"]
+
+
+class TestMerging:
+    """Tests for reducing partition fragments"""
+
+    def test_elements_are_merged_by_symbolic_name(self):
+        merged = merge_fragments([
+            {"threats": [{"symbolic_name": "t", "components_affected": ["a"]}],
+             "trust_boundaries": [{"trust_zone_a": "x", "trust_zone_b": "y"}]},
+            {"threats": [{"symbolic_name": "t", "components_affected": ["b", "a"]}],
+             "trust_boundaries": [{"trust_zone_a": "y", "trust_zone_b": "x"}]},
+        ])
+        assert merged["threats"] == [{"symbolic_name": "t", "components_affected": ["a", "b"]}]
+        assert len(merged["trust_boundaries"]) == 1
+
+    def test_parse_json_object(self):
+        assert parse_json_object('Here it is:\n```json\n{"a": 1}\n```') == {"a": 1}
+        with pytest.raises(ValueError):
+            parse_json_object("no json here")
+
+
+class TestBuildThreatModel:
+    """Tests for the concurrent map step, its cache and the reduced output"""
+
+    def _run(self, monkeypatch, fake, documents, cache_path):
+        monkeypatch.setattr(stride_mapreduce, "generate_text", fake.generate_text)
+        monkeypatch.setitem(stride_mapreduce.configs, "stride_mapreduce", {"max_concurrency": 2, "max_depth": 2})
+        return asyncio.run(build_threat_model(documents, PROMPT_VARS, "openai", "gpt-4o", object(), {}, cache_path))
+
+    def test_threat_model_is_reduced_from_all_partitions(self, monkeypatch, tmp_path):
+        fake = FakeModel()
+        model = self._run(monkeypatch, fake, _documents(), str(tmp_path / "repo.stride.json"))
+        assert sorted(fake.partitions) == [".", "api", "api/auth", "web"]
+        assert fake.max_in_flight == 2
+        assert model["$schema"].endswith("threat-model.schema.json")
+        assert model["scope"]["business_criticality"] == "high"
+        assert len(model["components"]) == 4
+        assert len(model["trust_zones"]) == 1
+        assert model["threats"][0]["components_affected"] == ["root", "api", "api-auth", "web"]
+        assert model["trust_boundaries"] == [{"trust_zone_a": "internet", "trust_zone_b": "backend"}]
+        assert model["data_flows"] == [] and model["data_sets"] == []
+
+    def test_partitions_fit_small_context_windows(self, monkeypatch, tmp_path):
+        fake = FakeModel()
+        monkeypatch.setattr(stride_mapreduce, "generate_text", fake.generate_text)
+        monkeypatch.setitem(stride_mapreduce.configs, "stride_mapreduce", {"max_partition_tokens": 10**6})
+        big = {f"lib/m{i}.py": "x = 1\n" * 1500 for i in range(3)}
+        asyncio.run(build_threat_model(_documents(big), PROMPT_VARS, "ollama", "llama3:8b", object(), {}, None))
+        # Each file alone exceeds the model's budget, so each gets its own partition
+        lib_partitions = sorted(name for name in fake.partitions if name.startswith("lib"))
+        assert lib_partitions == [f"lib (part {i})" for i in (1, 2, 3)]
+
+    def test_only_changed_partitions_are_analysed_again(self, monkeypatch, tmp_path):
+        cache_path = str(tmp_path / "repo.stride.json")
+        self._run(monkeypatch, FakeModel(fail_partition="web"), _documents(), cache_path)
+
+        fake = FakeModel()
+        changed = _documents({"api/auth/tokens.py": "def issue_token(user): return sign(user, ttl=60)"})
+        model = self._run(monkeypatch, fake, changed, cache_path)
+        # The changed partition, and the one that failed before
+        assert sorted(fake.partitions) == ["api/auth", "web"]
+        assert len(model["components"]) == 4
+
+    def test_progress_is_reported_per_partition(self, monkeypatch):
+        fake = FakeModel(fail_partition="web")
+        monkeypatch.setattr(stride_mapreduce, "generate_text", fake.generate_text)
+        monkeypatch.setitem(stride_mapreduce.configs, "stride_mapreduce", {"max_concurrency": 2, "max_depth": 2})
+        lines = []
+
+        async def on_progress(text):
+            lines.append(text)
+
+        asyncio.run(build_threat_model(_documents(), PROMPT_VARS, "openai", "gpt-4o", object(), {}, None,
+                                       on_progress=on_progress))
+        assert lines[0] == "Analysing 4 of 4 partitions, 0 unchanged since the last analysis\n"
+        # One line per partition as it finishes, in completion order
+        partition_lines = sorted(line.split(" (")[0] for line in lines[1:5])
+        assert partition_lines == ["- . analysed", "- api analysed", "- api/auth analysed", "- web could not be analysed"]
+        assert [line.split(" (")[1] for line in lines[1:5]] == ["1/4)\n", "2/4)\n", "3/4)\n", "4/4)\n"]
+        assert lines[-1] == "Merging the partitions into one threat model\n"
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Tests for the hierarchical directory summary index.
+
+Usage: python -m pytest test/test_summary_index.py
+"""
+
+import asyncio
+import os
+import sys
+
+import pytest
+
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from adalflow.core.types import Document
+
+from api import generation
+from api.summary_index import (
+    build_directory_summaries,
+    build_summary_prompt,
+    collect_directories,
+    load_summary_nodes,
+    root_summary,
+    save_summary_nodes,
+    summary_nodes,
+)
+
+FILES = ["README.md", "api/server.py", "api/auth/tokens.py", "api/auth/oauth/google.py", "web/app.ts"]
+
+
+def _documents():
+    docs = []
+    for path in FILES:
+        for order in range(2):
+            docs.append(Document(text=f"{path} part {order} ", meta_data={"file_path": path}, order=order))
+    return docs
+
+
+class TestSummaryIndex:
+    """Tests for directory grouping, bottom-up summarization and the sidecar file"""
+
+    def test_collect_directories(self):
+        directories = collect_directories(_documents(), max_depth=2)
+        assert set(directories) == {".", "api", "api/auth", "web"}
+        # Files below the depth limit roll up into their deepest summarized ancestor
+        assert set(directories["api/auth"]["files"]) == {"api/auth/tokens.py", "api/auth/oauth/google.py"}
+        assert directories["."]["children"] == {"api", "web"}
+        assert directories["api"]["files"]["api/server.py"] == "api/server.py part 0 "
+
+    def test_prompt_respects_budget(self):
+        files = {f"src/file{i}.py": "word " * 2000 for i in range(50)}
+        prompt = build_summary_prompt("repo", "src", files, {"src/sub": "Sub summary"}, 1000, "google")
+        assert "Sub summary" in prompt
+        assert len(prompt) < 2000 * 5
+
+    def test_bottom_up_with_bounded_concurrency(self, monkeypatch):
+        in_flight = {"now": 0, "max": 0}
+
+        async def fake_generate_text(provider, model, model_kwargs, prompt):
+            in_flight["now"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["now"])
+            await asyncio.sleep(0.01)
+            in_flight["now"] -= 1
+            directory = prompt.rsplit("Summarize the directory ", 1)[1].split(".</query>")[0]
+            return f"summary of {directory or '.'} ({prompt.count('summary of')} children)"
+
+        monkeypatch.setattr(generation, "get_model_client", lambda *args: (None, {}))
+        monkeypatch.setattr(generation, "generate_text", fake_generate_text)
+
+        summaries = asyncio.run(build_directory_summaries(_documents(), "repo", "google", max_concurrency=2, max_depth=3))
+        assert set(summaries) == {".", "api", "api/auth", "api/auth/oauth", "web"}
+        assert in_flight["max"] <= 2
+        # The root prompt saw the summaries of its sub-directories
+        assert "(2 children)" in summaries["."]
+
+    def test_sidecar_round_trip(self, tmp_path):
+        nodes = summary_nodes({".": "Whole repo", "api": "API layer"})
+        for i, node in enumerate(nodes):
+            node.vector = [float(i), 1.0]
+        path = str(tmp_path / "repo.summaries.json")
+        save_summary_nodes(path, "abc123", nodes)
+
+        loaded = load_summary_nodes(path, "abc123")
+        assert [doc.meta_data["file_path"] for doc in loaded] == [".", "api"]
+        assert loaded[1].vector == [1.0, 1.0]
+        assert root_summary(loaded) == "Whole repo"
+        assert load_summary_nodes(path, "def456") is None
+        assert load_summary_nodes(str(tmp_path / "missing.json"), "abc123") is None
+
+
+if __name__ == "__main__":
+    pytest.main([__file__, "-v"])